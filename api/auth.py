@@ -1,41 +1,72 @@
 import os
-import json
-import firebase_admin
-from firebase_admin import credentials, auth
+import time
+import hashlib
+import threading
+from collections import OrderedDict
 from dotenv import load_dotenv
+from .firebase_client import get_app
+from .logging_config import get_logger
+from .telemetry import timer
+
+logger = get_logger(__name__)
 
 # Load environment variables
 load_dotenv()
 
-# Initialize Firebase Admin SDK safely in serverless environment
-firebase_app = None
+# Verified token cache: sha256(token) -> (user_data, exp)
+TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", "2048"))
+_token_cache = OrderedDict()
+_token_cache_lock = threading.Lock()
 
-def initialize_firebase():
-    global firebase_app
-    if not firebase_admin._apps:
-        try:
-            # Parse the Firebase service account JSON
-            firebase_credentials_json = os.getenv("FIREBASE_SERVICE_ACCOUNT")
-            firebase_credentials_dict = json.loads(firebase_credentials_json)
-            cred = credentials.Certificate(firebase_credentials_dict)
-            
-            # Initialize the Firebase app
-            firebase_app = firebase_admin.initialize_app(cred)
-        except Exception as e:
-            print(f"Firebase initialization error: {e}")
+def _token_cache_key(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+def _get_cached_token(key):
+    with _token_cache_lock:
+        entry = _token_cache.get(key)
+        if entry is None:
             return None
-    return firebase_admin.get_app()
+        user_data, exp = entry
+        if exp <= time.time():
+            del _token_cache[key]
+            return None
+        _token_cache.move_to_end(key)
+        return dict(user_data)
+
+def _cache_token(key, user_data):
+    exp = user_data.get('exp')
+    if not exp or exp <= time.time():
+        return
+    with _token_cache_lock:
+        _token_cache[key] = (dict(user_data), exp)
+        _token_cache.move_to_end(key)
+        while len(_token_cache) > TOKEN_CACHE_MAX_ENTRIES:
+            _token_cache.popitem(last=False)
 
 def verify_token(token):
-    """Verify a Firebase ID token and return user data if valid"""
+    """Verify a Firebase ID token and return user data if valid.
+
+    Verified claims are cached by token hash until the token's own exp,
+    so repeated calls from one session skip signature verification.
+    """
+    if not token:
+        return None
+    
+    cache_key = _token_cache_key(token)
+    cached_user_data = _get_cached_token(cache_key)
+    if cached_user_data:
+        return cached_user_data
+    
     try:
         # Ensure Firebase is initialized
-        app = initialize_firebase()
+        app = get_app()
         if not app:
             return None
             
         # Verify the Firebase ID token
-        decoded_token = auth.verify_id_token(token)
+        from firebase_admin import auth
+        with timer('auth_verify_duration_seconds'):
+            decoded_token = auth.verify_id_token(token)
         
         # Create a user data object with expected fields
         user_data = {
@@ -44,9 +75,10 @@ def verify_token(token):
             'exp': decoded_token.get('exp')
         }
         
+        _cache_token(cache_key, user_data)
         return user_data
     except Exception as e:
-        print(f"Token verification error: {e}")
+        logger.error("Token verification error: %s", e)
         return None
     
 # JWT Secret Key from environment variable (secure)
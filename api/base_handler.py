@@ -0,0 +1,204 @@
+from http.server import BaseHTTPRequestHandler
+import json
+import hashlib
+from urllib.parse import parse_qs, urlparse
+from .auth import verify_token
+from .json_stream import write_json
+from .logging_config import get_logger, start_request
+from .telemetry import timer
+
+logger = get_logger(__name__)
+
+class HttpError(Exception):
+    """Raised from a handler method to answer with an error status and JSON body"""
+
+    def __init__(self, status, error, **fields):
+        super().__init__(error)
+        self.status = status
+        self.body = {'error': error, **fields}
+
+def etag_for(body):
+    """Strong ETag for a response body"""
+    return '"%s"' % hashlib.sha1(body).hexdigest()
+
+def etag_matches(if_none_match, etag):
+    """True if an If-None-Match header value matches the ETag"""
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(',')]
+    return '*' in candidates or etag in candidates or f'W/{etag}' in candidates
+
+def private_cache_control(max_age):
+    """Cache-Control for per-user responses; max_age 0 means always revalidate"""
+    if max_age <= 0:
+        return 'private, no-cache'
+    return f'private, max-age={max_age}'
+
+class JsonHandler(BaseHTTPRequestHandler):
+    """Base class for the JSON API handlers.
+
+    Subclasses implement get()/post(), or map ?action= values to method names
+    in `actions`, and return the response payload. The request is parsed once
+    (query, Bearer token, body), the response is written with its real status
+    and a Content-Length, and HTTP/1.1 keeps the connection open.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    route = None                  # Metrics label, e.g. '/api/dashboard'
+    methods = ('GET',)            # Methods served, advertised to CORS preflights
+    allow_headers = 'Content-Type, Authorization'
+    require_auth = True           # Verify the Bearer token before dispatching
+    actions = {}                  # POST ?action= value -> method name
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_OPTIONS(self):
+        # Handle preflight requests for CORS
+        self.send_response(204)
+        self.send_cors_headers()
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def send_cors_headers(self):
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', ', '.join(self.methods + ('OPTIONS',)))
+        self.send_header('Access-Control-Allow-Headers', self.allow_headers)
+
+    def _handle(self, method):
+        start_request()
+        self.user = None
+        self.status = None
+        self._body = None
+        self.query = parse_qs(urlparse(self.path).query)
+
+        with timer('http_request_duration_seconds', route=self.route, method=method) as t:
+            try:
+                if method not in self.methods:
+                    raise HttpError(405, 'Method not allowed')
+                if self.require_auth:
+                    self.user = self.authenticate()
+                result = self.dispatch(method)
+                if self.status is None:
+                    self.send_json(200, result)
+            except HttpError as e:
+                self._send_error(e.status, e.body)
+            except Exception as e:
+                logger.exception("Unhandled error in %s %s: %s", method, self.route, e)
+                self._send_error(500, {'error': str(e)})
+            t.labels['status'] = self.status
+
+        # Leave no unread body on a kept-alive connection
+        self.raw_body()
+
+    def _send_error(self, status, body):
+        if self.status is None:
+            self.send_json(status, body)
+        else:
+            # The response already started, so the only safe signal is to drop the connection
+            self.close_connection = True
+
+    def dispatch(self, method):
+        """Call the method for this request and return its payload"""
+        if method == 'POST' and self.actions:
+            name = self.actions.get(self.query_param('action'))
+            if not name:
+                raise HttpError(400, 'Invalid action')
+            return getattr(self, name)()
+        return getattr(self, method.lower())()
+
+    def authenticate(self):
+        """Verify the Bearer token and return the user data"""
+        auth_header = self.headers.get('Authorization', '')
+        token = auth_header[7:] if auth_header.startswith('Bearer ') else None
+        if not token:
+            raise HttpError(401, 'Authorization token required')
+
+        user_data = verify_token(token)
+        if not user_data:
+            raise HttpError(401, 'Invalid or expired token')
+        return user_data
+
+    def query_param(self, name, default=None):
+        return self.query.get(name, [default])[0]
+
+    def raw_body(self):
+        """Read the request body once and return it as bytes"""
+        if self._body is None:
+            content_length = int(self.headers.get('Content-Length') or 0)
+            self._body = self.rfile.read(content_length) if content_length > 0 else b''
+        return self._body
+
+    def json_body(self):
+        """Parse the request body as a JSON object"""
+        body = self.raw_body()
+        if not body:
+            return {}
+        try:
+            data = json.loads(body.decode('utf-8'))
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            raise HttpError(400, 'Invalid JSON payload')
+        if not isinstance(data, dict):
+            raise HttpError(400, 'Invalid JSON payload')
+        return data
+
+    def send_body(self, status, body, content_type='application/json', headers=None):
+        """Send a complete response with its Content-Length"""
+        self.status = status
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_cors_headers()
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, status, payload, headers=None):
+        self.send_body(status, json.dumps(payload).encode(), headers=headers)
+
+    def send_cacheable(self, body, cache_control, etag=None):
+        """Send a 200 with an ETag, or an empty 304 if the client already has it.
+
+        The ETag defaults to a hash of the body. No Vary: Authorization, since
+        ID tokens rotate hourly and would defeat revalidation; the private
+        Cache-Control keeps responses out of shared caches.
+        """
+        etag = etag or etag_for(body)
+        if not self.send_not_modified(etag, cache_control):
+            self.send_body(200, body, headers={'ETag': etag, 'Cache-Control': cache_control})
+
+    def send_not_modified(self, etag, cache_control):
+        """Send an empty 304 and return True if the client's copy matches etag"""
+        if not etag_matches(self.headers.get('If-None-Match'), etag):
+            return False
+
+        self.status = 304
+        self.send_response(304)
+        self.send_cors_headers()
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', cache_control)
+        self.end_headers()
+        return True
+
+    def send_json_stream(self, status, payload):
+        """Stream a JSON payload that may contain generators.
+
+        HTTP/1.1 clients get a chunked response on the kept-alive connection;
+        HTTP/1.0 clients get a body delimited by closing the connection.
+        """
+        chunked = self.request_version == 'HTTP/1.1'
+        self.status = status
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_cors_headers()
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        else:
+            self.close_connection = True
+        self.end_headers()
+        write_json(self.wfile, payload, chunked=chunked)
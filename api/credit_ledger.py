@@ -0,0 +1,69 @@
+from .firebase_client import get_db
+from .logging_config import get_logger
+from .telemetry import firestore_op
+
+logger = get_logger(__name__)
+
+# Append-only audit trail of credit changes: users/{uid}/credit_events/{id}
+CREDIT_EVENTS_COLLECTION = 'credit_events'
+
+def _credit_event(kind, amount, reason, source_id):
+    from firebase_admin import firestore
+    return {
+        'kind': kind,
+        'amount': amount,
+        'reason': reason,
+        'source_id': source_id,
+        'created_at': firestore.SERVER_TIMESTAMP
+    }
+
+def _commit_credit_change(user_id, updates, event, source_id, batch=None):
+    """Apply user updates and append a credit event in one atomic batch.
+
+    When source_id is given it is used as the event document id and the
+    event is written with create(), so the whole batch is rejected if that
+    source was already applied. Returns True if the change was applied.
+    With a caller's batch the writes are only staged and the caller commits.
+    """
+    from google.api_core.exceptions import AlreadyExists
+
+    db = get_db()
+    if not db or not user_id:
+        return False
+
+    user_ref = db.collection('users').document(user_id)
+    events_ref = user_ref.collection(CREDIT_EVENTS_COLLECTION)
+    event_ref = events_ref.document(source_id) if source_id else events_ref.document()
+
+    if batch is not None:
+        batch.update(user_ref, updates)
+        batch.create(event_ref, event)
+        return True
+
+    batch = db.batch()
+    batch.update(user_ref, updates)
+    batch.create(event_ref, event)
+    try:
+        with firestore_op(CREDIT_EVENTS_COLLECTION, 'commit'):
+            batch.commit()
+    except AlreadyExists:
+        logger.warning("Credit change %s already applied for user %s", source_id, user_id)
+        return False
+    return True
+
+def add_credits(user_id, amount, reason, source_id=None, batch=None):
+    """Atomically add purchased credits to a user's total"""
+    from firebase_admin import firestore
+    updates = {
+        'creditUsage.total': firestore.Increment(amount)
+    }
+    event = _credit_event('purchase', amount, reason, source_id)
+    return _commit_credit_change(user_id, updates, event, source_id, batch)
+
+def reset_credits(user_id, total, reason, source_id=None, extra_updates=None, batch=None):
+    """Reset a user's credits to a plan allocation, optionally with other field updates"""
+    updates = dict(extra_updates or {})
+    updates['creditUsage.used'] = 0
+    updates['creditUsage.total'] = total
+    event = _credit_event('reset', total, reason, source_id)
+    return _commit_credit_change(user_id, updates, event, source_id, batch)
@@ -0,0 +1,134 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from .firebase_client import get_db
+from .logging_config import get_logger
+from .telemetry import firestore_op
+
+logger = get_logger(__name__)
+
+# Point-lookup mapping of Paddle customers to users: paddle_customers/{customer_id} -> {uid}
+CUSTOMER_MAP_COLLECTION = 'paddle_customers'
+
+# In-process cache of resolved mappings. Unknown customers are cached briefly
+# so a burst of events for them does not repeat the full lookup chain.
+CUSTOMER_MAP_MAX_ENTRIES = int(os.getenv("CUSTOMER_MAP_MAX_ENTRIES", "4096"))
+CUSTOMER_MAP_TTL = int(os.getenv("CUSTOMER_MAP_TTL", "3600"))
+CUSTOMER_MAP_NEGATIVE_TTL = int(os.getenv("CUSTOMER_MAP_NEGATIVE_TTL", "300"))
+
+# Cached value for customers known to have no user
+UNKNOWN_CUSTOMER = ''
+
+_entries = OrderedDict()
+_lock = threading.Lock()
+
+def get_cached_user_id(customer_id):
+    """Return the cached uid, UNKNOWN_CUSTOMER for a cached miss, or None if not cached"""
+    with _lock:
+        entry = _entries.get(customer_id)
+        if entry is None:
+            return None
+        user_id, expires_at = entry
+        if expires_at <= time.monotonic():
+            del _entries[customer_id]
+            return None
+        _entries.move_to_end(customer_id)
+        return user_id
+
+def _cache(customer_id, user_id, ttl):
+    with _lock:
+        _entries[customer_id] = (user_id, time.monotonic() + ttl)
+        _entries.move_to_end(customer_id)
+        while len(_entries) > CUSTOMER_MAP_MAX_ENTRIES:
+            _entries.popitem(last=False)
+
+def remember_unknown_customer(customer_id):
+    """Negative-cache a customer that could not be resolved to a user"""
+    if customer_id:
+        _cache(customer_id, UNKNOWN_CUSTOMER, CUSTOMER_MAP_NEGATIVE_TTL)
+
+def get_mapped_user_id(customer_id):
+    """Look up the uid mapped to a Paddle customer, or None if there is no mapping"""
+    if not customer_id:
+        return None
+
+    db = get_db()
+    if not db:
+        return None
+
+    try:
+        with firestore_op(CUSTOMER_MAP_COLLECTION, 'get'):
+            doc = db.collection(CUSTOMER_MAP_COLLECTION).document(customer_id).get()
+    except Exception as e:
+        logger.error("Customer map read error for %s: %s", customer_id, e)
+        return None
+
+    if not doc.exists:
+        return None
+
+    user_id = doc.to_dict().get('uid')
+    if user_id:
+        _cache(customer_id, user_id, CUSTOMER_MAP_TTL)
+    return user_id
+
+def save_customer_mapping(customer_id, user_id):
+    """Store the customer -> uid mapping, durably and in the local cache"""
+    if not customer_id or not user_id:
+        return
+
+    if get_cached_user_id(customer_id) == user_id:
+        return
+    _cache(customer_id, user_id, CUSTOMER_MAP_TTL)
+
+    db = get_db()
+    if not db:
+        return
+
+    try:
+        from firebase_admin import firestore
+        db.collection(CUSTOMER_MAP_COLLECTION).document(customer_id).set({
+            'uid': user_id,
+            'updated_at': firestore.SERVER_TIMESTAMP
+        })
+    except Exception as e:
+        logger.error("Customer map write error for %s: %s", customer_id, e)
+
+def backfill_customer_map(batch_size=400):
+    """Create mappings for every user that already has a paddleCustomerId"""
+    db = get_db()
+    if not db:
+        logger.warning("Firebase is not available")
+        return 0
+
+    from firebase_admin import firestore
+    query = db.collection('users').where('paddleCustomerId', '>', '')
+
+    written = 0
+    batch = db.batch()
+    pending = 0
+    for user_doc in query.stream():
+        customer_id = user_doc.to_dict().get('paddleCustomerId')
+        if not customer_id:
+            continue
+        batch.set(db.collection(CUSTOMER_MAP_COLLECTION).document(customer_id), {
+            'uid': user_doc.id,
+            'updated_at': firestore.SERVER_TIMESTAMP
+        })
+        pending += 1
+        if pending >= batch_size:
+            batch.commit()
+            written += pending
+            batch = db.batch()
+            pending = 0
+
+    if pending:
+        batch.commit()
+        written += pending
+
+    logger.info("Backfilled %s Paddle customer mappings", written)
+    return written
+
+if __name__ == '__main__':
+    # Backfill mappings for existing users: python -m api.customer_map
+    backfill_customer_map()
@@ -0,0 +1,130 @@
+import os
+import json
+import time
+from .firebase_client import get_db, initialize_firebase
+from .logging_config import get_logger
+from .telemetry import firestore_op
+from .paddle_api import update_customer_name
+
+logger = get_logger(__name__)
+
+# Customers whose Paddle name is due for a sync: paddle_customer_name_sync/{customer_id} -> {uid, requested_at}.
+# One document per customer, so repeated requests coalesce into a single sync.
+PENDING_COLLECTION = 'paddle_customer_name_sync'
+
+# Name last sent to Paddle, stored on the user document
+SYNCED_NAME_FIELD = 'paddleCustomerName'
+
+# Pending customers handled per run; each one is a Paddle PATCH
+NAME_SYNC_BATCH_SIZE = int(os.getenv("NAME_SYNC_BATCH_SIZE", "100"))
+
+# Results are committed after this many customers, so a run that times out
+# loses at most one chunk and re-sends only those names
+NAME_SYNC_COMMIT_EVERY = 10
+
+def display_name(user_data):
+    """The name a user chose in the app, if any"""
+    return user_data.get('name') or user_data.get('displayName') or user_data.get('display_name')
+
+def name_needs_sync(customer_id, user_data):
+    """True if the user's display name differs from the one last synced to this customer"""
+    name = display_name(user_data)
+    if not name:
+        return False
+    synced_name = user_data.get(SYNCED_NAME_FIELD) if user_data.get('paddleCustomerId') == customer_id else None
+    return name != synced_name
+
+def request_name_sync(customer_id, user_id, user_data, batch=None):
+    """Mark a customer for a deferred name sync if the display name changed.
+
+    Returns True if a sync was requested. With a batch the request is only staged.
+    """
+    from firebase_admin import firestore
+    user_data = user_data or {}
+    if not customer_id or not user_id or not name_needs_sync(customer_id, user_data):
+        return False
+
+    db = get_db()
+    if not db:
+        return False
+
+    pending_ref = db.collection(PENDING_COLLECTION).document(customer_id)
+    request = {
+        'uid': user_id,
+        'attempts': 0,
+        'requested_at': firestore.SERVER_TIMESTAMP
+    }
+    if batch is not None:
+        batch.set(pending_ref, request)
+    else:
+        pending_ref.set(request)
+    return True
+
+def sync_pending_names(limit=NAME_SYNC_BATCH_SIZE, deadline=None):
+    """Send changed display names to Paddle for up to limit pending customers.
+
+    User documents are read with one get_all and the results are committed
+    every NAME_SYNC_COMMIT_EVERY customers. No new customer is started once
+    the monotonic deadline passes. Failed syncs stay pending and move to
+    the back of the line.
+    """
+    from firebase_admin import firestore
+    stats = {'synced': 0, 'skipped': 0, 'failed': 0}
+    db = get_db()
+    if not db:
+        return stats
+
+    with firestore_op(PENDING_COLLECTION, 'query'):
+        pending = list(db.collection(PENDING_COLLECTION).order_by('requested_at').limit(limit).stream())
+    if not pending:
+        return stats
+
+    users_ref = db.collection('users')
+    requests = [(doc, (doc.to_dict() or {}).get('uid')) for doc in pending]
+    user_refs = [users_ref.document(user_id) for _, user_id in requests if user_id]
+    with firestore_op('users', 'get_all'):
+        users = {snapshot.id: snapshot.to_dict() for snapshot in db.get_all(user_refs) if snapshot.exists}
+
+    batch = db.batch()
+    staged = 0
+    for doc, user_id in requests:
+        if deadline is not None and time.monotonic() >= deadline:
+            logger.info("Customer name sync stopped at its deadline")
+            break
+
+        customer_id = doc.id
+        user_data = users.get(user_id)
+        if not user_data or not name_needs_sync(customer_id, user_data):
+            batch.delete(doc.reference)
+            stats['skipped'] += 1
+        else:
+            name = display_name(user_data)
+            if update_customer_name(customer_id, name):
+                batch.update(users_ref.document(user_id), {SYNCED_NAME_FIELD: name})
+                batch.delete(doc.reference)
+                stats['synced'] += 1
+            else:
+                batch.update(doc.reference, {
+                    'attempts': firestore.Increment(1),
+                    'requested_at': firestore.SERVER_TIMESTAMP
+                })
+                stats['failed'] += 1
+
+        staged += 1
+        if staged >= NAME_SYNC_COMMIT_EVERY:
+            with firestore_op(PENDING_COLLECTION, 'commit'):
+                batch.commit()
+            batch = db.batch()
+            staged = 0
+
+    if staged:
+        with firestore_op(PENDING_COLLECTION, 'commit'):
+            batch.commit()
+
+    logger.info("Customer name sync finished: %s", stats)
+    return stats
+
+if __name__ == '__main__':
+    # Run one sync from the command line: python -m api.customer_name_sync
+    if initialize_firebase():
+        print(json.dumps(sync_pending_names()))
@@ -1,50 +1,41 @@
-from http.server import BaseHTTPRequestHandler
-from urllib.parse import parse_qs
 import json
 import os
+import time
+import logging
 import datetime
-from .auth import verify_token
+from concurrent.futures import ThreadPoolExecutor
+from .dashboard_cache import get_cached_dashboard, cache_dashboard
+from .firebase_client import initialize_firebase, get_db
+from .customer_map import save_customer_mapping
+from .license_store import save_license
 from .paddle_api import (
     get_customer_by_email,
     get_subscriptions,
     get_license_keys,
     get_subscription_details
 )
-import firebase_admin
-from firebase_admin import credentials, firestore
+from .base_handler import JsonHandler, HttpError, etag_for, private_cache_control
+from .logging_config import get_logger
+from .telemetry import firestore_op
 
-# Initialize Firebase
-firebase_initialized = False
-db = None
+logger = get_logger(__name__)
+
+# Browser cache lifetime for the dashboard; 0 revalidates every load (cheap 304s)
+DASHBOARD_MAX_AGE = int(os.getenv("DASHBOARD_MAX_AGE", "0"))
+
+# Upper bound on concurrent Paddle calls made for a single dashboard request (1-32)
+PADDLE_FANOUT_WORKERS = max(1, min(int(os.getenv("PADDLE_FANOUT_WORKERS", "8")), 32))
+
+# Dashboards built from the Paddle API also depend on Paddle state, so their
+# ETag changes at least this often even if the user document does not
+DASHBOARD_PADDLE_REVALIDATE = int(os.getenv("DASHBOARD_PADDLE_REVALIDATE", "60"))
+
+# Bump when the shape of the dashboard response changes
+DASHBOARD_BODY_VERSION = 1
 
-def initialize_firebase():
-    global firebase_initialized, db
-    if not firebase_initialized:
-        try:
-            # Parse the Firebase service account JSON
-            firebase_credentials_json = os.environ.get("FIREBASE_SERVICE_ACCOUNT")
-            if not firebase_credentials_json:
-                print("Firebase credentials not found in environment variables")
-                return False
-                
-            firebase_credentials_dict = json.loads(firebase_credentials_json)
-            cred = credentials.Certificate(firebase_credentials_dict)
-            
-            # Initialize the Firebase app
-            if not firebase_admin._apps:
-                firebase_admin.initialize_app(cred)
-            
-            db = firestore.client()
-            firebase_initialized = True
-            print("Firebase initialized successfully")
-            return True
-        except Exception as e:
-            print(f"Firebase initialization error: {e}")
-            return False
-    return True
 def convert_timestamps_to_strings(data):
     """Convert Firestore timestamp objects to ISO strings for JSON serialization"""
-    if isinstance(data, firebase_admin.firestore.DocumentSnapshot):
+    if hasattr(data, 'to_dict') and hasattr(data, 'exists'):
         # Convert DocumentSnapshot to dict first
         data = data.to_dict()
         
@@ -59,96 +50,133 @@ def convert_timestamps_to_strings(data):
         return [convert_timestamps_to_strings(item) for item in data]
     
     return data
-class handler(BaseHTTPRequestHandler):
-    def do_GET(self):
-        # Set CORS headers for browser security
-        self.send_response(200)
-        self.send_header('Content-Type', 'application/json')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
-        self.end_headers()
-        
-        # Get authorization token from headers
-        auth_header = self.headers.get('Authorization')
-        token = None
-        
-        if auth_header and auth_header.startswith('Bearer '):
-            token = auth_header[7:]
-        
-        if not token:
-            self.wfile.write(json.dumps({
-                'error': 'Authorization token required'
-            }).encode())
-            return
+
+def active_subscription(user_doc):
+    """The subscription stored on a user document if it is active, else None"""
+    if user_doc is None or not user_doc.exists:
+        return None
+    subscription = (user_doc.to_dict() or {}).get('subscription')
+    return subscription if subscription and subscription.get('active', False) else None
+
+def dashboard_etag(user_id, user_doc, now=None):
+    """ETag for a user's dashboard, computed before the body is built.
+
+    A dashboard served from Firestore only changes when users/{uid} does,
+    so the document's update_time identifies the body. Dashboards that
+    fall back to Paddle also get a time bucket.
+    """
+    update_time = user_doc.update_time if user_doc is not None and user_doc.exists else None
+    parts = [DASHBOARD_BODY_VERSION, user_id, update_time]
+    if not active_subscription(user_doc):
+        parts.append(int((now or time.time()) // max(DASHBOARD_PADDLE_REVALIDATE, 1)))
+    return etag_for(':'.join(str(part) for part in parts).encode())
+
+def safe_paddle_call(func, subscription_id, default):
+    """Run a per-subscription Paddle call, returning a default if it fails"""
+    try:
+        return func(subscription_id)
+    except Exception as e:
+        logger.error("%s failed for subscription %s: %s", func.__name__, subscription_id, e)
+        return default
+
+def fetch_subscription_extras(subscriptions):
+    """Fetch license keys and details for all subscriptions concurrently.
+
+    Returns a list of (license_keys, details) tuples in the same order as
+    the subscriptions passed in.
+    """
+    if not subscriptions:
+        return []
+    
+    subscription_ids = [subscription['id'] for subscription in subscriptions]
+    workers = min(PADDLE_FANOUT_WORKERS, 2 * len(subscription_ids))
+    
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        key_futures = [
+            executor.submit(safe_paddle_call, get_license_keys, subscription_id, [])
+            for subscription_id in subscription_ids
+        ]
+        detail_futures = [
+            executor.submit(safe_paddle_call, get_subscription_details, subscription_id, None)
+            for subscription_id in subscription_ids
+        ]
+        return [
+            (key_future.result() or [], detail_future.result())
+            for key_future, detail_future in zip(key_futures, detail_futures)
+        ]
+
+class handler(JsonHandler):
+    route = '/api/dashboard'
+    allow_headers = 'Content-Type, Authorization, If-None-Match'
+
+    def get(self):
+        user_data = self.user
+        user_id = user_data.get('user_id')
+        cache_control = private_cache_control(DASHBOARD_MAX_AGE)
         
-        # Verify token
-        user_data = verify_token(token)
-        if not user_data:
-            self.wfile.write(json.dumps({
-                'error': 'Invalid or expired token'
-            }).encode())
+        # Serve repeat visits from the dashboard cache
+        cached = get_cached_dashboard(user_id)
+        if cached:
+            etag, cached_body = cached
+            self.send_cacheable(cached_body.encode(), cache_control, etag)
             return
         
         try:
             # First try to get subscription data from Firebase
-            if initialize_firebase():
-                # Get the user ID from the token
-                user_id = user_data.get('user_id')
-                
-                if user_id:
-                    print(f"Looking up Firebase data for user: {user_id}")
-                    user_ref = db.collection('users').document(user_id)
+            user_doc = None
+            if initialize_firebase() and user_id:
+                logger.debug("Looking up Firebase data for user: %s", user_id)
+                user_ref = get_db().collection('users').document(user_id)
+                with firestore_op('users', 'get'):
                     user_doc = user_ref.get()
-                    
-                    if user_doc.exists:
-                        user_data_firestore = user_doc.to_dict()
-                        print(f"Found user data in Firestore: {user_id}")
-                        
-                        # Check if user has subscription data stored in Firebase
-                        if 'subscription' in user_data_firestore:
-                            subscription_data = user_data_firestore.get('subscription', {})
-                            if subscription_data and subscription_data.get('active', False):
-                                # User has an active subscription in Firebase
-                                subscription_data = user_data_firestore['subscription']
-                                license_key = user_data_firestore.get('licenseKey')
-                                credit_usage = user_data_firestore.get('creditUsage', {'used': 0, 'total': 0})
-                                
-                                print(f"Found active subscription in Firestore for user {user_id}")
-                                
-                                # Format the response with data from Firestore
-                                dashboard_data = {
-                                    'customer': {'id': user_data_firestore.get('paddleCustomerId')},
-                                    'subscriptions': [subscription_data],
-                                    'license_keys': [{'key': license_key}] if license_key else [],
-                                    'creditUsage': user_data_firestore.get('creditUsage', {'used': 0, 'total': 0})
-                                }
+                if not user_doc.exists:
+                    logger.info("User document not found in Firestore for user %s", user_id)
+            
+            # Answer revalidations before building the body or calling Paddle
+            etag = dashboard_etag(user_id, user_doc)
+            if self.send_not_modified(etag, cache_control):
+                return
+            
+            subscription_data = active_subscription(user_doc)
+            if subscription_data:
+                user_data_firestore = user_doc.to_dict()
+                license_key = user_data_firestore.get('licenseKey')
+                
+                logger.debug("Found active subscription in Firestore for user %s", user_id)
+                
+                # Format the response with data from Firestore
+                dashboard_data = {
+                    'customer': {'id': user_data_firestore.get('paddleCustomerId')},
+                    'subscriptions': [subscription_data],
+                    'license_keys': [{'key': license_key}] if license_key else [],
+                    'creditUsage': user_data_firestore.get('creditUsage', {'used': 0, 'total': 0})
+                }
 
-                                # Convert timestamps to strings for JSON serialization
-                                dashboard_data = convert_timestamps_to_strings(dashboard_data)
+                # Convert timestamps to strings for JSON serialization
+                dashboard_data = convert_timestamps_to_strings(dashboard_data)
 
-                                # Return dashboard data
-                                self.wfile.write(json.dumps(dashboard_data).encode())
-                                return
-                        else:
-                            print(f"No active subscription found in Firestore for user {user_id}")
-                    else:
-                        print(f"User document not found in Firestore for user {user_id}")
+                # Cache and return dashboard data
+                body = json.dumps(dashboard_data)
+                cache_dashboard(user_id, body, etag)
+                self.send_cacheable(body.encode(), cache_control, etag)
+                return
+            if user_doc is not None and user_doc.exists:
+                logger.info("No active subscription found in Firestore for user %s", user_id)
             
             # If we reach this point, either Firebase wasn't initialized or the user doesn't have
             # an active subscription in Firestore. Fall back to Paddle API.
 
             # Get customer data from Paddle
             email = user_data.get('email')
-            print(f"Falling back to Paddle API for user email: {email}")
+            logger.info("Falling back to Paddle API for user email: %s", email)
             customer = get_customer_by_email(email)
             
             if not customer:
-                print(f"Customer not found in Paddle for email: {email}")
-                self.wfile.write(json.dumps({
+                logger.warning("Customer not found in Paddle for email: %s", email)
+                # Not an error for the dashboard: the user simply has no purchases yet
+                return {
                     'error': 'Customer not found in Paddle'
-                }).encode())
-                return
+                }
             
             # Get subscriptions
             subscriptions = get_subscriptions(customer['id'])
@@ -157,14 +185,12 @@ class handler(BaseHTTPRequestHandler):
             processed_subscriptions = []
             license_keys = []
             
-            for subscription in subscriptions:
-                # Get license keys for each subscription
-                subscription_keys = get_license_keys(subscription['id'])
+            # Fetch license keys and details for every subscription in parallel
+            subscription_extras = fetch_subscription_extras(subscriptions)
+            
+            for subscription, (subscription_keys, details) in zip(subscriptions, subscription_extras):
                 license_keys.extend(subscription_keys)
                 
-                # Get detailed subscription info
-                details = get_subscription_details(subscription['id'])
-                
                 if details:
                     # Determine if subscription is active based on status
                     status = details.get('status', '').lower()
@@ -209,8 +235,8 @@ class handler(BaseHTTPRequestHandler):
                 
                 if active_sub and user_data.get('user_id'):
                     try:
-                        print(f"Updating Firebase with active subscription from Paddle API")
-                        user_ref = db.collection('users').document(user_data.get('user_id'))
+                        logger.info("Updating Firebase with active subscription from Paddle API")
+                        user_ref = get_db().collection('users').document(user_data.get('user_id'))
                         
                         # Generate a license key if none exists
                         if not license_keys:
@@ -229,25 +255,36 @@ class handler(BaseHTTPRequestHandler):
                             'licenseKey': license_key,
                             'paddleCustomerId': customer['id']
                         })
-                        print(f"Successfully updated Firebase from Paddle API data")
+                        save_customer_mapping(customer['id'], user_data.get('user_id'))
+                        save_license(
+                            license_key, user_data.get('user_id'), active_sub.get('id'), customer['id'],
+                            active_sub.get('plan', {}).get('id'), active_sub.get('plan', {}).get('name'),
+                            active_sub.get('status') or 'active'
+                        )
+                        logger.info("Successfully updated Firebase from Paddle API data")
                     except Exception as e:
-                        print(f"Error updating Firebase from Paddle API: {str(e)}")
+                        logger.error("Error updating Firebase from Paddle API: %s", e)
             
             # Debug logging
-            print(f"Email: {email}, Customer ID: {customer.get('id')}")
-            print(f"Found {len(processed_subscriptions)} subscriptions")
-            for sub in processed_subscriptions:
-                print(f"Subscription ID: {sub.get('id')}, Status: {sub.get('status')}, Active: {sub.get('active')}")
+            logger.debug("Email: %s, Customer ID: %s", email, customer.get('id'))
+            logger.debug("Found %s subscriptions", len(processed_subscriptions))
+            if logger.isEnabledFor(logging.DEBUG):
+                for sub in processed_subscriptions:
+                    logger.debug("Subscription ID: %s, Status: %s, Active: %s", sub.get('id'), sub.get('status'), sub.get('active'))
             
             # Format the response
             credit_usage_data = {'used': 0, 'total': total_credits}
             if user_data and user_data.get('user_id'):
                 try:
-                    user_ref = db.collection('users').document(user_data.get('user_id'))
+                    user_ref = get_db().collection('users').document(user_data.get('user_id'))
                     user_doc = user_ref.get()
                     if user_doc.exists:
                         user_firestore_data = user_doc.to_dict()
                         credit_usage_data = user_firestore_data.get('creditUsage', {'used': 0, 'total': total_credits})
+                        # If the document changed above without activating a subscription,
+                        # tag the body with the version the next request will compute
+                        if not active_subscription(user_doc):
+                            etag = dashboard_etag(user_id, user_doc)
                 except:
                     pass
 
@@ -258,19 +295,11 @@ class handler(BaseHTTPRequestHandler):
                 'creditUsage': credit_usage_data
             }
             
-            # Return dashboard data
-            self.wfile.write(json.dumps(dashboard_data).encode())
+            # Cache and return dashboard data
+            body = json.dumps(dashboard_data)
+            cache_dashboard(user_id, body, etag)
+            self.send_cacheable(body.encode(), cache_control, etag)
             
         except Exception as e:
-            print(f"Dashboard error: {str(e)}")
-            self.wfile.write(json.dumps({
-                'error': str(e)
-            }).encode())
-            
-    def do_OPTIONS(self):
-        # Handle preflight requests for CORS
-        self.send_response(200)
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
-        self.end_headers()
\ No newline at end of file
+            logger.error("Dashboard error: %s", e)
+            raise HttpError(500, str(e))
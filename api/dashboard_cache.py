@@ -0,0 +1,128 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from .logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# When set (and the redis package is installed) the cache is shared across
+# instances, so webhook invalidations reach every warm dashboard function
+REDIS_URL = os.getenv("REDIS_URL")
+
+# Seconds a dashboard body is cached. When unset it depends on the backend in
+# use: 60 with Redis, 0 (off) with the in-process cache, which the webhook
+# function's invalidations never reach. Setting it opts in to stale reads.
+DASHBOARD_CACHE_TTL = int(os.environ["DASHBOARD_CACHE_TTL"]) if os.getenv("DASHBOARD_CACHE_TTL") else None
+REDIS_CACHE_TTL = 60
+DASHBOARD_CACHE_MAX_ENTRIES = int(os.getenv("DASHBOARD_CACHE_MAX_ENTRIES", "1024"))
+
+KEY_PREFIX = "dashboard:"
+
+class MemoryBackend:
+    """In-process TTL cache with an LRU bound on the number of entries"""
+
+    def __init__(self, max_entries=DASHBOARD_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+class RedisBackend:
+    """Shared cache backed by any client with redis-py's get/set/delete API"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def get(self, key):
+        value = self.client.get(key)
+        if isinstance(value, bytes):
+            value = value.decode('utf-8')
+        return value
+
+    def set(self, key, value, ttl):
+        self.client.set(key, value, ex=ttl)
+
+    def delete(self, key):
+        self.client.delete(key)
+
+_backend = None
+
+def get_backend():
+    """Return the configured cache backend, creating it on first use"""
+    global _backend
+    if _backend is None:
+        if REDIS_URL:
+            try:
+                import redis
+                _backend = RedisBackend(redis.Redis.from_url(REDIS_URL))
+            except Exception as e:
+                logger.warning("Redis dashboard cache unavailable, using in-process cache: %s", e)
+        if _backend is None:
+            _backend = MemoryBackend()
+    return _backend
+
+def set_backend(backend):
+    """Swap the cache backend (e.g. a fakeredis client wrapped in RedisBackend)"""
+    global _backend
+    _backend = backend
+
+def cache_ttl():
+    """TTL for dashboard bodies on the backend in use; 0 disables caching"""
+    if DASHBOARD_CACHE_TTL is not None:
+        return DASHBOARD_CACHE_TTL
+    return REDIS_CACHE_TTL if isinstance(get_backend(), RedisBackend) else 0
+
+def get_cached_dashboard(user_id):
+    """Return the cached (etag, JSON body) for a user's dashboard, or None"""
+    if not user_id or cache_ttl() <= 0:
+        return None
+    try:
+        value = get_backend().get(KEY_PREFIX + user_id)
+    except Exception as e:
+        logger.error("Dashboard cache read error: %s", e)
+        return None
+    # Stored as "<etag>\n<body>"; compact JSON never contains a raw newline
+    etag, separator, body = (value or '').partition('\n')
+    return (etag, body) if separator else None
+
+def cache_dashboard(user_id, body, etag):
+    """Store the JSON dashboard body for a user with the ETag it was served under"""
+    ttl = cache_ttl()
+    if not user_id or ttl <= 0:
+        return
+    try:
+        get_backend().set(KEY_PREFIX + user_id, f'{etag}\n{body}', ttl)
+    except Exception as e:
+        logger.error("Dashboard cache write error: %s", e)
+
+def invalidate_dashboard(user_id):
+    """Drop the cached dashboard for a user after their document changes"""
+    if not user_id:
+        return
+    try:
+        get_backend().delete(KEY_PREFIX + user_id)
+    except Exception as e:
+        logger.error("Dashboard cache invalidation error: %s", e)
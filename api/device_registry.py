@@ -0,0 +1,104 @@
+import os
+import time
+import datetime
+from .firebase_client import get_db
+from .logging_config import get_logger
+from .telemetry import firestore_op
+
+logger = get_logger(__name__)
+
+# Devices activated on a license: licenses/{key}/devices/{device_id} -> {first_seen, last_seen}
+DEVICES_COLLECTION = 'devices'
+
+# The last heartbeat of every device is also kept on the license document:
+# licenses/{key}.device_seen -> {device_id: timestamp}. Validation reads and
+# caches that document anyway, so every instance can tell whether a device
+# is due without an extra read.
+DEVICE_SEEN_FIELD = 'device_seen'
+
+# A device's last_seen is only rewritten once it is older than this, so
+# clients that restart often do not turn every validation into a write
+DEVICE_HEARTBEAT_INTERVAL = int(os.getenv("DEVICE_HEARTBEAT_INTERVAL", "900"))  # Seconds
+
+# Firestore allows 500 writes per batch
+HEARTBEAT_BATCH_SIZE = 500
+
+def device_ref(db, license_key, device_id):
+    from .license_store import LICENSES_COLLECTION
+    return db.collection(LICENSES_COLLECTION).document(license_key).collection(DEVICES_COLLECTION).document(device_id)
+
+def last_seen(license, device_id):
+    """Epoch seconds of a device's last recorded heartbeat on a license, or None"""
+    seen_at = ((license or {}).get(DEVICE_SEEN_FIELD) or {}).get(device_id)
+    return seen_at.timestamp() if isinstance(seen_at, datetime.datetime) else None
+
+def stale_devices(pairs, licenses, now=None):
+    """Return the distinct (license_key, device_id) pairs whose last_seen is due.
+
+    licenses maps each key to its (cached) license document.
+    """
+    now = now if now is not None else time.time()
+    due = []
+    for license_key, device_id in dict.fromkeys(pairs):
+        seen_at = last_seen(licenses.get(license_key), device_id)
+        if seen_at is None or now - seen_at >= DEVICE_HEARTBEAT_INTERVAL:
+            due.append((license_key, device_id))
+    return due
+
+def record_heartbeats(pairs, licenses, now=None):
+    """Update last_seen for validated devices, skipping recently written ones.
+
+    Each due device gets its devices/{id} write, and each license one merge
+    of device_seen, in batches. Returns {license_key: {device_id: seen_at}}
+    for the heartbeats written, so the caller can update its cached licenses.
+    """
+    due = stale_devices(pairs, licenses, now)
+    if not due:
+        return {}
+
+    db = get_db()
+    if not db:
+        return {}
+
+    from firebase_admin import firestore
+    from .license_store import LICENSES_COLLECTION
+    by_license = {}
+    for license_key, device_id in due:
+        by_license.setdefault(license_key, []).append(device_id)
+
+    seen_at = datetime.datetime.fromtimestamp(now if now is not None else time.time(), datetime.timezone.utc)
+    written = {}
+    staged = {}
+    batch = db.batch()
+    try:
+        for license_key, device_ids in by_license.items():
+            # A license's writes share a batch so device_seen matches its device documents
+            if staged and sum(map(len, staged.values())) + len(staged) + len(device_ids) + 1 > HEARTBEAT_BATCH_SIZE:
+                with firestore_op(DEVICES_COLLECTION, 'heartbeat'):
+                    batch.commit()
+                written.update(staged)
+                staged, batch = {}, db.batch()
+            for device_id in device_ids:
+                batch.set(device_ref(db, license_key, device_id), {
+                    'last_seen': firestore.SERVER_TIMESTAMP
+                }, merge=True)
+            batch.set(db.collection(LICENSES_COLLECTION).document(license_key), {
+                DEVICE_SEEN_FIELD: {device_id: firestore.SERVER_TIMESTAMP for device_id in device_ids}
+            }, merge=True)
+            staged[license_key] = {device_id: seen_at for device_id in device_ids}
+        with firestore_op(DEVICES_COLLECTION, 'heartbeat'):
+            batch.commit()
+        written.update(staged)
+    except Exception as e:
+        logger.error("Device heartbeat write error: %s", e)
+    return written
+
+def list_devices(license_key):
+    """Return the devices registered on a license"""
+    db = get_db()
+    if not db:
+        return []
+
+    from .license_store import LICENSES_COLLECTION
+    devices = db.collection(LICENSES_COLLECTION).document(license_key).collection(DEVICES_COLLECTION)
+    return [{'device_id': doc.id, **doc.to_dict()} for doc in devices.stream()]
@@ -0,0 +1,66 @@
+import os
+import json
+import threading
+from .logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# firebase_admin and Firestore are imported on first use so endpoints that
+# never touch Firebase (license checks, webhook health checks) skip the
+# import cost on cold start.
+_app = None
+_db = None
+_lock = threading.Lock()
+
+def get_app():
+    """Initialize the Firebase Admin app once per process and return it"""
+    global _app
+    if _app is not None:
+        return _app
+
+    with _lock:
+        if _app is None:
+            try:
+                import firebase_admin
+                from firebase_admin import credentials
+
+                if firebase_admin._apps:
+                    _app = firebase_admin.get_app()
+                else:
+                    # Parse the Firebase service account JSON
+                    firebase_credentials_json = os.environ.get("FIREBASE_SERVICE_ACCOUNT")
+                    if not firebase_credentials_json:
+                        logger.error("Firebase credentials not found in environment variables")
+                        return None
+
+                    firebase_credentials_dict = json.loads(firebase_credentials_json)
+                    cred = credentials.Certificate(firebase_credentials_dict)
+                    _app = firebase_admin.initialize_app(cred)
+                    logger.info("Firebase initialized successfully")
+            except Exception as e:
+                logger.error("Firebase initialization error: %s", e)
+                return None
+    return _app
+
+def get_db():
+    """Return the shared Firestore client, or None if Firebase is unavailable"""
+    global _db
+    if _db is not None:
+        return _db
+
+    if not get_app():
+        return None
+
+    with _lock:
+        if _db is None:
+            try:
+                from firebase_admin import firestore
+                _db = firestore.client()
+            except Exception as e:
+                logger.error("Firestore client error: %s", e)
+                return None
+    return _db
+
+def initialize_firebase():
+    """Return True once Firebase and Firestore are ready to use"""
+    return get_db() is not None
@@ -0,0 +1,79 @@
+import json
+
+# Bytes buffered before each write to the socket
+STREAM_BUFFER_SIZE = 16384
+
+_encoder = json.JSONEncoder()
+
+def _is_stream(value):
+    """Iterables that are streamed element by element rather than encoded whole"""
+    return hasattr(value, '__next__')
+
+def iter_json(value):
+    """Encode a value as JSON text pieces.
+
+    Dicts and lists are walked one level at a time so that generators nested
+    in them (e.g. a generator of formatted transactions) are encoded one
+    element at a time, never materialized as a list.
+    """
+    if isinstance(value, dict):
+        yield '{'
+        first = True
+        for key, item in value.items():
+            if not first:
+                yield ','
+            first = False
+            yield _encoder.encode(str(key))
+            yield ':'
+            if isinstance(item, (dict, list)) or _is_stream(item):
+                yield from iter_json(item)
+            else:
+                yield _encoder.encode(item)
+        yield '}'
+    elif isinstance(value, list) or _is_stream(value):
+        yield '['
+        first = True
+        for item in value:
+            if not first:
+                yield ','
+            first = False
+            if _is_stream(item):
+                yield from iter_json(item)
+            else:
+                yield _encoder.encode(item)
+        yield ']'
+    else:
+        yield _encoder.encode(value)
+
+def write_json(wfile, value, chunked=False, buffer_size=STREAM_BUFFER_SIZE):
+    """Stream a JSON value to wfile in bounded pieces.
+
+    With chunked=True each write is framed for Transfer-Encoding: chunked,
+    which HTTP/1.1 handlers must use when no Content-Length is sent. HTTP/1.0
+    handlers write the raw pieces and the body ends when the connection closes.
+    """
+    buffer = []
+    size = 0
+
+    def flush():
+        data = ''.join(buffer).encode('utf-8')
+        if not data:
+            return
+        if chunked:
+            wfile.write(f'{len(data):X}\r\n'.encode() + data + b'\r\n')
+        else:
+            wfile.write(data)
+        wfile.flush()
+
+    for piece in iter_json(value):
+        buffer.append(piece)
+        size += len(piece)
+        if size >= buffer_size:
+            flush()
+            buffer.clear()
+            size = 0
+
+    flush()
+    if chunked:
+        wfile.write(b'0\r\n\r\n')
+        wfile.flush()
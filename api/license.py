@@ -1,60 +1,89 @@
-from http.server import BaseHTTPRequestHandler
-import json
-from urllib.parse import parse_qs, urlparse
-from .paddle_api import validate_license
-
-class handler(BaseHTTPRequestHandler):
-    def do_POST(self):
-        # Set CORS headers for browser security
-        self.send_response(200)
-        self.send_header('Content-Type', 'application/json')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-        self.end_headers()
-        
-        # Parse URL to get the action
-        parsed_url = urlparse(self.path)
-        query_params = parse_qs(parsed_url.query)
-        action = query_params.get('action', [''])[0]
-        
-        # Read request body
-        content_length = int(self.headers.get('Content-Length', 0))
-        post_data = self.rfile.read(content_length)
-        request_data = json.loads(post_data)
-        
-        try:
-            # Handle validate action (used by software to validate license keys)
-            if action == 'validate':
-                license_key = request_data.get('license_key')
-                device_id = request_data.get('device_id')
-                
-                if not license_key or not device_id:
-                    self.wfile.write(json.dumps({
-                        'valid': False,
-                        'message': 'License key and device ID are required'
-                    }).encode())
-                    return
-                
-                # Validate the license
-                result = validate_license(license_key, device_id)
-                self.wfile.write(json.dumps(result).encode())
-                
+import os
+from .base_handler import JsonHandler, HttpError
+from .license_store import validate_license, validate_batch, unbind_device, is_valid_license_key, is_valid_device_id
+from .license_lease import LEASE_ALGORITHM, public_key_pem
+
+# Upper bound on pairs accepted by one validate_batch request
+LICENSE_BATCH_MAX_ITEMS = int(os.getenv("LICENSE_BATCH_MAX_ITEMS", "1000"))
+
+def is_valid_pair(license_key, device_id):
+    return is_valid_license_key(license_key) and is_valid_device_id(device_id)
+
+class handler(JsonHandler):
+    route = '/api/license'
+    methods = ('GET', 'POST')
+    allow_headers = 'Content-Type'
+    require_auth = False
+    actions = {
+        'validate': 'validate',
+        'validate_batch': 'validate_batch',
+        'deactivate': 'deactivate'
+    }
+
+    def get(self):
+        """Publish the public key clients use to verify leases offline"""
+        public_key = public_key_pem()
+        if not public_key:
+            raise HttpError(404, 'License leases are not enabled')
+
+        self.send_json(200, {
+            'algorithm': LEASE_ALGORITHM,
+            'public_key': public_key
+        }, headers={'Cache-Control': 'public, max-age=86400'})
+
+    def validate(self):
+        """Validate a license key for a device (used by the desktop software)"""
+        request_data = self.json_body()
+        license_key = request_data.get('license_key')
+        device_id = request_data.get('device_id')
+
+        if not license_key or not device_id:
+            raise HttpError(400, 'License key and device ID are required',
+                            valid=False, message='License key and device ID are required')
+        if not is_valid_pair(license_key, device_id):
+            raise HttpError(400, 'Invalid license key or device ID',
+                            valid=False, message='Invalid license key or device ID')
+
+        return validate_license(license_key, device_id)
+
+    def validate_batch(self):
+        """Validate a list of {license_key, device_id} pairs in one request"""
+        items = self.json_body().get('licenses')
+        if not isinstance(items, list) or not items:
+            raise HttpError(400, 'A non-empty licenses list is required')
+        if len(items) > LICENSE_BATCH_MAX_ITEMS:
+            raise HttpError(400, f'At most {LICENSE_BATCH_MAX_ITEMS} licenses per request')
+
+        # A malformed item gets its own error result; the other items are still validated
+        pairs = []
+        for item in items:
+            item = item if isinstance(item, dict) else {}
+            pairs.append((item.get('license_key'), item.get('device_id')))
+        valid_pairs = [pair for pair in pairs if is_valid_pair(*pair)]
+        validated = dict(zip(valid_pairs, validate_batch(valid_pairs))) if valid_pairs else {}
+
+        results = []
+        for license_key, device_id in pairs:
+            if is_valid_pair(license_key, device_id):
+                result = validated[(license_key, device_id)]
             else:
-                self.wfile.write(json.dumps({
-                    'error': 'Invalid action'
-                }).encode())
-                
-        except Exception as e:
-            self.wfile.write(json.dumps({
-                'valid': False,
-                'message': f'Server error: {str(e)}'
-            }).encode())
-            
-    def do_OPTIONS(self):
-        # Handle preflight requests for CORS
-        self.send_response(200)
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-        self.end_headers()
\ No newline at end of file
+                result = {'valid': False, 'message': 'Invalid license key or device ID'}
+            results.append({'license_key': license_key, 'device_id': device_id, **result})
+        return {
+            'results': results
+        }
+
+    def deactivate(self):
+        """Release a device's seat so the license can be activated elsewhere"""
+        request_data = self.json_body()
+        license_key = request_data.get('license_key')
+        device_id = request_data.get('device_id')
+
+        if not license_key or not device_id:
+            raise HttpError(400, 'License key and device ID are required')
+        if not is_valid_pair(license_key, device_id):
+            raise HttpError(400, 'Invalid license key or device ID')
+
+        return {
+            'success': unbind_device(license_key, device_id)
+        }
@@ -0,0 +1,70 @@
+import os
+import time
+import threading
+from .logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Ed25519 private key (PEM) used to sign leases. Leases are only issued when set.
+LEASE_PRIVATE_KEY = os.getenv("LICENSE_LEASE_PRIVATE_KEY")
+
+# A lease is valid for LEASE_TTL seconds; clients should renew once renew_at
+# passes and may keep using it offline until grace_until
+LEASE_TTL = int(os.getenv("LICENSE_LEASE_TTL", str(7 * 24 * 3600)))
+LEASE_GRACE = int(os.getenv("LICENSE_LEASE_GRACE", str(3 * 24 * 3600)))
+LEASE_RENEW_FRACTION = 0.8
+
+LEASE_ALGORITHM = 'EdDSA'
+LEASE_ISSUER = 'yok-ai-license'
+
+_signing_key = None
+_lock = threading.Lock()
+
+def get_signing_key():
+    """Load the Ed25519 signing key once, or return None if leases are disabled"""
+    global _signing_key
+    if _signing_key is not None or not LEASE_PRIVATE_KEY:
+        return _signing_key or None
+
+    with _lock:
+        if _signing_key is None:
+            try:
+                from cryptography.hazmat.primitives.serialization import load_pem_private_key
+                _signing_key = load_pem_private_key(LEASE_PRIVATE_KEY.replace('\\n', '\n').encode(), password=None)
+            except Exception as e:
+                logger.error("License lease key could not be loaded: %s", e)
+                _signing_key = False
+    return _signing_key or None
+
+def public_key_pem():
+    """PEM public key clients use to verify leases, or None if leases are disabled"""
+    signing_key = get_signing_key()
+    if not signing_key:
+        return None
+
+    from cryptography.hazmat.primitives import serialization
+    return signing_key.public_key().public_bytes(
+        serialization.Encoding.PEM,
+        serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode()
+
+def issue_lease(license_key, device_id, license, now=None):
+    """Sign a lease binding a license's tier and features to one device"""
+    signing_key = get_signing_key()
+    if not signing_key:
+        return None
+
+    import jwt
+    issued_at = int(now if now is not None else time.time())
+    expires_at = issued_at + LEASE_TTL
+    return jwt.encode({
+        'iss': LEASE_ISSUER,
+        'sub': license_key,
+        'device_id': device_id,
+        'tier': license.get('tier'),
+        'features': license.get('features', []),
+        'iat': issued_at,
+        'renew_at': issued_at + int(LEASE_TTL * LEASE_RENEW_FRACTION),
+        'exp': expires_at,
+        'grace_until': expires_at + LEASE_GRACE
+    }, signing_key, algorithm=LEASE_ALGORITHM)
@@ -0,0 +1,389 @@
+import os
+import re
+import time
+import datetime
+import threading
+from collections import OrderedDict
+from .firebase_client import get_db
+from .logging_config import get_logger
+from .telemetry import firestore_op
+from .license_lease import issue_lease
+from .device_registry import DEVICE_SEEN_FIELD, device_ref, record_heartbeats
+
+logger = get_logger(__name__)
+
+# One document per license key: licenses/{key} -> {uid, status, tier, devices, ...}
+LICENSES_COLLECTION = 'licenses'
+
+# Validations are served from this in-process cache. Status changes made on
+# this instance take effect immediately; elsewhere within LICENSE_CACHE_TTL.
+LICENSE_CACHE_MAX_ENTRIES = int(os.getenv("LICENSE_CACHE_MAX_ENTRIES", "10000"))
+LICENSE_CACHE_TTL = int(os.getenv("LICENSE_CACHE_TTL", "300"))
+LICENSE_NEGATIVE_TTL = int(os.getenv("LICENSE_NEGATIVE_TTL", "60"))
+
+# Devices a license can be bound to unless the document sets max_devices
+LICENSE_MAX_DEVICES = int(os.getenv("LICENSE_MAX_DEVICES", "3"))
+
+# Keys fetched per Firestore get_all call in batch validation
+LICENSE_FETCH_CHUNK = 100
+
+# Subscription statuses that keep a license valid
+ACTIVE_STATUSES = ('active', 'trialing', 'past_due')
+
+# Cached value for keys known not to exist
+UNKNOWN_LICENSE = {}
+
+# Keys are issued as UUID4 strings (paddle_webhook.generate_license_key)
+LICENSE_KEY_PATTERN = re.compile(r'^[0-9A-F]{8}-[0-9A-F]{4}-[0-9A-F]{4}-[0-9A-F]{4}-[0-9A-F]{12}$', re.IGNORECASE)
+DEVICE_ID_MAX_LENGTH = 256
+
+_entries = OrderedDict()
+_lock = threading.Lock()
+
+def _get_cached(license_key):
+    with _lock:
+        entry = _entries.get(license_key)
+        if entry is None:
+            return None
+        license, expires_at = entry
+        if expires_at <= time.monotonic():
+            del _entries[license_key]
+            return None
+        _entries.move_to_end(license_key)
+        return license
+
+def _cache(license_key, license, ttl=LICENSE_CACHE_TTL):
+    with _lock:
+        _entries[license_key] = (license, time.monotonic() + ttl)
+        _entries.move_to_end(license_key)
+        while len(_entries) > LICENSE_CACHE_MAX_ENTRIES:
+            _entries.popitem(last=False)
+
+def _update_cached(license_key, license):
+    """Replace a cached license without extending its expiry"""
+    with _lock:
+        entry = _entries.get(license_key)
+        if entry is not None:
+            _entries[license_key] = (license, entry[1])
+
+def invalidate_license(license_key):
+    """Drop a license from this instance's cache"""
+    with _lock:
+        _entries.pop(license_key, None)
+
+def is_valid_license_key(license_key):
+    """True for a string in the issued key format, safe to use as a document id"""
+    return isinstance(license_key, str) and bool(LICENSE_KEY_PATTERN.match(license_key))
+
+def is_valid_device_id(device_id):
+    """True for a non-empty string usable as a Firestore document id"""
+    return (
+        isinstance(device_id, str)
+        and 0 < len(device_id) <= DEVICE_ID_MAX_LENGTH
+        and '/' not in device_id
+        and device_id not in ('.', '..')
+        and not (device_id.startswith('__') and device_id.endswith('__'))
+    )
+
+def _license_ref(license_key):
+    db = get_db()
+    if not db:
+        raise RuntimeError('Firebase is not available')
+    return db.collection(LICENSES_COLLECTION).document(license_key)
+
+def get_license(license_key):
+    """Return the license document for a key, or None if it does not exist"""
+    license = _get_cached(license_key)
+    if license is not None:
+        return license or None
+
+    with firestore_op(LICENSES_COLLECTION, 'get'):
+        doc = _license_ref(license_key).get()
+
+    if not doc.exists:
+        _cache(license_key, UNKNOWN_LICENSE, LICENSE_NEGATIVE_TTL)
+        return None
+
+    license = doc.to_dict()
+    _cache(license_key, license)
+    return license
+
+def get_licenses(license_keys):
+    """Return {key: license or None} for distinct keys, fetching misses with get_all"""
+    licenses = {}
+    missing = []
+    for license_key in license_keys:
+        license = _get_cached(license_key)
+        if license is None:
+            missing.append(license_key)
+        else:
+            licenses[license_key] = license or None
+
+    if missing:
+        db = get_db()
+        if not db:
+            raise RuntimeError('Firebase is not available')
+        collection = db.collection(LICENSES_COLLECTION)
+        for start in range(0, len(missing), LICENSE_FETCH_CHUNK):
+            refs = [collection.document(key) for key in missing[start:start + LICENSE_FETCH_CHUNK]]
+            with firestore_op(LICENSES_COLLECTION, 'get_all'):
+                docs = list(db.get_all(refs))
+            for doc in docs:
+                if doc.exists:
+                    licenses[doc.id] = doc.to_dict()
+                    _cache(doc.id, licenses[doc.id])
+        for license_key in missing:
+            if license_key not in licenses:
+                licenses[license_key] = None
+                _cache(license_key, UNKNOWN_LICENSE, LICENSE_NEGATIVE_TTL)
+
+    return licenses
+
+def save_license(license_key, user_id, subscription_id=None, customer_id=None, plan_id=None, tier=None,
+                 status='active', batch=None):
+    """Create or update the license document for a key; bound devices are kept.
+
+    With a batch the write is only staged; invalidate the cache after committing.
+    """
+    from firebase_admin import firestore
+    if not license_key or not user_id:
+        return
+
+    license = {
+        'uid': user_id,
+        'subscription_id': subscription_id,
+        'customer_id': customer_id,
+        'plan_id': plan_id,
+        'tier': tier,
+        'status': status,
+        'updated_at': firestore.SERVER_TIMESTAMP
+    }
+    if batch is not None:
+        batch.set(_license_ref(license_key), license, merge=True)
+        return
+
+    try:
+        _license_ref(license_key).set(license, merge=True)
+    except Exception as e:
+        logger.error("License write error for %s: %s", license_key, e)
+    invalidate_license(license_key)
+
+def update_license(license_key, batch=None, **fields):
+    """Update fields (e.g. status, tier) on an existing license.
+
+    With a batch the update is staged as a merge, so a key that predates the
+    collection cannot reject the whole batch; invalidate the cache after committing.
+    """
+    from firebase_admin import firestore
+    if not license_key:
+        return
+
+    fields['updated_at'] = firestore.SERVER_TIMESTAMP
+    if batch is not None:
+        batch.set(_license_ref(license_key), fields, merge=True)
+        return
+
+    try:
+        _license_ref(license_key).update(fields)
+    except Exception as e:
+        logger.error("License update error for %s: %s", license_key, e)
+    invalidate_license(license_key)
+
+def revoke_license(license_key, reason='revoked', batch=None):
+    """Revoke a license so it no longer validates"""
+    update_license(license_key, batch=batch, status='revoked', revoked_reason=reason)
+
+def bind_devices(license_key, device_ids):
+    """Bind devices to a license in one transaction, in order, while slots remain.
+
+    Returns the set of the given device ids that are bound afterwards.
+    """
+    from firebase_admin import firestore
+    db = get_db()
+    license_ref = _license_ref(license_key)
+
+    @firestore.transactional
+    def bind(transaction):
+        snapshot = license_ref.get(transaction=transaction)
+        license = snapshot.to_dict() or {}
+        devices = license.get('devices', [])
+        free_slots = max(license.get('max_devices', LICENSE_MAX_DEVICES) - len(devices), 0)
+        new_devices = [device_id for device_id in dict.fromkeys(device_ids) if device_id not in devices][:free_slots]
+        if new_devices and snapshot.exists:
+            # Binding counts as the first heartbeat
+            transaction.set(license_ref, {
+                'devices': firestore.ArrayUnion(new_devices),
+                DEVICE_SEEN_FIELD: {device_id: firestore.SERVER_TIMESTAMP for device_id in new_devices}
+            }, merge=True)
+            for device_id in new_devices:
+                transaction.set(device_ref(db, license_key, device_id), {
+                    'first_seen': firestore.SERVER_TIMESTAMP,
+                    'last_seen': firestore.SERVER_TIMESTAMP
+                })
+        else:
+            new_devices = []
+        seen_at = datetime.datetime.now(datetime.timezone.utc)
+        license['devices'] = devices + new_devices
+        license[DEVICE_SEEN_FIELD] = {**(license.get(DEVICE_SEEN_FIELD) or {}),
+                                      **{device_id: seen_at for device_id in new_devices}}
+        return license, new_devices
+
+    with firestore_op(LICENSES_COLLECTION, 'bind_device'):
+        license, new_devices = bind(db.transaction())
+
+    _cache(license_key, license)
+    return set(license['devices']).intersection(device_ids)
+
+def bind_device(license_key, device_id):
+    """Bind a device to a license if it has a free slot. Returns True if bound."""
+    return device_id in bind_devices(license_key, [device_id])
+
+def unbind_device(license_key, device_id):
+    """Release a device's seat on a license. Returns True if it was bound."""
+    from firebase_admin import firestore
+    from google.cloud.firestore_v1.field_path import FieldPath
+    db = get_db()
+    license_ref = _license_ref(license_key)
+
+    @firestore.transactional
+    def unbind(transaction):
+        snapshot = license_ref.get(transaction=transaction)
+        license = snapshot.to_dict() or {}
+        devices = license.get('devices', [])
+        if device_id not in devices:
+            return None
+        transaction.update(license_ref, {
+            'devices': firestore.ArrayRemove([device_id]),
+            FieldPath(DEVICE_SEEN_FIELD, device_id).to_api_repr(): firestore.DELETE_FIELD
+        })
+        transaction.delete(device_ref(db, license_key, device_id))
+        license['devices'] = [device for device in devices if device != device_id]
+        license[DEVICE_SEEN_FIELD] = {device: seen_at for device, seen_at in (license.get(DEVICE_SEEN_FIELD) or {}).items()
+                                      if device != device_id}
+        return license
+
+    with firestore_op(LICENSES_COLLECTION, 'unbind_device'):
+        license = unbind(db.transaction())
+
+    if license is None:
+        return False
+    _cache(license_key, license)
+    return True
+
+def _invalid(message):
+    return {
+        'valid': False,
+        'message': message
+    }
+
+def validate_license(license_key, device_id):
+    """Validate a license key for a device.
+
+    Known keys and devices are answered from the cache with no Firestore
+    read. A new device is bound in a transaction while slots remain. Valid
+    results carry a signed lease when LICENSE_LEASE_PRIVATE_KEY is set.
+    """
+    license = get_license(license_key)
+    result = _check_license(license_key, license, device_id)
+    if result['valid']:
+        # A new device was bound above; its heartbeat is on the refreshed cache entry
+        _record_heartbeats([(license_key, device_id)], {license_key: _get_cached(license_key) or license})
+    return result
+
+def validate_batch(items):
+    """Validate many (license_key, device_id) pairs, reading each distinct key once.
+
+    New devices are bound with one transaction per license. Returns one
+    result per item, in order; repeated pairs share a result.
+    """
+    licenses = get_licenses({license_key for license_key, _ in items})
+
+    new_devices = {}
+    for license_key, device_id in items:
+        license = licenses[license_key]
+        if license and license.get('status') in ACTIVE_STATUSES and device_id not in license.get('devices', []):
+            new_devices.setdefault(license_key, []).append(device_id)
+    for license_key, device_ids in new_devices.items():
+        bind_devices(license_key, device_ids)
+        licenses[license_key] = _get_cached(license_key) or licenses[license_key]
+
+    results = {}
+    for license_key, device_id in dict.fromkeys(items):
+        results[(license_key, device_id)] = _check_license(license_key, licenses[license_key], device_id, bind=False)
+    _record_heartbeats([pair for pair, result in results.items() if result['valid']], licenses)
+    return [results[item] for item in items]
+
+def _record_heartbeats(pairs, licenses):
+    """Write due heartbeats and note them on this instance's cached licenses"""
+    for license_key, seen in record_heartbeats(pairs, licenses).items():
+        license = dict(licenses[license_key])
+        license[DEVICE_SEEN_FIELD] = {**(license.get(DEVICE_SEEN_FIELD) or {}), **seen}
+        _update_cached(license_key, license)
+
+def _check_license(license_key, license, device_id, bind=True):
+    if not license:
+        return _invalid('License key not found')
+
+    status = license.get('status')
+    if status not in ACTIVE_STATUSES:
+        return _invalid(f'License is {status}')
+
+    if device_id not in license.get('devices', []) and not (bind and bind_device(license_key, device_id)):
+        return _invalid('Device limit reached for this license')
+
+    result = {
+        'valid': True,
+        'tier': license.get('tier'),
+        'features': license.get('features', []),
+        'message': 'License validated successfully'
+    }
+
+    # A signed lease lets the client skip validation until it is due for renewal
+    lease = issue_lease(license_key, device_id, license)
+    if lease:
+        result['lease'] = lease
+    return result
+
+def backfill_licenses(batch_size=400):
+    """Create license documents for users whose licenseKey predates the collection"""
+    db = get_db()
+    if not db:
+        logger.warning("Firebase is not available")
+        return 0
+
+    from firebase_admin import firestore
+    query = db.collection('users').where('licenseKey', '>', '')
+
+    written = 0
+    batch = db.batch()
+    pending = 0
+    for user_doc in query.stream():
+        user_data = user_doc.to_dict()
+        subscription = user_data.get('subscription') or {}
+        plan = subscription.get('plan') or {}
+        batch.set(db.collection(LICENSES_COLLECTION).document(user_data['licenseKey']), {
+            'uid': user_doc.id,
+            'subscription_id': subscription.get('id'),
+            'customer_id': user_data.get('paddleCustomerId'),
+            'plan_id': plan.get('id'),
+            'tier': plan.get('name'),
+            'status': subscription.get('status') or ('active' if subscription.get('active') else 'inactive'),
+            'updated_at': firestore.SERVER_TIMESTAMP
+        }, merge=True)
+        pending += 1
+        if pending >= batch_size:
+            batch.commit()
+            written += pending
+            batch = db.batch()
+            pending = 0
+
+    if pending:
+        batch.commit()
+        written += pending
+
+    logger.info("Backfilled %s licenses", written)
+    return written
+
+if __name__ == '__main__':
+    # Backfill licenses for existing users: python -m api.license_store
+    backfill_licenses()
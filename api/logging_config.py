@@ -0,0 +1,93 @@
+import os
+import re
+import uuid
+import json
+import random
+import logging
+import contextvars
+
+# Log level for all api/ modules, e.g. DEBUG, INFO, WARNING
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+# Fraction of requests whose DEBUG/INFO records are emitted; warnings and
+# errors are always kept
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+
+# Patterns scrubbed from every log line
+REDACT_PATTERNS = [
+    (re.compile(r'(Bearer\s+)[A-Za-z0-9\-_.=:+/]+'), r'\1[REDACTED]'),
+    (re.compile(r'pdl_(live|sdbx)_[A-Za-z0-9_]+'), 'pdl_[REDACTED]'),
+    (re.compile(r'(["\']?(?:authorization|api_key|apikey|secret|password|token|private_key)["\']?\s*[:=]\s*["\']?)[^"\',\s}]+', re.IGNORECASE), r'\1[REDACTED]'),
+]
+
+_request_sampled = contextvars.ContextVar('request_sampled', default=True)
+_request_id = contextvars.ContextVar('request_id', default=None)
+_configured = False
+
+def redact(text):
+    """Remove credentials from a log message"""
+    for pattern, replacement in REDACT_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text
+
+class lazy_json:
+    """Defer json.dumps of a log argument until the record is actually emitted"""
+
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return json.dumps(self.value, default=str)
+
+class SamplingFilter(logging.Filter):
+    """Drop DEBUG/INFO records for requests that were not sampled; metric records are always kept"""
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or _request_sampled.get() or hasattr(record, 'metric')
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with secrets redacted"""
+
+    def format(self, record):
+        entry = {
+            'ts': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': redact(record.getMessage())
+        }
+        request_id = _request_id.get()
+        if request_id:
+            entry['request_id'] = request_id
+        if hasattr(record, 'metric'):
+            entry['metric'] = record.metric
+        if record.exc_info:
+            entry['exc'] = redact(self.formatException(record.exc_info))
+        return json.dumps(entry, default=str)
+
+def configure_logging():
+    """Install the JSON handler on the root logger once per process"""
+    global _configured
+    if _configured:
+        return
+    _configured = True
+
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter())
+    handler.addFilter(SamplingFilter())
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+
+def get_logger(name):
+    configure_logging()
+    return logging.getLogger(name)
+
+def start_request():
+    """Tag the current request's log lines with an id and decide whether its DEBUG/INFO logs are emitted"""
+    _request_id.set(uuid.uuid4().hex[:16])
+    _request_sampled.set(LOG_SAMPLE_RATE >= 1 or random.random() < LOG_SAMPLE_RATE)
@@ -0,0 +1,27 @@
+import hmac
+from .base_handler import JsonHandler, HttpError
+from .telemetry import METRICS_ENABLED, METRICS_TOKEN, render
+
+class handler(JsonHandler):
+    route = '/api/metrics'
+    require_auth = False
+
+    def get(self):
+        """Expose this instance's metrics in Prometheus text format.
+
+        Only covers measurements taken by the instance of this function that
+        serves the request; other functions and instances are not included.
+        Use METRICS_LOG_ENABLED for fleet-wide metrics.
+        """
+        if not METRICS_TOKEN:
+            raise HttpError(503, 'Metrics authentication is not configured')
+        auth_header = self.headers.get('Authorization', '')
+        if not hmac.compare_digest(auth_header, f"Bearer {METRICS_TOKEN}"):
+            raise HttpError(401, 'Unauthorized')
+
+        if not METRICS_ENABLED:
+            raise HttpError(404, 'Metrics are disabled')
+
+        self.send_body(200, render().encode(), 'text/plain; version=0.0.4; charset=utf-8', {
+            'Cache-Control': 'no-store'
+        })
@@ -1,43 +1,22 @@
-import os
-import requests
-from dotenv import load_dotenv
+from urllib.parse import parse_qs, urlparse
+from . import paddle_client
+from .logging_config import get_logger
 
-# Load environment variables - Vercel will use environment variables from settings
-load_dotenv()
-
-# Paddle API configuration from environment variables (secure)
-API_KEY = os.getenv("PADDLE_API_KEY")
-API_BASE_URL = os.getenv("PADDLE_API_BASE_URL", "https://api.paddle.com")
-
-# Headers for authentication
-headers = {
-    "Authorization": f"Bearer {API_KEY}",
-    "Content-Type": "application/json"
-}
+logger = get_logger(__name__)
 
 def get_customer_by_email(email):
     """Retrieve customer information using email address"""
-    print(f"Looking up customer with email: {email}")
+    logger.debug("Looking up customer with email: %s", email)
     
-    # The Paddle API might require exact parameter formatting
-    # url = f'{API_BASE_URL}/customers'
-    url = f'{API_BASE_URL.rstrip("/")}/customers'
     params = {
         'email': email,
         'status': 'active'  # Only look for active customers
     }
     
-    print(f"API URL: {url}")
-    print(f"Headers: {headers}")
-    
     try:
-        response = requests.get(
-            url,
-            headers=headers,
-            params=params
-        )
+        response = paddle_client.get('/customers', params=params)
         
-        print(f"Response status: {response.status_code}")
+        logger.debug("Response status: %s", response.status_code)
         
         if response.status_code == 200:
             data = response.json()
@@ -46,24 +25,23 @@ def get_customer_by_email(email):
             if customers:
                 # Return the first matching customer
                 customer = customers[0]
-                print(f"Found customer ID: {customer.get('id')}")
+                logger.debug("Found customer ID: %s", customer.get('id'))
                 return customer
             else:
-                print("No customers found with this email")
+                logger.info("No customers found with this email")
         else:
-            print(f"API Error: {response.status_code} - {response.text}")
+            logger.error("API Error: %s - %s", response.status_code, response.text)
             
     except Exception as e:
-        print(f"Exception: {str(e)}")
+        logger.error("Exception: %s", e)
     
     return None
 
 
 def get_subscriptions(customer_id):
     """Get all subscriptions for a customer"""
-    response = requests.get(
-        f'{API_BASE_URL}/subscriptions',
-        headers=headers,
+    response = paddle_client.get(
+        '/subscriptions',
         params={'customer_id': customer_id}
     )
     if response.status_code == 200:
@@ -72,20 +50,14 @@ def get_subscriptions(customer_id):
 
 def get_subscription_details(subscription_id):
     """Get detailed information about a specific subscription"""
-    response = requests.get(
-        f'{API_BASE_URL}/subscriptions/{subscription_id}',
-        headers=headers
-    )
+    response = paddle_client.get(f'/subscriptions/{subscription_id}')
     if response.status_code == 200:
         return response.json()['data']
     return None
 
 def get_license_keys(subscription_id):
     """Get license keys for a subscription"""
-    response = requests.get(
-        f'{API_BASE_URL}/subscriptions/{subscription_id}/license-keys',
-        headers=headers
-    )
+    response = paddle_client.get(f'/subscriptions/{subscription_id}/license-keys')
     if response.status_code == 200:
         return response.json()['data']
     return []
@@ -102,11 +74,7 @@ def create_subscription(customer_id, price_id):
         ]
     }
     
-    response = requests.post(
-        f'{API_BASE_URL}/subscriptions',
-        headers=headers,
-        json=payload
-    )
+    response = paddle_client.post('/subscriptions', json=payload)
     
     if response.status_code == 201:
         return response.json()['data']
@@ -117,79 +85,98 @@ def cancel_subscription(subscription_id, immediate=False):
     payload = {
         "effective_from": "immediately" if immediate else "next_billing_period"
     }
-    response = requests.post(
-        f'{API_BASE_URL}/subscriptions/{subscription_id}/cancel',
-        headers=headers,
-        json=payload
-    )
+    response = paddle_client.post(f'/subscriptions/{subscription_id}/cancel', json=payload)
     return response.status_code == 200
 
 def get_transactions(customer_id, limit=10):
     """Get transaction history for a customer"""
-    response = requests.get(
-        f'{API_BASE_URL}/transactions',
-        headers=headers,
+    response = paddle_client.get(
+        '/transactions',
         params={'customer_id': customer_id, 'per_page': limit}
     )
     if response.status_code == 200:
         return response.json()['data']
     return []
 
-def validate_license(license_key, device_id):
-    """Validate a license key against Paddle's records"""
-    # This is a simplified example - in a real implementation you would
-    # check the license key against your database or Paddle's API
+def get_transactions_page(customer_id, per_page=50, after=None, billed_since=None, statuses=('completed', 'billed')):
+    """Get one page of a customer's transactions, newest first.
+
+    Returns (transactions, next_after) where next_after is the Paddle id to
+    pass as 'after' for the following page, or (None, None) on API errors.
+    """
+    params = {
+        'customer_id': customer_id,
+        'status': ','.join(statuses),
+        'order_by': 'id[DESC]',  # Paddle ids are time-ordered
+        'per_page': per_page
+    }
+    if billed_since:
+        params['billed_at[GTE]'] = billed_since.strftime('%Y-%m-%dT%H:%M:%SZ')
+    if after:
+        params['after'] = after
+    
+    response = paddle_client.get('/transactions', params=params)
+    if response.status_code != 200:
+        logger.error("Paddle API error: %s - %s", response.status_code, response.text)
+        return None, None
     
-    # For example, first look up subscriptions by license key
-    # Here we simulate a successful validation
-    return {
-        "valid": True,
-        "tier": "premium",
-        "features": ["feature1", "feature2", "feature3"],
-        "message": "License validated successfully"
+    data = response.json()
+    pagination = data.get('meta', {}).get('pagination', {})
+    next_after = None
+    if pagination.get('has_more') and pagination.get('next'):
+        next_after = parse_qs(urlparse(pagination['next']).query).get('after', [None])[0]
+    return data.get('data', []), next_after
+
+def get_events_page(after=None, per_page=50, event_types=None):
+    """Get one page of Paddle events, oldest first.
+
+    Returns (events, next_after) like get_transactions_page, or (None, None)
+    on API errors. Paddle keeps events for 90 days.
+    """
+    params = {
+        'order_by': 'id[ASC]',
+        'per_page': per_page
     }
+    if event_types:
+        params['event_type'] = ','.join(event_types)
+    if after:
+        params['after'] = after
+    
+    response = paddle_client.get('/events', params=params)
+    if response.status_code != 200:
+        logger.error("Paddle API error: %s - %s", response.status_code, response.text)
+        return None, None
+    
+    data = response.json()
+    pagination = data.get('meta', {}).get('pagination', {})
+    next_after = None
+    if pagination.get('has_more') and pagination.get('next'):
+        next_after = parse_qs(urlparse(pagination['next']).query).get('after', [None])[0]
+    return data.get('data', []), next_after
 
 def update_customer_name(customer_id, name):
     """Update the customer's name in Paddle"""
-    print(f"Updating name for customer {customer_id} to '{name}'")
+    logger.info("Updating name for customer %s to '%s'", customer_id, name)
     
     try:
-        api_key = os.environ.get("PADDLE_API_KEY")
-        api_base_url = os.environ.get("PADDLE_API_BASE_URL", "https://api.paddle.com")
-        
-        # Fix the double slash issue
-        api_base_url = api_base_url.rstrip('/')
-        
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json",
-        }
-        
         # Only send the name field in the request
         data = {
             "name": name
         }
         
-        url = f'{api_base_url}/customers/{customer_id}'
-        print(f"Making request to: {url}")
-        
-        response = requests.patch(
-            url,
-            headers=headers,
-            json=data
-        )
+        response = paddle_client.patch(f'/customers/{customer_id}', json=data)
         
-        print(f"Response status code: {response.status_code}")
+        logger.debug("Response status code: %s", response.status_code)
         if response.status_code >= 400:
-            print(f"Response body: {response.text}")
+            logger.debug("Response body: %s", response.text)
 
         if response.status_code in [200, 201, 202, 204]:
-            print(f"Successfully updated customer name in Paddle")
+            logger.info("Successfully updated customer name in Paddle")
             return True
         else:
-            print(f"Failed to update customer name: {response.status_code} - {response.text}")
+            logger.error("Failed to update customer name: %s - %s", response.status_code, response.text)
             return False
             
     except Exception as e:
-        print(f"Exception updating customer name: {str(e)}")
+        logger.error("Exception updating customer name: %s", e)
         return False
\ No newline at end of file
@@ -0,0 +1,148 @@
+import os
+import time
+import re
+import random
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+from .telemetry import timer, inc
+
+# Load environment variables - Vercel will use environment variables from settings
+load_dotenv()
+
+# Paddle API configuration from environment variables (secure)
+API_KEY = os.getenv("PADDLE_API_KEY")
+API_BASE_URL = os.getenv("PADDLE_API_BASE_URL", "https://api.paddle.com").rstrip('/')
+
+# Timeouts in seconds: (connect, read)
+CONNECT_TIMEOUT = float(os.getenv("PADDLE_CONNECT_TIMEOUT", "3.05"))
+READ_TIMEOUT = float(os.getenv("PADDLE_READ_TIMEOUT", "10"))
+
+# Retry policy for rate limits and transient server errors
+MAX_RETRIES = int(os.getenv("PADDLE_MAX_RETRIES", "2"))
+RETRY_BACKOFF = 0.25  # Base delay, doubled on every attempt
+RETRY_MAX_DELAY = 4.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'PATCH', 'DELETE'}
+
+# Optional cap on requests per second from this process, for bulk jobs that
+# must stay under Paddle's per-minute quota. 0 disables it.
+RATE_LIMIT = float(os.getenv("PADDLE_RATE_LIMIT", "0"))
+
+# Paddle ids in paths are collapsed so metrics are labelled per endpoint
+ID_SEGMENT = re.compile(r'/[a-z]+_[0-9a-z]{16,}')
+
+# One pooled session per warm instance so TLS connections are reused
+_session = None
+
+# Earliest monotonic time the next rate-limited request may start
+_next_slot = 0.0
+_rate_lock = threading.Lock()
+
+def build_headers():
+    """Headers sent with every Paddle API request"""
+    return {
+        "Authorization": f"Bearer {API_KEY}",
+        "Content-Type": "application/json",
+        "Accept": "application/json"
+    }
+
+def build_url(path):
+    """Build a full Paddle API URL from a path like '/customers/ctm_123'"""
+    return f'{API_BASE_URL}/{path.lstrip("/")}'
+
+def get_session():
+    """Return the shared keep-alive session, creating it on first use"""
+    global _session
+    if _session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update(build_headers())
+        _session = session
+    return _session
+
+def endpoint_name(path):
+    """Metric label for a path, e.g. '/customers/ctm_01h...' -> '/customers/{id}'"""
+    return ID_SEGMENT.sub('/{id}', '/' + path.lstrip('/'))
+
+def set_rate_limit(per_second):
+    """Cap Paddle requests from this process at per_second (0 disables the cap)"""
+    global RATE_LIMIT
+    RATE_LIMIT = float(per_second or 0)
+
+def _throttle():
+    """Wait for the next request slot when a rate limit is set; shared by all threads"""
+    global _next_slot
+    if RATE_LIMIT <= 0:
+        return
+    with _rate_lock:
+        now = time.monotonic()
+        slot = max(now, _next_slot)
+        _next_slot = slot + 1.0 / RATE_LIMIT
+    if slot > now:
+        time.sleep(slot - now)
+
+def _retry_delay(attempt, retry_after=None):
+    """Exponential backoff with full jitter, honouring Retry-After when present"""
+    if retry_after:
+        try:
+            return min(float(retry_after), RETRY_MAX_DELAY)
+        except ValueError:
+            pass
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BACKOFF * (2 ** attempt)))
+
+def request(method, path, params=None, json=None, headers=None):
+    """Send a request to the Paddle API and return the response.
+
+    429 responses are always retried since Paddle did not process them.
+    5xx responses and connection errors are only retried for idempotent
+    methods so a POST is never applied twice.
+    """
+    method = method.upper()
+    retry_errors = method in IDEMPOTENT_METHODS
+    url = build_url(path)
+    session = get_session()
+
+    endpoint = endpoint_name(path)
+    with timer('paddle_request_duration_seconds', endpoint=endpoint, method=method) as t:
+        attempt = 0
+        while True:
+            _throttle()
+            try:
+                response = session.request(
+                    method,
+                    url,
+                    params=params,
+                    json=json,
+                    headers=headers,
+                    timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)
+                )
+            except (requests.ConnectionError, requests.Timeout):
+                if not retry_errors or attempt >= MAX_RETRIES:
+                    raise
+                inc('paddle_retries_total', endpoint=endpoint, method=method, reason='connection')
+                time.sleep(_retry_delay(attempt))
+                attempt += 1
+                continue
+
+            status = response.status_code
+            should_retry = status == 429 or (retry_errors and status in RETRY_STATUSES)
+            if not should_retry or attempt >= MAX_RETRIES:
+                t.labels['status'] = status
+                return response
+
+            inc('paddle_retries_total', endpoint=endpoint, method=method, reason=status)
+            time.sleep(_retry_delay(attempt, response.headers.get('Retry-After')))
+            attempt += 1
+
+def get(path, params=None, headers=None):
+    return request('GET', path, params=params, headers=headers)
+
+def post(path, json=None, headers=None):
+    return request('POST', path, json=json, headers=headers)
+
+def patch(path, json=None, headers=None):
+    return request('PATCH', path, json=json, headers=headers)
@@ -0,0 +1,100 @@
+class LineItem:
+    """One price on a subscription or transaction; amounts are integer minor units"""
+
+    __slots__ = ('price_id', 'name', 'unit_amount', 'quantity', 'interval')
+
+    def __init__(self, price_id, name, unit_amount, quantity, interval):
+        self.price_id = price_id
+        self.name = name
+        self.unit_amount = unit_amount
+        self.quantity = quantity
+        self.interval = interval
+
+class PaddleEvent:
+    """A webhook delivery parsed once into the fields the handlers use.
+
+    `data` and `webhook_data` keep the raw payload for mirroring and debug
+    documents.
+    """
+
+    __slots__ = (
+        'event_id', 'event_type', 'id', 'customer_id', 'subscription_id',
+        'transaction_id', 'status', 'origin', 'currency', 'created_at',
+        'next_billed_at', 'previously_billed_at', 'items', 'data', 'webhook_data'
+    )
+
+    def __init__(self, webhook_data):
+        data = webhook_data.get('data') or {}
+        self.webhook_data = webhook_data
+        self.data = data
+        self.event_id = webhook_data.get('event_id')
+        self.event_type = webhook_data.get('event_type', '')
+        self.id = data.get('id')
+        self.customer_id = data.get('customer_id')
+        self.subscription_id = data.get('subscription_id')
+        self.transaction_id = data.get('transaction_id')
+        self.status = data.get('status') or ''
+        self.origin = data.get('origin')
+        self.currency = data.get('currency_code', 'USD')
+        self.created_at = data.get('created_at')
+        self.next_billed_at = data.get('next_billed_at')
+        self.previously_billed_at = data.get('previously_billed_at')
+        self.items = [parse_item(item) for item in _raw_items(data)]
+
+    @property
+    def first_item(self):
+        return self.items[0] if self.items else None
+
+    @property
+    def price_id(self):
+        item = self.first_item
+        return item.price_id if item else None
+
+    @property
+    def plan_name(self):
+        item = self.first_item
+        return (item.name if item else None) or 'Unknown Plan'
+
+    @property
+    def price_amount(self):
+        """Unit price of the first item in minor units"""
+        item = self.first_item
+        return item.unit_amount if item else 0
+
+    @property
+    def interval(self):
+        item = self.first_item
+        return (item.interval if item else None) or 'month'
+
+def _raw_items(data):
+    """Items live under items, line_items or details.line_items depending on the event"""
+    return (
+        data.get('items')
+        or data.get('line_items')
+        or (data.get('details') or {}).get('line_items')
+        or []
+    )
+
+def minor_units(unit_price):
+    """Read a unit_price given as {'amount': '1000'} or a bare number/string"""
+    if isinstance(unit_price, dict):
+        unit_price = unit_price.get('amount')
+    try:
+        return int(unit_price or 0)
+    except (TypeError, ValueError):
+        return 0
+
+def parse_item(item):
+    price = item.get('price') or {}
+    billing_cycle = price.get('billing_cycle') or {}
+    return LineItem(
+        price_id=price.get('id') or item.get('price_id'),
+        name=price.get('description') or price.get('name'),
+        unit_amount=minor_units(price.get('unit_price') or item.get('unit_price')),
+        quantity=int(item.get('quantity') or 1),
+        interval=billing_cycle.get('interval')
+    )
+
+def parse_event(webhook_data):
+    """Normalize a webhook body into a PaddleEvent"""
+    return PaddleEvent(webhook_data or {})
@@ -0,0 +1,219 @@
+import os
+import sys
+import json
+import argparse
+import datetime
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from .firebase_client import initialize_firebase
+from .logging_config import get_logger
+from . import paddle_client
+from .paddle_api import get_events_page
+from .paddle_webhook import process_event
+from .webhook_ledger import LEDGER_RETENTION_DAYS
+
+logger = get_logger(__name__)
+
+# Replay Paddle events through the webhook handlers, e.g. after an outage:
+#   python -m api.paddle_replay --after evt_01h... --checkpoint replay.json
+#   python -m api.paddle_replay --ndjson events.ndjson --concurrency 8 --rate 3
+# Events already in the webhook ledger are skipped, so a replay can be re-run
+# or resumed safely. Events older than the ledger retention are never
+# replayed, since their entries may have expired. API replays need --after.
+# Set PADDLE_API_BASE_URL and FIRESTORE_EMULATOR_HOST to point it at a stub
+# Paddle server and the Firestore emulator.
+
+REPLAY_PAGE_SIZE = int(os.getenv("PADDLE_REPLAY_PAGE_SIZE", "50"))
+REPLAY_CONCURRENCY = int(os.getenv("PADDLE_REPLAY_CONCURRENCY", "4"))
+
+# Paddle allows 240 API requests per minute per IP; stay well under it by default
+REPLAY_RATE_LIMIT = float(os.getenv("PADDLE_REPLAY_RATE_LIMIT", "2"))
+
+class Checkpoint:
+    """Replay progress stored as JSON so an interrupted run can resume.
+
+    `cursor` is the Paddle event id (API source) or line number (NDJSON
+    source) up to which every event has been attempted.
+    """
+
+    def __init__(self, path, source):
+        self.path = path
+        self.source = source
+        self.cursor = None
+        self.stats = {'replayed': 0, 'duplicates': 0, 'failed': 0, 'filtered': 0, 'too_old': 0}
+
+        if path and os.path.exists(path):
+            with open(path) as f:
+                saved = json.load(f)
+            if saved.get('source') != source:
+                raise ValueError(f"Checkpoint {path} belongs to source {saved.get('source')!r}, not {source!r}")
+            self.cursor = saved.get('cursor')
+            self.stats.update(saved.get('stats') or {})
+
+    def save(self, cursor):
+        self.cursor = cursor
+        if not self.path:
+            return
+        # Write then rename so a crash never leaves a truncated checkpoint
+        temp_path = f'{self.path}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({'source': self.source, 'cursor': cursor, 'stats': self.stats}, f)
+        os.replace(temp_path, self.path)
+
+def paddle_event_pages(after=None, page_size=REPLAY_PAGE_SIZE, event_types=None):
+    """Yield (events, cursor) pages from Paddle's events API, oldest first"""
+    while True:
+        events, next_after = get_events_page(after=after, per_page=page_size, event_types=event_types)
+        if events is None:
+            raise RuntimeError('Paddle events API request failed')
+        if events:
+            after = events[-1].get('event_id')
+            yield events, after
+        if not next_after:
+            return
+
+def ndjson_event_pages(path, start=0, page_size=REPLAY_PAGE_SIZE):
+    """Yield (events, cursor) pages from an NDJSON file of webhook bodies; cursor is a line number"""
+    page = []
+    line_number = 0
+    with open(path) as f:
+        for line_number, line in enumerate(f, start=1):
+            if line_number <= start or not line.strip():
+                continue
+            page.append(json.loads(line))
+            if len(page) >= page_size:
+                yield page, line_number
+                page = []
+    if page:
+        yield page, line_number
+
+def replay_cutoff(now=None):
+    """Oldest occurred_at that is still covered by the webhook ledger"""
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    # Keep a day of margin so an entry cannot expire while the replay runs
+    return now - datetime.timedelta(days=LEDGER_RETENTION_DAYS - 1)
+
+def is_within_retention(event, cutoff):
+    """True if the event's ledger entry, if any, is guaranteed to still exist"""
+    occurred_at = event.get('occurred_at')
+    if not occurred_at:
+        return False
+    try:
+        return datetime.datetime.fromisoformat(occurred_at.replace('Z', '+00:00')) >= cutoff
+    except ValueError:
+        return False
+
+def _ordering_key(event):
+    data = event.get('data') or {}
+    return data.get('customer_id') or data.get('subscription_id') or event.get('event_id')
+
+def partition_events(events):
+    """Group a page by customer so one customer's events keep their order"""
+    groups = OrderedDict()
+    for event in events:
+        groups.setdefault(_ordering_key(event), []).append(event)
+    return list(groups.values())
+
+def _replay_group(events, apply):
+    """Apply a customer's events in order and return (event, outcome) pairs"""
+    outcomes = []
+    for event in events:
+        try:
+            result = apply(event)
+        except Exception as e:
+            logger.exception("Replay of event %s failed: %s", event.get('event_id'), e)
+            outcomes.append((event, 'failed'))
+            continue
+        if not result.get('success'):
+            outcomes.append((event, 'failed'))
+        elif result.get('duplicate'):
+            outcomes.append((event, 'duplicates'))
+        else:
+            outcomes.append((event, 'replayed'))
+    return outcomes
+
+def replay(pages, checkpoint, concurrency=REPLAY_CONCURRENCY, event_types=None, apply=process_event,
+           failed_path=None, dry_run=False):
+    """Replay pages of webhook bodies, saving the checkpoint after every page.
+
+    Pages run one after another; within a page, different customers are
+    replayed concurrently. Failed events are appended to failed_path as
+    NDJSON so they can be replayed again with --ndjson. Events older than
+    the ledger retention (or without occurred_at) are skipped: applying
+    one again could mint a second license or reset credits.
+    """
+    stats = checkpoint.stats
+    cutoff = replay_cutoff()
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+        for events, cursor in pages:
+            selected = [event for event in events if not event_types or event.get('event_type') in event_types]
+            stats['filtered'] += len(events) - len(selected)
+
+            recent = [event for event in selected if is_within_retention(event, cutoff)]
+            if len(recent) < len(selected):
+                stats['too_old'] += len(selected) - len(recent)
+                logger.warning("Skipped %s events older than the %s-day ledger retention",
+                               len(selected) - len(recent), LEDGER_RETENTION_DAYS)
+            selected = recent
+
+            if dry_run:
+                for event in selected:
+                    print(json.dumps({'event_id': event.get('event_id'), 'event_type': event.get('event_type')}))
+                checkpoint.cursor = cursor
+                continue
+
+            failed = []
+            groups = partition_events(selected)
+            for outcomes in executor.map(lambda group: _replay_group(group, apply), groups):
+                for event, outcome in outcomes:
+                    stats[outcome] += 1
+                    if outcome == 'failed':
+                        failed.append(event)
+
+            if failed and failed_path:
+                with open(failed_path, 'a') as f:
+                    for event in failed:
+                        f.write(json.dumps(event) + '\n')
+
+            checkpoint.save(cursor)
+            logger.info("Replayed page up to %s: %s", cursor, stats)
+    return stats
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay Paddle events through the webhook handlers')
+    parser.add_argument('--ndjson', help='Read webhook bodies from this NDJSON file instead of the Paddle events API')
+    parser.add_argument('--after', help="Start after this Paddle event id; required for the API source unless resuming")
+    parser.add_argument('--checkpoint', help='JSON file used to save and resume progress')
+    parser.add_argument('--failed', help='Append events that fail to this NDJSON file')
+    parser.add_argument('--event-type', action='append', dest='event_types', help='Only replay this event type (repeatable)')
+    parser.add_argument('--concurrency', type=int, default=REPLAY_CONCURRENCY, help='Customers replayed in parallel')
+    parser.add_argument('--rate', type=float, default=REPLAY_RATE_LIMIT, help='Max Paddle API requests per second (0 for no limit)')
+    parser.add_argument('--page-size', type=int, default=REPLAY_PAGE_SIZE)
+    parser.add_argument('--dry-run', action='store_true', help='List the events that would be replayed')
+    args = parser.parse_args(argv)
+
+    source = os.path.abspath(args.ndjson) if args.ndjson else 'paddle'
+    checkpoint = Checkpoint(args.checkpoint, source)
+    if checkpoint.cursor is not None:
+        logger.info("Resuming %s from %s", source, checkpoint.cursor)
+    elif not args.ndjson and not args.after:
+        parser.error('--after is required when replaying from the Paddle events API')
+
+    paddle_client.set_rate_limit(args.rate)
+    if args.ndjson:
+        pages = ndjson_event_pages(args.ndjson, start=checkpoint.cursor or 0, page_size=args.page_size)
+    else:
+        pages = paddle_event_pages(after=checkpoint.cursor or args.after, page_size=args.page_size,
+                                   event_types=args.event_types)
+
+    if not args.dry_run and not initialize_firebase():
+        logger.error("Firebase is not available")
+        return 1
+
+    stats = replay(pages, checkpoint, concurrency=args.concurrency, event_types=args.event_types,
+                   failed_path=args.failed, dry_run=args.dry_run)
+    print(json.dumps({'cursor': checkpoint.cursor, **stats}))
+    return 1 if stats['failed'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
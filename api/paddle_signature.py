@@ -0,0 +1,48 @@
+import os
+import re
+import hmac
+import time
+import hashlib
+
+# Paddle notification secret keys. Several comma-separated keys may be active
+# while a secret is being rotated.
+PADDLE_WEBHOOK_SECRETS = [secret.strip() for secret in os.getenv("PADDLE_WEBHOOK_SECRET", "").split(',') if secret.strip()]
+
+# Maximum age in seconds of a signature timestamp, to reject replayed requests
+PADDLE_WEBHOOK_TOLERANCE = int(os.getenv("PADDLE_WEBHOOK_TOLERANCE", "300"))
+
+# h1 is a hex-encoded HMAC-SHA256; anything else cannot match and is dropped
+# before compare_digest, which raises TypeError on non-ASCII strings
+SIGNATURE_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+def verify_paddle_signature(signature_header, raw_body, secrets=None, now=None):
+    """Check a Paddle-Signature header ("ts=...;h1=...") against the raw request body"""
+    secrets = PADDLE_WEBHOOK_SECRETS if secrets is None else secrets
+    if not signature_header or not secrets:
+        return False
+
+    timestamp = None
+    signatures = []
+    for part in signature_header.split(';'):
+        key, _, value = part.strip().partition('=')
+        if key == 'ts':
+            timestamp = value
+        elif key == 'h1' and SIGNATURE_PATTERN.match(value):
+            signatures.append(value)
+
+    try:
+        signed_at = int(timestamp)
+    except (TypeError, ValueError):
+        return False
+
+    now = time.time() if now is None else now
+    if abs(now - signed_at) > PADDLE_WEBHOOK_TOLERANCE or not signatures:
+        return False
+
+    signed_payload = timestamp.encode() + b':' + raw_body
+    for secret in secrets:
+        expected = hmac.new(secret.encode(), signed_payload, hashlib.sha256).hexdigest()
+        for signature in signatures:
+            if hmac.compare_digest(expected, signature):
+                return True
+    return False
@@ -1,8 +1,6 @@
-from http.server import BaseHTTPRequestHandler
-import json
 import os
 from dotenv import load_dotenv
-from .auth import verify_token
+from .base_handler import JsonHandler
 
 # Load environment variables
 load_dotenv()
@@ -10,46 +8,11 @@ load_dotenv()
 # Get client token from environment variable
 PADDLE_CLIENT_TOKEN = os.getenv("PADDLE_CLIENT_TOKEN")
 
-class handler(BaseHTTPRequestHandler):
-    def do_GET(self):
-        # Set CORS headers
-        self.send_response(200)
-        self.send_header('Content-Type', 'application/json')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
-        self.end_headers()
-        
-        # Get authorization token
-        auth_header = self.headers.get('Authorization')
-        token = None
-        
-        if auth_header and auth_header.startswith('Bearer '):
-            token = auth_header[7:]
-        
-        if not token:
-            self.wfile.write(json.dumps({
-                'error': 'Authorization token required'
-            }).encode())
-            return
-        
-        # Verify token
-        user_data = verify_token(token)
-        if not user_data:
-            self.wfile.write(json.dumps({
-                'error': 'Invalid or expired token'
-            }).encode())
-            return
-        
+class handler(JsonHandler):
+    route = '/api/paddle_token'
+
+    def get(self):
         # Send Paddle client token
-        self.wfile.write(json.dumps({
+        return {
             'clientToken': PADDLE_CLIENT_TOKEN
-        }).encode())
-        
-    def do_OPTIONS(self):
-        # Handle preflight requests
-        self.send_response(200)
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
-        self.end_headers()
\ No newline at end of file
+        }
@@ -1,24 +1,32 @@
 import json
-import hmac
-import hashlib
 import os
 import uuid
 import datetime
-import requests
-import firebase_admin
-from firebase_admin import credentials, firestore
 import traceback
-import logging
-from http.server import BaseHTTPRequestHandler
-from .paddle_api import update_customer_name
+from .base_handler import JsonHandler, HttpError
+from .logging_config import get_logger, lazy_json
+from . import paddle_client
+from .dashboard_cache import invalidate_dashboard
+from .firebase_client import initialize_firebase, get_db
+from .webhook_ledger import is_event_processed, mark_event_processed, remember_event
+from .credit_ledger import add_credits, reset_credits
+from .webhook_queue import get_queue
+from .transaction_mirror import upsert_transaction
+from .paddle_events import parse_event
+from .paddle_signature import PADDLE_WEBHOOK_SECRETS, verify_paddle_signature
+from .customer_name_sync import request_name_sync
+from .license_store import save_license, update_license, revoke_license, invalidate_license
+from .telemetry import firestore_op
+from .customer_map import (
+    UNKNOWN_CUSTOMER,
+    get_cached_user_id,
+    get_mapped_user_id,
+    save_customer_mapping,
+    remember_unknown_customer
+)
 
 # Set up logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-logger = logging.getLogger(__name__)
-
-# Initialize Firebase
-firebase_initialized = False
-db = None
+logger = get_logger(__name__)
 
 # Credit allocation maps
 SUBSCRIPTION_CREDIT_MAP = {
@@ -35,34 +43,87 @@ CREDIT_PURCHASE_MAP = {
 
 CREDIT_PRODUCT_IDS = list(CREDIT_PURCHASE_MAP.keys())
 
-def initialize_firebase():
-    """Initialize Firebase connection"""
-    global firebase_initialized, db
-    if firebase_initialized:
-        return True
-        
-    try:
-        # Parse the Firebase service account JSON
-        firebase_credentials_json = os.environ.get("FIREBASE_SERVICE_ACCOUNT")
-        if not firebase_credentials_json:
-            logger.error("Firebase credentials not found in environment variables")
-            return False
-            
-        firebase_credentials_dict = json.loads(firebase_credentials_json)
-        cred = credentials.Certificate(firebase_credentials_dict)
-        
-        # Initialize the Firebase app
-        if not firebase_admin._apps:
-            firebase_admin.initialize_app(cred)
-        
-        db = firestore.client()
-        firebase_initialized = True
-        logger.info("Firebase initialized successfully")
-        return True
-    except Exception as e:
-        logger.error(f"Firebase initialization error: {e}")
-        logger.error(traceback.format_exc())
-        return False
+# 'sync' processes events inside the request; 'queue' persists them for webhook_worker
+# (queue mode needs a sub-daily worker cron; see webhook_worker)
+WEBHOOK_PROCESSING_MODE = os.getenv("WEBHOOK_PROCESSING_MODE", "sync")
+
+# event_type -> handler(event, writes); filled in by @on_event below
+EVENT_HANDLERS = {}
+
+def on_event(*event_types):
+    """Register a handler for one or more Paddle event types"""
+    def register(func):
+        for event_type in event_types:
+            EVENT_HANDLERS[event_type] = func
+        return func
+    return register
+
+class StagedBatch:
+    """Records WriteBatch calls so they can be applied to a real batch later"""
+
+    def __init__(self):
+        self.ops = []
+
+    def set(self, *args, **kwargs):
+        self.ops.append(('set', args, kwargs))
+
+    def update(self, *args, **kwargs):
+        self.ops.append(('update', args, kwargs))
+
+    def create(self, *args, **kwargs):
+        self.ops.append(('create', args, kwargs))
+
+    def delete(self, *args, **kwargs):
+        self.ops.append(('delete', args, kwargs))
+
+    def apply(self, batch):
+        for name, args, kwargs in self.ops:
+            getattr(batch, name)(*args, **kwargs)
+
+class EventWrites:
+    """Firestore writes staged by one webhook event and committed as a single batch.
+
+    Handlers stage into `batch`, and credit changes (with the records that
+    describe them) into `credit_batch`. Cache invalidations registered with
+    after_commit only run once the writes are visible.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.batch = StagedBatch()
+        self.credit_batch = StagedBatch()
+        self._callbacks = []
+
+    def after_commit(self, func, *args):
+        self._callbacks.append((func, args))
+
+    def _commit(self, *staged):
+        batch = self.db.batch()
+        for writes in staged:
+            writes.apply(batch)
+        with firestore_op('webhook_events', 'commit'):
+            batch.commit()
+
+    def commit(self):
+        """Commit the staged writes. Returns False if the event had already been applied."""
+        from google.api_core.exceptions import AlreadyExists
+        try:
+            self._commit(self.batch, self.credit_batch)
+            applied = True
+        except AlreadyExists:
+            # Either the ledger entry exists (a concurrent delivery) or the credit
+            # source was applied by an earlier event for the same transaction
+            applied = False
+            if self.credit_batch.ops:
+                try:
+                    self._commit(self.batch)
+                    applied = True
+                except AlreadyExists:
+                    pass
+
+        for func, args in self._callbacks:
+            func(*args)
+        return applied
 
 def generate_license_key():
     """Generate a unique license key"""
@@ -83,24 +144,11 @@ def is_credit_product(price_id):
 def get_customer_details(customer_id):
     """Get customer details from Paddle API using customer ID"""
     try:
-        api_key = os.environ.get("PADDLE_API_KEY")
-        api_base_url = os.environ.get("PADDLE_API_BASE_URL", "https://api.paddle.com")
-        
-        # Fix the double slash issue
-        api_base_url = api_base_url.rstrip('/')
-        
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json",
-            "Accept": "application/json"
-        }
-        
         # Get customer directly with customer ID
-        url = f"{api_base_url}/customers/{customer_id}"
-        logger.info(f"Fetching customer details from: {url}")
+        logger.debug("Fetching customer details for: %s", customer_id)
         
-        response = requests.get(url, headers=headers)
-        logger.info(f"Response status: {response.status_code}")
+        response = paddle_client.get(f'/customers/{customer_id}')
+        logger.debug("Response status: %s", response.status_code)
         
         if response.status_code == 200:
             data = response.json()
@@ -112,11 +160,10 @@ def get_customer_details(customer_id):
                 'name': customer_data.get('name')
             }
         
-        logger.error(f"Failed to get customer data: {response.status_code}")
+        logger.error("Failed to get customer data: %s", response.status_code)
         return None
     except Exception as e:
-        logger.error(f"Error getting customer details: {e}")
-        logger.error(traceback.format_exc())
+        logger.exception("Error getting customer details: %s", e)
         return None
 
 def find_user_by_email(email):
@@ -124,26 +171,25 @@ def find_user_by_email(email):
     if not email or not initialize_firebase():
         return None, None
     
-    logger.info(f"Looking for user with email: {email}")
+    logger.debug("Looking for user with email: %s", email)
     
     try:
         # Try exact match first
-        users_ref = db.collection('users')
+        users_ref = get_db().collection('users')
         email_query = users_ref.where('email', '==', email).limit(1)
         email_docs = list(email_query.stream())
         
         if email_docs:
             user_doc = email_docs[0]
             user_id = user_doc.id
-            logger.info(f"Found user by exact email match: {user_id}")
+            logger.debug("Found user by exact email match: %s", user_id)
             return user_id, user_doc
         
-        logger.info(f"No user found with email: {email}")
+        logger.info("No user found with email: %s", email)
         return None, None
         
     except Exception as e:
-        logger.error(f"Error searching for user by email: {e}")
-        logger.error(traceback.format_exc())
+        logger.exception("Error searching for user by email: %s", e)
         return None, None
 
 def find_user_by_customer_id(customer_id):
@@ -151,87 +197,71 @@ def find_user_by_customer_id(customer_id):
     if not customer_id or not initialize_firebase():
         return None, None
     
-    logger.info(f"Looking for user with customer_id: {customer_id}")
+    logger.debug("Looking for user with customer_id: %s", customer_id)
     
     try:
-        users_ref = db.collection('users')
+        users_ref = get_db().collection('users')
         query = users_ref.where('paddleCustomerId', '==', customer_id).limit(1)
         user_docs = list(query.stream())
         
         if user_docs:
             user_doc = user_docs[0]
             user_id = user_doc.id
-            logger.info(f"Found user by customer ID: {user_id}")
+            logger.debug("Found user by customer ID: %s", user_id)
             return user_id, user_doc
         
-        logger.info(f"No user found with customer_id: {customer_id}")
+        logger.info("No user found with customer_id: %s", customer_id)
         return None, None
     
     except Exception as e:
-        logger.error(f"Error searching for user by customer ID: {e}")
-        logger.error(traceback.format_exc())
+        logger.exception("Error searching for user by customer ID: %s", e)
         return None, None
 
 def find_user(customer_id):
-    """Find a user by customer ID, falling back to email lookup if needed"""
-    # Try finding by customer ID first
-    user_id, user_doc = find_user_by_customer_id(customer_id)
+    """Find a user by customer ID via the customer mapping, falling back to queries and email lookup"""
+    if not customer_id or not initialize_firebase():
+        return None, None
     
-    if user_id:
-        return user_id, user_doc
+    cached_user_id = get_cached_user_id(customer_id)
+    if cached_user_id == UNKNOWN_CUSTOMER:
+        logger.info("Customer %s was recently looked up with no matching user", customer_id)
+        return None, None
     
-    # Fall back to email lookup
-    customer_details = get_customer_details(customer_id)
-    if customer_details and customer_details.get('email'):
-        customer_email = customer_details.get('email')
-        logger.info(f"Looking up user by email: {customer_email}")
-        return find_user_by_email(customer_email)
+    # Point lookup through the paddle_customers mapping
+    user_id = cached_user_id or get_mapped_user_id(customer_id)
+    if user_id:
+        user_doc = get_db().collection('users').document(user_id).get()
+        if user_doc.exists:
+            return user_id, user_doc
+        logger.info("Mapped user %s for customer %s no longer exists", user_id, customer_id)
     
-    return None, None
-
-
-def extract_price_info(event_data):
-    """Extract price information from event data"""
-    price_id = None
-    plan_name = "Unknown Plan"
-    price_amount = 0
-    price_interval = "month"
+    # Try finding by customer ID field
+    user_id, user_doc = find_user_by_customer_id(customer_id)
     
-    # Check for items in event data
-    items = event_data.get('items', [])
-    if not items and event_data.get('line_items'):
-        items = event_data.get('line_items')
-    if not items and event_data.get('details', {}).get('line_items'):
-        items = event_data.get('details', {}).get('line_items')
+    if not user_id:
+        # Fall back to email lookup
+        customer_details = get_customer_details(customer_id)
+        if customer_details and customer_details.get('email'):
+            customer_email = customer_details.get('email')
+            logger.debug("Looking up user by email: %s", customer_email)
+            user_id, user_doc = find_user_by_email(customer_email)
     
-    if items and len(items) > 0:
-        item = items[0]
-        price = item.get('price', {})
-        price_id = price.get('id')
-        plan_name = price.get('description') or price.get('name', "Unknown Plan")
-        
-        # Extract price amount
-        unit_price = price.get('unit_price', {})
-        if unit_price:
-            if isinstance(unit_price, dict) and 'amount' in unit_price:
-                price_amount = int(unit_price.get('amount', 0)) / 100  # Convert from cents
-            elif isinstance(unit_price, (int, str)):
-                price_amount = int(unit_price) / 100
-        
-        # Extract billing interval
-        billing_cycle = price.get('billing_cycle', {})
-        if billing_cycle:
-            price_interval = billing_cycle.get('interval', 'month')
+    # Remember the result so later events for this customer are a point lookup
+    if user_id:
+        save_customer_mapping(customer_id, user_id)
+    else:
+        remember_unknown_customer(customer_id)
     
-    return price_id, plan_name, price_amount, price_interval
+    return user_id, user_doc
 
-def detect_renewal_or_plan_change(event_data, user_doc):
+
+def detect_renewal_or_plan_change(event, user_doc):
     """Detect if an event is a renewal or plan change"""
     is_renewal = False
     is_plan_change = False
     
-    # Extract the new price ID
-    price_id, _, _, _ = extract_price_info(event_data)
+    # The new price ID
+    price_id = event.price_id
     
     # Check for plan change
     if user_doc and price_id:
@@ -244,10 +274,10 @@ def detect_renewal_or_plan_change(event_data, user_doc):
         # If price_id is different from old_price_id, it's a plan change
         if old_price_id and price_id != old_price_id:
             is_plan_change = True
-            logger.info(f"Detected plan change: {old_price_id} -> {price_id}")
+            logger.info("Detected plan change: %s -> %s", old_price_id, price_id)
     
     # Check for renewal
-    previously_billed_at = event_data.get('previously_billed_at')
+    previously_billed_at = event.previously_billed_at
     if previously_billed_at:
         try:
             # Parse the ISO timestamp
@@ -260,17 +290,18 @@ def detect_renewal_or_plan_change(event_data, user_doc):
                 is_renewal = True
                 logger.info("Detected subscription renewal")
         except Exception as e:
-            logger.error(f"Error parsing billing dates: {e}")
+            logger.error("Error parsing billing dates: %s", e)
     
     return is_renewal, is_plan_change
 
 def create_debug_document(event_type, error_info, webhook_data, additional_data=None):
     """Create a debug document in Firebase for troubleshooting"""
+    from firebase_admin import firestore
     if not initialize_firebase():
         return
     
     try:
-        debug_collection = db.collection('paddle_webhook_debug')
+        debug_collection = get_db().collection('paddle_webhook_debug')
         debug_doc = {
             'event_type': event_type,
             'error': str(error_info) if isinstance(error_info, Exception) else error_info,
@@ -290,31 +321,41 @@ def create_debug_document(event_type, error_info, webhook_data, additional_data=
         debug_collection.add(debug_doc)
         logger.info("Created debug document in paddle_webhook_debug collection")
     except Exception as debug_error:
-        logger.error(f"Error creating debug document: {debug_error}")
+        logger.error("Error creating debug document: %s", debug_error)
+
+def event_record_id(webhook_data):
+    """Stable id for records derived from a webhook delivery, so retries reuse it"""
+    return (webhook_data or {}).get('event_id') or str(uuid.uuid4())
 
-def create_transaction_record(user_id, transaction_data):
-    """Create a transaction record in Firebase"""
+def create_transaction_record(user_id, transaction_data, batch=None):
+    """Create a transaction record in Firebase, keyed by its transaction id"""
     if not user_id or not initialize_firebase():
         return False
     
     try:
-        db.collection('users').document(user_id).collection('transactions').add(transaction_data)
-        logger.info(f"Created transaction record for user {user_id}")
+        transactions_ref = get_db().collection('users').document(user_id).collection('transactions')
+        record_ref = transactions_ref.document(transaction_data['id'])
+        if batch is not None:
+            batch.set(record_ref, transaction_data)
+            return True
+        record_ref.set(transaction_data)
+        logger.info("Created transaction record for user %s", user_id)
         return True
     except Exception as e:
-        logger.error(f"Error creating transaction record: {e}")
-        logger.error(traceback.format_exc())
+        logger.exception("Error creating transaction record: %s", e)
         return False
 
-def handle_subscription_created(event_data, webhook_data):
+@on_event('subscription.created')
+def handle_subscription_created(event, writes):
     """Handle subscription.created event"""
+    from firebase_admin import firestore
     try:
-        # Extract necessary data
-        subscription_id = event_data.get('id')
-        customer_id = event_data.get('customer_id')
+        subscription_id = event.id
+        customer_id = event.customer_id
         
-        # Extract price/product details
-        price_id, plan_name, price_amount, price_interval = extract_price_info(event_data)
+        # Price/product details
+        price_id, plan_name, price_interval = event.price_id, event.plan_name, event.interval
+        price_amount = event.price_amount / 100  # Records store major units
         
         # Generate a license key
         license_key = generate_license_key()
@@ -332,14 +373,14 @@ def handle_subscription_created(event_data, webhook_data):
                 'name': plan_name
             },
             'customer_id': customer_id,
-            'next_billing_date': event_data.get('next_billed_at'),
+            'next_billing_date': event.next_billed_at,
             'amount': price_amount,
             'interval': price_interval,
             'license_key': license_key
         }
         
         # Log a serializable version of the data
-        logger.info(f"Processing subscription for plan: {plan_name}, credits: {credit_allocation}")
+        logger.debug("Processing subscription for plan: %s, credits: %s", plan_name, credit_allocation)
         
         # Now add the SERVER_TIMESTAMP for the database version
         subscription_data['created_at'] = firestore.SERVER_TIMESTAMP
@@ -349,7 +390,7 @@ def handle_subscription_created(event_data, webhook_data):
         
         if user_id:
             # Update user with subscription data
-            user_ref = db.collection('users').document(user_id)
+            user_ref = get_db().collection('users').document(user_id)
             
             update_data = {
                 'subscription': subscription_data,
@@ -361,79 +402,72 @@ def handle_subscription_created(event_data, webhook_data):
                 'paddleCustomerId': customer_id
             }
             
-            user_ref.update(update_data)
-            logger.info(f"Successfully updated user {user_id} with subscription data")
+            previous_license_key = (user_doc.to_dict() or {}).get('licenseKey')
             
-            try:
-                # Get the user's displayName from the Firestore document
-                user_data = user_doc.to_dict()
-                logger.info(f"[DEBUG] User data keys: {list(user_data.keys()) if user_data else None}")
-    
-                display_name = user_data.get('name') or user_data.get('displayName') or user_data.get('display_name')
-                logger.info(f"[DEBUG] Found display name: {display_name}")
-
-                if display_name:
-                    # Update the customer name in Paddle
-                    logger.info(f"[DEBUG] Calling update_customer_name with {customer_id} and {display_name}")
-                    update_result = update_customer_name(customer_id, display_name)
-                    logger.info(f"[DEBUG] update_customer_name result: {update_result}")
-                    if not update_result:
-                        logger.error(f"Failed to update Paddle customer name")
-                else:
-                    logger.info(f"No displayName found in Firestore for user {user_id}")
-            except Exception as e:
-                logger.error(f"Error updatings customer name in Paddle: {str(e)}")
-                logger.error(traceback.format_exc())
+            writes.batch.update(user_ref, update_data)
+            writes.after_commit(invalidate_dashboard, user_id)
+            
+            # Register the new license and retire the one it replaces
+            save_license(license_key, user_id, subscription_id, customer_id, price_id, plan_name, batch=writes.batch)
+            writes.after_commit(invalidate_license, license_key)
+            if previous_license_key and previous_license_key != license_key:
+                revoke_license(previous_license_key, 'replaced', batch=writes.batch)
+                writes.after_commit(invalidate_license, previous_license_key)
+            
+            # The Paddle customer name is synced later by the worker, and only if it changed
+            request_name_sync(customer_id, user_id, user_doc.to_dict(), batch=writes.batch)
 
             # Create transaction record
             transaction_data = {
-                'id': event_data.get('transaction_id', f"txn_{subscription_id}"),
+                'id': event.transaction_id or f"txn_{subscription_id}",
                 'subscription_id': subscription_id,
                 'customer_id': customer_id,
                 'amount': price_amount,
-                'currency': event_data.get('currency_code', 'USD'),
-                'date': event_data.get('created_at'),
+                'currency': event.currency,
+                'date': event.created_at,
                 'status': 'completed',
                 'type': 'subscription_payment',
                 'description': f"Subscription payment for {plan_name}",
                 'created_at': firestore.SERVER_TIMESTAMP
             }
             
-            create_transaction_record(user_id, transaction_data)
-            logger.info(f"Created license key {license_key} for subscription {subscription_id}, user {user_id}")
+            create_transaction_record(user_id, transaction_data, batch=writes.batch)
+            logger.info("Created license key %s for subscription %s, user %s", license_key, subscription_id, user_id)
         else:
-            logger.error(f"No user found for customer ID {customer_id}")
+            logger.error("No user found for customer ID %s", customer_id)
             
             # Create debug document for troubleshooting
             create_debug_document(
                 'subscription.created',
                 f'No user found for customer ID {customer_id}',
-                webhook_data,
+                event.webhook_data,
                 {'customer_id': customer_id, 'subscription_id': subscription_id}
             )
+            # Left out of the ledger so a retry or replay applies it once the user is mapped
+            return False
             
         return True
     except Exception as e:
-        logger.error(f"Error in subscription.created handler: {str(e)}")
-        logger.error(traceback.format_exc())
-        create_debug_document('subscription.created', e, webhook_data)
+        logger.exception("Error in subscription.created handler: %s", e)
+        create_debug_document('subscription.created', e, event.webhook_data)
         return False
   
-def handle_subscription_updated(event_data, webhook_data):
-    """Handle subscription.updated event"""
+@on_event('subscription.updated', 'subscription.past_due')
+def handle_subscription_updated(event, writes):
+    """Handle subscription.updated and other subscription status events"""
+    from firebase_admin import firestore
     try:
-        # Extract data
-        subscription_id = event_data.get('id')
-        status = event_data.get('status')
-        customer_id = event_data.get('customer_id')
+        subscription_id = event.id
+        status = event.status
+        customer_id = event.customer_id
         
-        logger.info(f"Processing subscription.updated for {subscription_id}, status: {status}")
+        logger.debug("Processing %s for %s, status: %s", event.event_type, subscription_id, status)
         
-        # Extract additional data
-        next_billing_date = event_data.get('next_billed_at')
+        next_billing_date = event.next_billed_at
         
-        # Extract price information
-        price_id, plan_name, price_amount, price_interval = extract_price_info(event_data)
+        # Price information
+        price_id, plan_name, price_interval = event.price_id, event.plan_name, event.interval
+        price_amount = event.price_amount / 100  # Records store major units
         
         # Determine if subscription is active
         is_active = status.lower() in ['active', 'trialing', 'past_due']
@@ -447,27 +481,22 @@ def handle_subscription_updated(event_data, webhook_data):
                 # Handle credit purchase
                 credit_amount = determine_credit_purchase_amount(price_id)
                 
-                # Get current credit values
-                user_data = user_doc.to_dict()
-                current_credits = user_data.get('creditUsage', {}).get('total', 0)
+                # The transaction id doubles as the credit source, so a purchase is applied once
+                record_id = event.transaction_id or f"txn_credits_{event_record_id(event.webhook_data)}"
                 
-                # Update user with additional credits
-                user_ref = db.collection('users').document(user_id)
-                
-                update_data = {
-                    'creditUsage.total': current_credits + credit_amount
-                }
-                
-                logger.info(f"Adding {credit_amount} credits to user {user_id}. New total: {current_credits + credit_amount}")
-                user_ref.update(update_data)
+                # Atomically add the credits
+                logger.info("Adding %s credits to user %s", credit_amount, user_id)
+                add_credits(user_id, credit_amount, f"Credit purchase: {credit_amount} credits", source_id=record_id,
+                            batch=writes.credit_batch)
+                writes.after_commit(invalidate_dashboard, user_id)
                 
                 # Create a transaction record for the credit purchase
                 transaction_data = {
-                    'id': event_data.get('transaction_id', f"txn_credits_{uuid.uuid4()}"),
+                    'id': record_id,
                     'subscription_id': subscription_id,
                     'customer_id': customer_id,
                     'amount': price_amount,
-                    'currency': event_data.get('currency_code', 'USD'),
+                    'currency': event.currency,
                     'date': firestore.SERVER_TIMESTAMP,
                     'status': 'completed',
                     'type': 'credit_purchase',
@@ -475,12 +504,12 @@ def handle_subscription_updated(event_data, webhook_data):
                     'created_at': firestore.SERVER_TIMESTAMP
                 }
                 
-                create_transaction_record(user_id, transaction_data)
+                create_transaction_record(user_id, transaction_data, batch=writes.credit_batch)
                 
             else:
                 # Regular subscription update
                 # Check if this is a renewal or plan change
-                is_renewal, is_plan_change = detect_renewal_or_plan_change(event_data, user_doc)
+                is_renewal, is_plan_change = detect_renewal_or_plan_change(event, user_doc)
                 
                 # Create update data dictionary
                 update_data = {
@@ -507,27 +536,44 @@ def handle_subscription_updated(event_data, webhook_data):
                 if (is_renewal or is_plan_change) and price_id:
                     # Calculate new credit allocation based on the plan
                     credit_allocation = determine_credit_allocation(price_id)
+                    reason = 'renewal' if is_renewal else 'plan change'
                     
-                    # Reset credits: set used to 0 and total to the plan allocation
-                    update_data['creditUsage.used'] = 0
-                    update_data['creditUsage.total'] = credit_allocation
-                    
-                    logger.info(f"Resetting credits for user {user_id} on {'renewal' if is_renewal else 'plan change'}. New total: {credit_allocation}")
-
-                # Update user with subscription data
-                user_ref = db.collection('users').document(user_id)
-                user_ref.update(update_data)
+                    # Reset credits together with the subscription update in one atomic write
+                    logger.info("Resetting credits for user %s on %s. New total: %s", user_id, reason, credit_allocation)
+                    reset_credits(
+                        user_id,
+                        credit_allocation,
+                        f"Credit reset on {reason}",
+                        source_id=f"reset_{event_record_id(event.webhook_data)}",
+                        extra_updates=update_data,
+                        batch=writes.credit_batch
+                    )
+                else:
+                    # Update user with subscription data
+                    user_ref = get_db().collection('users').document(user_id)
+                    writes.batch.update(user_ref, update_data)
+                writes.after_commit(invalidate_dashboard, user_id)
                 
-                logger.info(f"Updated subscription {subscription_id} details for user {user_id}")
+                # Keep the license in step with the subscription
+                license_fields = {'status': status}
+                if price_id and plan_name:
+                    license_fields['plan_id'] = price_id
+                    license_fields['tier'] = plan_name
+                license_key = (user_doc.to_dict() or {}).get('licenseKey')
+                if license_key:
+                    update_license(license_key, batch=writes.batch, **license_fields)
+                    writes.after_commit(invalidate_license, license_key)
+                
+                logger.info("Updated subscription %s details for user %s", subscription_id, user_id)
                 
                 # Create a transaction record for the renewal if applicable
                 if is_renewal:
                     transaction_data = {
-                        'id': event_data.get('transaction_id', f"txn_renewal_{uuid.uuid4()}"),
+                        'id': event.transaction_id or f"txn_renewal_{event_record_id(event.webhook_data)}",
                         'subscription_id': subscription_id,
                         'customer_id': customer_id,
                         'amount': price_amount,
-                        'currency': event_data.get('currency_code', 'USD'),
+                        'currency': event.currency,
                         'date': firestore.SERVER_TIMESTAMP,
                         'status': 'completed',
                         'type': 'subscription_renewal',
@@ -535,164 +581,125 @@ def handle_subscription_updated(event_data, webhook_data):
                         'created_at': firestore.SERVER_TIMESTAMP
                     }
                     
-                    create_transaction_record(user_id, transaction_data)
+                    create_transaction_record(user_id, transaction_data, batch=writes.batch)
                 
-                # Update customer name in Paddle
-                try:
-                    # Get the user's displayName from Firestore
-                    user_data = user_doc.to_dict()
-                    display_name = user_data.get('name') or user_data.get('displayName') or user_data.get('display_name')
-                    
-                    if display_name:
-                        # Update the customer name in Paddle
-                        update_result = update_customer_name(customer_id, display_name)
-                        if not update_result:
-                            logger.error(f"Failed to update Paddle customer name")
-                    else:
-                        logger.info(f"No displayName found in Firestore for user {user_id}")
-                except Exception as e:
-                    logger.error(f"Error updating customer name in Paddle: {str(e)}")
-                    logger.error(traceback.format_exc())
+                # The Paddle customer name is synced later by the worker, and only if it changed
+                request_name_sync(customer_id, user_id, user_doc.to_dict(), batch=writes.batch)
         else:
-            logger.error(f"Could not find user for subscription update - customer_id: {customer_id}")
+            logger.error("Could not find user for subscription update - customer_id: %s", customer_id)
             create_debug_document(
-                'subscription.updated',
+                event.event_type,
                 f"No user found for customer ID {customer_id}",
-                webhook_data,
+                event.webhook_data,
                 {'customer_id': customer_id}
             )
+            # Left out of the ledger so a retry or replay applies it once the user is mapped
+            return False
         
         return True
     except Exception as e:
-        logger.error(f"Error in subscription.updated handler: {str(e)}")
-        logger.error(traceback.format_exc())
-        create_debug_document('subscription.updated', e, webhook_data)
+        logger.exception("Error in %s handler: %s", event.event_type, e)
+        create_debug_document(event.event_type, e, event.webhook_data)
         return False
 
-def handle_subscription_cancelled(event_data, webhook_data):
-    """Handle subscription.cancelled event"""
+@on_event('subscription.cancelled', 'subscription.canceled')
+def handle_subscription_cancelled(event, writes):
+    """Handle subscription.canceled event (Paddle's spelling) and the legacy spelling"""
+    from firebase_admin import firestore
     try:
-        # Extract data
-        subscription_id = event_data.get('id')
-        customer_id = event_data.get('customer_id')
+        subscription_id = event.id
+        customer_id = event.customer_id
         
-        logger.info(f"Processing subscription.cancelled for {subscription_id}")
+        logger.debug("Processing subscription.cancelled for %s", subscription_id)
         
         # Find user
-        user_id, _ = find_user(customer_id)
+        user_id, user_doc = find_user(customer_id)
         
         if user_id:
             # Update subscription status
-            user_ref = db.collection('users').document(user_id)
-            user_ref.update({
+            user_ref = get_db().collection('users').document(user_id)
+            writes.batch.update(user_ref, {
                 'subscription.status': 'cancelled',
                 'subscription.active': False,
                 'subscription.canceled_at': firestore.SERVER_TIMESTAMP
             })
+            writes.after_commit(invalidate_dashboard, user_id)
+            license_key = (user_doc.to_dict() or {}).get('licenseKey')
+            if license_key:
+                update_license(license_key, batch=writes.batch, status='cancelled')
+                writes.after_commit(invalidate_license, license_key)
             
-            logger.info(f"Marked subscription {subscription_id} as cancelled for user {user_id}")
+            logger.info("Marked subscription %s as cancelled for user %s", subscription_id, user_id)
             return True
         else:
-            logger.error(f"Could not find user for subscription cancellation - customer_id: {customer_id}")
+            logger.error("Could not find user for subscription cancellation - customer_id: %s", customer_id)
             create_debug_document(
                 'subscription.cancelled',
                 f"No user found for customer ID {customer_id}",
-                webhook_data,
+                event.webhook_data,
                 {'customer_id': customer_id}
             )
             return False
     except Exception as e:
-        logger.error(f"Error in subscription.cancelled handler: {str(e)}")
-        logger.error(traceback.format_exc())
-        create_debug_document('subscription.cancelled', e, webhook_data)
+        logger.exception("Error in subscription.cancelled handler: %s", e)
+        create_debug_document('subscription.cancelled', e, event.webhook_data)
         return False
 
 
-def handle_transaction(event_data, event_type, webhook_data):
-    """Handle transaction.created or transaction.completed events"""
+def mirror_transaction(user_id, event_data, batch=None):
+    """Keep the user's transaction mirror in step with a transaction event"""
     try:
-        # Extract necessary data
-        transaction_id = event_data.get('id')
-        customer_id = event_data.get('customer_id')
-        origin = event_data.get('origin')
-        
-        logger.info(f"Processing {event_type} event with origin: {origin}")
-        
-        # Get items from the transaction
-        line_items = []
-        
-        # Try different possible locations for items
-        if event_data.get('line_items'):
-            line_items = event_data.get('line_items')
-        elif event_data.get('items'):
-            line_items = event_data.get('items')
-        elif event_data.get('details', {}).get('line_items'):
-            line_items = event_data.get('details', {}).get('line_items')
-            
-        # Debug log the items found
-        logger.info(f"Found {len(line_items)} items in transaction")
-        
-        # Check each item for credit products
-        found_credit_product = False
-        credit_amount = 0
-        price_amount = 0
-        price_id = None
-        
-        for item in line_items:
-            # Extract price ID from various possible locations
-            if 'price' in item and 'id' in item['price']:
-                price_id = item['price']['id']
-            elif 'price_id' in item:
-                price_id = item['price_id']
-            
-            # If we have a price ID, check if it's a credit product
-            if price_id and is_credit_product(price_id):
-                found_credit_product = True
-                credit_amount = determine_credit_purchase_amount(price_id)
-                
-                # Try to get price amount from various possible locations
-                if 'price' in item and 'unit_price' in item['price']:
-                    unit_price = item['price']['unit_price']
-                    if isinstance(unit_price, dict) and 'amount' in unit_price:
-                        price_amount = int(unit_price['amount']) / 100
-                    elif isinstance(unit_price, (int, str)):
-                        price_amount = int(unit_price) / 100
-                elif 'unit_price' in item:
-                    unit_price = item['unit_price']
-                    if isinstance(unit_price, dict) and 'amount' in unit_price:
-                        price_amount = int(unit_price['amount']) / 100
-                    elif isinstance(unit_price, (int, str)):
-                        price_amount = int(unit_price) / 100
-                
-                logger.info(f"Found credit product: {price_id}, credit amount: {credit_amount}, price: {price_amount}")
-                break
+        upsert_transaction(user_id, event_data, batch=batch)
+    except Exception as e:
+        logger.error("Error mirroring transaction %s: %s", event_data.get('id'), e)
+
+@on_event('transaction.created', 'transaction.updated', 'transaction.completed')
+def handle_transaction(event, writes):
+    """Handle transaction.created, transaction.updated or transaction.completed events"""
+    from firebase_admin import firestore
+    try:
+        transaction_id = event.id
+        customer_id = event.customer_id
+        
+        logger.debug("Processing %s event with origin: %s", event.event_type, event.origin)
+        logger.debug("Found %s items in transaction", len(event.items))
+        
+        # Find the first credit product in the transaction
+        credit_item = next((item for item in event.items if item.price_id and is_credit_product(item.price_id)), None)
         
         # Process credit product if found
-        if found_credit_product:
+        if credit_item:
+            price_id = credit_item.price_id
+            credit_amount = determine_credit_purchase_amount(price_id)
+            price_amount = credit_item.unit_amount / 100  # Records store major units
+            logger.debug("Found credit product: %s, credit amount: %s, price: %s", price_id, credit_amount, price_amount)
+            
             # Find the user
             user_id, user_doc = find_user(customer_id)
             
             if user_id and user_doc:
-                # Get current credit values
-                user_data = user_doc.to_dict()
-                current_credits = user_data.get('creditUsage', {}).get('total', 0)
+                mirror_transaction(user_id, event.data, batch=writes.batch)
                 
-                # Update user with additional credits
-                user_ref = db.collection('users').document(user_id)
+                # Credits are granted once the transaction is paid; drafts and other updates only refresh the mirror
+                if event.status != 'completed':
+                    logger.info("Transaction %s is %s; mirrored without adding credits", transaction_id, event.status or 'unknown')
+                    return True
                 
-                update_data = {
-                    'creditUsage.total': current_credits + credit_amount
-                }
+                # The transaction id doubles as the credit source, so a purchase is applied once
+                record_id = transaction_id or f"txn_credits_{event_record_id(event.webhook_data)}"
                 
-                logger.info(f"Adding {credit_amount} credits to user {user_id}. New total: {current_credits + credit_amount}")
-                user_ref.update(update_data)
+                # Atomically add the credits
+                logger.info("Adding %s credits to user %s", credit_amount, user_id)
+                add_credits(user_id, credit_amount, f"Credit purchase: {credit_amount} credits", source_id=record_id,
+                            batch=writes.credit_batch)
+                writes.after_commit(invalidate_dashboard, user_id)
                 
                 # Create a transaction record for the credit purchase
                 transaction_data = {
-                    'id': transaction_id or f"txn_credits_{uuid.uuid4()}",
+                    'id': record_id,
                     'customer_id': customer_id,
                     'amount': price_amount,
-                    'currency': event_data.get('currency_code', 'USD'),
+                    'currency': event.currency,
                     'date': firestore.SERVER_TIMESTAMP,
                     'status': 'completed',
                     'type': 'credit_purchase',
@@ -700,16 +707,16 @@ def handle_transaction(event_data, event_type, webhook_data):
                     'created_at': firestore.SERVER_TIMESTAMP
                 }
                 
-                create_transaction_record(user_id, transaction_data)
+                create_transaction_record(user_id, transaction_data, batch=writes.credit_batch)
                 return True
             else:
-                logger.error(f"Could not find user for credit purchase - customer_id: {customer_id}")
+                logger.error("Could not find user for credit purchase - customer_id: %s", customer_id)
                 
                 # Create a debug document
                 create_debug_document(
-                    event_type,
+                    event.event_type,
                     f"No user found for customer ID {customer_id}",
-                    webhook_data,
+                    event.webhook_data,
                     {
                         'customer_id': customer_id,
                         'price_id': price_id,
@@ -720,93 +727,125 @@ def handle_transaction(event_data, event_type, webhook_data):
         else:
             # Not a credit product - may be handled by other event types
             logger.info("Transaction doesn't contain credit products - may be handled by other event types")
-            return True
+            return handle_transaction_status(event, writes)
     except Exception as e:
-        logger.error(f"Error processing transaction event: {str(e)}")
-        logger.error(traceback.format_exc())
-        create_debug_document(event_type, e, webhook_data)
+        logger.exception("Error processing transaction event: %s", e)
+        create_debug_document(event.event_type, e, event.webhook_data)
         return False
 
-class handler(BaseHTTPRequestHandler):
-    def do_GET(self):
+@on_event('transaction.payment_failed', 'transaction.canceled', 'transaction.past_due')
+def handle_transaction_status(event, writes):
+    """Keep the transaction mirror in step with a transaction status change"""
+    if not event.customer_id:
+        # Checkout drafts have no customer yet; there is nothing to mirror
+        logger.info("Transaction %s has no customer; skipping %s", event.id, event.event_type)
+        return True
+    
+    user_id, _ = find_user(event.customer_id)
+    if not user_id:
+        logger.error("Could not find user for %s - customer_id: %s", event.event_type, event.customer_id)
+        create_debug_document(
+            event.event_type,
+            f"No user found for customer ID {event.customer_id}",
+            event.webhook_data,
+            {'customer_id': event.customer_id, 'transaction_id': event.id}
+        )
+        # Left out of the ledger so a retry or replay applies it once the user is mapped
+        return False
+    
+    mirror_transaction(user_id, event.data, batch=writes.batch)
+    return True
+
+def process_event(webhook_data):
+    """Apply a parsed Paddle webhook event and return the response summary"""
+    event = parse_event(webhook_data)
+    
+    # Skip events that were already applied (Paddle retries deliveries)
+    if is_event_processed(event.event_id):
+        logger.info("Skipping already processed event %s (%s)", event.event_id, event.event_type)
+        return {
+            'success': True,
+            'event_processed': event.event_type,
+            'duplicate': True
+        }
+    
+    logger.debug("Processing event type: %s, data: %s", event.event_type, lazy_json(event.data))
+    
+    # Handlers stage their writes; nothing is committed for a failed event, so it stays retryable
+    writes = EventWrites(get_db())
+    handle = EVENT_HANDLERS.get(event.event_type)
+    if handle:
+        result = handle(event, writes)
+    else:
+        logger.info("Unhandled event type: %s", event.event_type)
+        result = True  # Return success for unhandled events
+    
+    # Record the event in the ledger in the same commit so replays are skipped
+    if result:
+        ledger_transaction_id = event.transaction_id or event.id
+        mark_event_processed(event.event_id, event.event_type, ledger_transaction_id, batch=writes.batch)
+        if writes.commit():
+            if event.event_id:
+                remember_event(event.event_id)
+        else:
+            logger.info("Event %s (%s) was already applied", event.event_id, event.event_type)
+            mark_event_processed(event.event_id, event.event_type, ledger_transaction_id)
+    
+    return {
+        'success': result,
+        'event_processed': event.event_type
+    }
+
+class handler(JsonHandler):
+    route = '/api/paddle_webhook'
+    methods = ('GET', 'POST')
+    allow_headers = 'Content-Type'
+    require_auth = False
+
+    def get(self):
         """Handle GET requests - useful for testing if endpoint is accessible"""
-        self.send_response(200)
-        self.send_header('Content-Type', 'application/json')
-        self.end_headers()
-        self.wfile.write(json.dumps({
+        return {
             'status': 'Paddle webhook endpoint is online',
             'message': 'This endpoint is for Paddle webhook notifications. Please use POST method to send webhook events.'
-        }).encode())
+        }
     
-    def do_POST(self):
+    def post(self):
         """Handle POST requests from Paddle webhooks"""
+        # Authenticate the raw body before any parsing, Firebase or Paddle work
+        if not PADDLE_WEBHOOK_SECRETS:
+            logger.error("PADDLE_WEBHOOK_SECRET is not configured; rejecting webhook")
+            raise HttpError(503, 'Webhook verification is not configured')
+        if not verify_paddle_signature(self.headers.get('Paddle-Signature'), self.raw_body()):
+            logger.warning("Rejected webhook with an invalid Paddle-Signature")
+            raise HttpError(401, 'Invalid signature')
+        
+        # Parse JSON body (answers 400 if it is not valid JSON)
+        webhook_data = self.json_body()
+        logger.debug("Received webhook event of type: %s", webhook_data.get('event_type', 'unknown'))
+        
         try:
-            # Get content length for reading the request body
-            content_length = int(self.headers.get('Content-Length', 0))
-            
-            # Read the request body
-            request_body = self.rfile.read(content_length)
-            
-            # Log request headers for debugging (sanitized)
-            logger.info("Request headers received")
-            
-            # Parse JSON body
-            try:
-                webhook_data = json.loads(request_body.decode('utf-8'))
-                logger.info(f"Received webhook event of type: {webhook_data.get('event_type', 'unknown')}")
-            except json.JSONDecodeError as e:
-                logger.error(f"Failed to parse JSON body: {e}")
-                self.send_response(400)
-                self.send_header('Content-Type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({
-                    'error': 'Invalid JSON payload'
-                }).encode())
-                return
-            
             # Initialize Firebase
             if not initialize_firebase():
-                self.send_response(500)
-                self.send_header('Content-Type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({
-                    'success': False,
-                    'error': 'Failed to initialize Firebase'
-                }).encode())
-                return
+                raise HttpError(500, 'Failed to initialize Firebase', success=False)
             
-            # Process webhook based on event type
+            event_id = webhook_data.get('event_id')
             event_type = webhook_data.get('event_type', '')
-            event_data = webhook_data.get('data', {})
             
-            logger.info(f"Processing event type: {event_type}")
+            # In queue mode, persist the raw event and ack before doing any work
+            if WEBHOOK_PROCESSING_MODE == 'queue':
+                queued = get_queue().enqueue(event_id, self.raw_body().decode('utf-8'), event_type)
+                logger.info("Queued event %s (%s), new: %s", event_id, event_type, queued)
+                return {
+                    'success': True,
+                    'event_queued': event_type
+                }
             
-            # Process different event types
-            result = False
-            if event_type == 'subscription.created':
-                result = handle_subscription_created(event_data, webhook_data)
-            elif event_type == 'subscription.updated':
-                result = handle_subscription_updated(event_data, webhook_data)
-            elif event_type == 'subscription.cancelled':
-                result = handle_subscription_cancelled(event_data, webhook_data)
-            elif event_type == 'transaction.created' or event_type == 'transaction.completed':
-                result = handle_transaction(event_data, event_type, webhook_data)
-            else:
-                logger.info(f"Unhandled event type: {event_type}")
-                result = True  # Return success for unhandled events
-                
-            # Return success response
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({
-                'success': result,
-                'event_processed': event_type
-            }).encode())
+            result = process_event(webhook_data)
                 
+        except HttpError:
+            raise
         except Exception as e:
-            logger.error(f"Critical webhook error: {str(e)}")
-            logger.error(traceback.format_exc())
+            logger.exception("Critical webhook error: %s", e)
             
             # Create a debug entry if possible
             try:
@@ -814,19 +853,9 @@ class handler(BaseHTTPRequestHandler):
             except:
                 pass
             
-            # Still return 200 to acknowledge receipt (Paddle will retry if non-200)
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({
-                'success': False,
-                'error': str(e)
-            }).encode())
-
-    def do_OPTIONS(self):
-        # Handle preflight requests for CORS
-        self.send_response(200)
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'POST, GET, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-        self.end_headers()
+            # A failed event commits nothing, so let Paddle retry it
+            raise HttpError(500, str(e), success=False)
+        
+        if not result['success']:
+            raise HttpError(500, 'Event processing failed', success=False, event_processed=result['event_processed'])
+        return result
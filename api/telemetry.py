@@ -0,0 +1,210 @@
+import os
+import time
+import bisect
+import logging
+import threading
+from .logging_config import get_logger
+
+# When disabled every helper returns immediately
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Each Vercel function is a separate process, and the in-memory histograms
+# only cover the one instance that happens to serve /api/metrics. For
+# fleet-wide numbers set METRICS_LOG_ENABLED: every measurement is then
+# exported as it happens, as one JSON log line with a "metric" field (tagged
+# with the request id) for the log drain to aggregate. Off by default, since
+# these lines are written regardless of LOG_LEVEL and sampling.
+METRICS_LOG_ENABLED = os.getenv("METRICS_LOG_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# Bearer token required to read /api/metrics; the endpoint is closed without it
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+# Also record to OpenTelemetry when an OTLP endpoint is configured and the
+# opentelemetry packages are installed
+OTEL_ENABLED = bool(os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"))
+
+# Latency buckets in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    'http_request_duration_seconds': 'Handler latency by route, method and status',
+    'paddle_request_duration_seconds': 'Paddle API call latency including retries',
+    'paddle_retries_total': 'Paddle API attempts that were retried',
+    'firestore_op_duration_seconds': 'Firestore operation latency by collection and op',
+    'auth_verify_duration_seconds': 'Firebase ID token verification latency',
+}
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+_histograms = {}
+_counters = {}
+_lock = threading.Lock()
+_otel_instruments = None
+
+# Metric lines are INFO records, emitted whatever LOG_LEVEL is set to
+_metrics_logger = get_logger('api.telemetry')
+_metrics_logger.setLevel(logging.INFO)
+
+def _log_measurement(name, value, labels):
+    _metrics_logger.info("%s %s", name, value, extra={'metric': {'name': name, 'value': value, **labels}})
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _otel_record(name, value, labels, counter=False):
+    """Forward a measurement to OpenTelemetry if it is available"""
+    global _otel_instruments
+    if _otel_instruments is None:
+        _otel_instruments = {}
+        try:
+            from opentelemetry import metrics as otel_metrics
+            _otel_instruments['meter'] = otel_metrics.get_meter('yok-ai-api')
+        except ImportError:
+            pass
+    meter = _otel_instruments.get('meter')
+    if not meter:
+        return
+    instrument = _otel_instruments.get(name)
+    if instrument is None:
+        if counter:
+            instrument = meter.create_counter(name, description=HELP.get(name, ''))
+        else:
+            instrument = meter.create_histogram(name, unit='s', description=HELP.get(name, ''))
+        _otel_instruments[name] = instrument
+    if counter:
+        instrument.add(value, labels)
+    else:
+        instrument.record(value, labels)
+
+def observe(name, value, **labels):
+    """Record a duration (seconds) in the histogram for name and labels"""
+    if not METRICS_ENABLED:
+        return
+    key = (name, _label_key(labels))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram()
+        histogram.observe(value)
+    if METRICS_LOG_ENABLED:
+        _log_measurement(name, value, labels)
+    if OTEL_ENABLED:
+        _otel_record(name, value, labels)
+
+def inc(name, amount=1, **labels):
+    """Increment the counter for name and labels"""
+    if not METRICS_ENABLED:
+        return
+    key = (name, _label_key(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+    if METRICS_LOG_ENABLED:
+        _log_measurement(name, amount, labels)
+    if OTEL_ENABLED:
+        _otel_record(name, amount, labels, counter=True)
+
+class Timer:
+    """Context manager recording its elapsed time on exit.
+
+    Labels can be filled in while timing, e.g. timer.labels['status'] = 200.
+    """
+
+    __slots__ = ('name', 'labels', 'start')
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.labels.setdefault('status', 'error')
+        observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+class _NullTimer:
+    __slots__ = ('labels',)
+
+    def __init__(self):
+        self.labels = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.labels.clear()
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+def timer(name, **labels):
+    """Time a block: with timer('firestore_op_duration_seconds', collection='users', op='get'):"""
+    if not METRICS_ENABLED:
+        return _NULL_TIMER
+    return Timer(name, labels)
+
+def firestore_op(collection, op):
+    """Time one Firestore call"""
+    return timer('firestore_op_duration_seconds', collection=collection, op=op)
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in pairs) + '}'
+
+def render():
+    """Render all metrics in the Prometheus text exposition format"""
+    with _lock:
+        histograms = [(key, list(h.counts), h.sum, h.count, h.buckets) for key, h in _histograms.items()]
+        counters = list(_counters.items())
+
+    lines = []
+    seen = set()
+
+    def header(name, kind):
+        if name not in seen:
+            seen.add(name)
+            if name in HELP:
+                lines.append(f'# HELP {name} {HELP[name]}')
+            lines.append(f'# TYPE {name} {kind}')
+
+    for (name, labels), counts, total, count, buckets in sorted(histograms):
+        header(name, 'histogram')
+        cumulative = 0
+        for bound, bucket_count in zip(buckets, counts):
+            cumulative += bucket_count
+            lines.append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {cumulative}')
+        lines.append(f'{name}_bucket{_format_labels(labels, [("le", "+Inf")])} {count}')
+        lines.append(f'{name}_sum{_format_labels(labels)} {total}')
+        lines.append(f'{name}_count{_format_labels(labels)} {count}')
+
+    for (name, labels), value in sorted(counters):
+        header(name, 'counter')
+        lines.append(f'{name}{_format_labels(labels)} {value}')
+
+    return '\n'.join(lines) + '\n'
+
+def reset():
+    """Drop all recorded metrics"""
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
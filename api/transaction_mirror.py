@@ -0,0 +1,231 @@
+import os
+import datetime
+from .firebase_client import get_db
+from .paddle_api import get_transactions_page
+from .logging_config import get_logger
+from .telemetry import firestore_op
+
+logger = get_logger(__name__)
+
+# Mirror of a user's Paddle transactions: users/{uid}/paddle_transactions/{txn_id}
+MIRROR_COLLECTION = 'paddle_transactions'
+
+# Only transactions in these states are listed on the dashboard
+LISTED_STATUSES = ('completed', 'billed')
+
+# Fields stored on mirror documents that are not part of the API response
+MIRROR_ONLY_FIELDS = ('billed_at', 'customer_id', 'synced_at')
+
+# Users reconciled per scheduled run; each costs at least one Paddle request
+RECONCILE_BATCH_SIZE = int(os.getenv("TRANSACTION_RECONCILE_BATCH_SIZE", "20"))
+
+# Where the scheduled reconciler resumes: sync_state/transaction_mirror -> {after}
+SYNC_STATE_COLLECTION = 'sync_state'
+
+def transaction_type(trans):
+    """Classify a Paddle transaction the way the dashboard filters it"""
+    return 'subscription' if trans.get('subscription_id') else 'credit_purchase'
+
+def format_transaction(trans):
+    """Format a Paddle transaction for the dashboard"""
+    # Get amount
+    details = trans.get('details') or {}
+    totals = details.get('totals') or {}
+    amount = float(totals.get('grand_total', '0')) / 100
+
+    # Get description from items
+    description = 'Payment'
+    items = trans.get('items', [])
+    if items:
+        price = items[0].get('price', {})
+        description = price.get('description') or price.get('name', 'Payment')
+
+    # Look for invoice in different places
+    invoice_id = trans.get('invoice_id')
+    # Check if there's invoice info in details
+    if not invoice_id and trans.get('invoice'):
+        invoice_id = trans['invoice'].get('id')
+    # Check billing details
+    if not invoice_id:
+        billing = trans.get('billing') or {}
+        invoice_id = billing.get('invoice_id')
+
+    return {
+        'id': trans.get('id'),
+        'date': trans.get('billed_at') or trans.get('created_at', ''),
+        'description': description,
+        'amount': amount,
+        'status': trans.get('status', 'completed'),
+        'type': transaction_type(trans),
+        'invoiceId': invoice_id,
+        'invoiceNumber': trans.get('invoice_number'),
+        'invoiceUrl': None,
+        'currency': trans.get('currency_code', 'USD')
+    }
+
+def _parse_timestamp(value):
+    if not value:
+        return None
+    try:
+        return datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+
+def mirror_document(trans):
+    """Build the mirror document for a Paddle transaction"""
+    from firebase_admin import firestore
+    document = format_transaction(trans)
+    document['billed_at'] = _parse_timestamp(trans.get('billed_at') or trans.get('created_at'))
+    document['customer_id'] = trans.get('customer_id')
+    document['synced_at'] = firestore.SERVER_TIMESTAMP
+    return document
+
+def upsert_transaction(user_id, trans, batch=None):
+    """Write a Paddle transaction to the user's mirror, or drop it if no longer listed"""
+    db = get_db()
+    if not db or not user_id or not trans.get('id'):
+        return
+
+    doc_ref = db.collection('users').document(user_id).collection(MIRROR_COLLECTION).document(trans['id'])
+    listed = trans.get('status') in LISTED_STATUSES
+    if batch is not None:
+        if listed:
+            batch.set(doc_ref, mirror_document(trans))
+        else:
+            batch.delete(doc_ref)
+    elif listed:
+        doc_ref.set(mirror_document(trans))
+    else:
+        doc_ref.delete()
+
+def list_mirrored_transactions(user_id, type_filter=None, billed_since=None, limit=25, after=None):
+    """Read one page of mirrored transactions, newest first.
+
+    Returns (transactions, next_after) where next_after is the id of the last
+    transaction on the page when more results exist.
+    """
+    from firebase_admin import firestore
+
+    collection = get_db().collection('users').document(user_id).collection(MIRROR_COLLECTION)
+    query = collection
+    if type_filter:
+        query = query.where('type', '==', type_filter)
+    if billed_since:
+        query = query.where('billed_at', '>=', billed_since)
+    query = query.order_by('billed_at', direction=firestore.Query.DESCENDING)
+
+    if after:
+        after_snapshot = collection.document(after).get()
+        if after_snapshot.exists:
+            query = query.start_after(after_snapshot)
+
+    with firestore_op(MIRROR_COLLECTION, 'query'):
+        docs = list(query.limit(limit + 1).stream())
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+
+    transactions = []
+    for doc in docs:
+        transaction = doc.to_dict()
+        for field in MIRROR_ONLY_FIELDS:
+            transaction.pop(field, None)
+        transactions.append(transaction)
+
+    next_after = docs[-1].id if has_more and docs else None
+    return transactions, next_after
+
+def sync_customer_transactions(user_id, customer_id, page_size=100):
+    """Backfill a user's mirror from Paddle and mark it as synced"""
+    from firebase_admin import firestore
+
+    db = get_db()
+    if not db or not user_id or not customer_id:
+        return 0
+
+    synced = 0
+    after = None
+    while True:
+        transactions, after = get_transactions_page(customer_id, per_page=page_size, after=after)
+        if transactions is None:
+            logger.warning("Stopped syncing transactions for user %s after a Paddle error", user_id)
+            return synced
+
+        batch = db.batch()
+        for trans in transactions:
+            upsert_transaction(user_id, trans, batch)
+        if transactions:
+            batch.commit()
+        synced += len(transactions)
+
+        if not after:
+            break
+
+    db.collection('users').document(user_id).update({
+        'transactionsSyncedAt': firestore.SERVER_TIMESTAMP
+    })
+    return synced
+
+def reconcile_all():
+    """Sync the transaction mirror for every user with a Paddle customer id"""
+    db = get_db()
+    if not db:
+        logger.warning("Firebase is not available")
+        return 0
+
+    users = db.collection('users').where('paddleCustomerId', '>', '').stream()
+    total = 0
+    for user_doc in users:
+        customer_id = user_doc.to_dict().get('paddleCustomerId')
+        try:
+            count = sync_customer_transactions(user_doc.id, customer_id)
+            total += count
+            logger.info("Synced %s transactions for user %s", count, user_doc.id)
+        except Exception as e:
+            logger.error("Error syncing transactions for user %s: %s", user_doc.id, e)
+
+    logger.info("Reconciled %s transactions", total)
+    return total
+
+def reconcile_batch(limit=RECONCILE_BATCH_SIZE):
+    """Sync the mirror for the next `limit` users by Paddle customer id.
+
+    Each scheduled run resumes after the last customer of the previous run
+    and wraps around at the end, so every user (new ones included) is
+    backfilled and then reconciled periodically.
+    """
+    from firebase_admin import firestore
+    stats = {'users': 0, 'transactions': 0}
+    db = get_db()
+    if not db:
+        return stats
+
+    state_ref = db.collection(SYNC_STATE_COLLECTION).document('transaction_mirror')
+    state = state_ref.get()
+    after = (state.to_dict() or {}).get('after') if state.exists else None
+
+    query = (db.collection('users')
+             .where('paddleCustomerId', '>', after or '')
+             .order_by('paddleCustomerId')
+             .limit(limit))
+    with firestore_op('users', 'query'):
+        user_docs = list(query.stream())
+
+    for user_doc in user_docs:
+        customer_id = user_doc.to_dict().get('paddleCustomerId')
+        try:
+            stats['transactions'] += sync_customer_transactions(user_doc.id, customer_id)
+            stats['users'] += 1
+        except Exception as e:
+            logger.error("Error syncing transactions for user %s: %s", user_doc.id, e)
+
+    next_after = user_docs[-1].to_dict().get('paddleCustomerId') if len(user_docs) >= limit else None
+    state_ref.set({
+        'after': next_after,
+        'updated_at': firestore.SERVER_TIMESTAMP
+    })
+    logger.info("Transaction reconcile run finished: %s", stats)
+    return stats
+
+if __name__ == '__main__':
+    # Full reconciliation / initial backfill: python -m api.transaction_mirror
+    reconcile_all()
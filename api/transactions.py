@@ -1,342 +1,218 @@
-from http.server import BaseHTTPRequestHandler
 import json
-from urllib.parse import parse_qs, urlparse
-from .auth import verify_token
+from . import paddle_client
+from .firebase_client import initialize_firebase, get_db
+from .paddle_api import get_transactions_page
+from .transaction_mirror import format_transaction, transaction_type, list_mirrored_transactions
+from .base_handler import JsonHandler, HttpError, private_cache_control
+from .logging_config import get_logger
+from .telemetry import firestore_op
 import os
-import requests
+import base64
 import datetime
-import firebase_admin
-from firebase_admin import credentials, firestore, auth
 
-# Initialize Firebase
-firebase_initialized = False
-db = None
+logger = get_logger(__name__)
 
-# Add these global variables
-API_KEY = os.getenv("PADDLE_API_KEY")
-API_BASE_URL = os.getenv("PADDLE_API_BASE_URL", "https://api.paddle.com").rstrip('/')
+# Page size limits for /api/transactions
+DEFAULT_PAGE_SIZE = 25
+MAX_PAGE_SIZE = 100
 
-def initialize_firebase():
-    global firebase_initialized, db
-    if not firebase_initialized:
-        try:
-            firebase_credentials_json = os.environ.get("FIREBASE_SERVICE_ACCOUNT")
-            if firebase_credentials_json:
-                firebase_credentials_dict = json.loads(firebase_credentials_json)
-                cred = credentials.Certificate(firebase_credentials_dict)
-                
-                if not firebase_admin._apps:
-                    firebase_admin.initialize_app(cred)
-                
-                db = firestore.client()
-                firebase_initialized = True
-                return True
-        except Exception as e:
-            print(f"Firebase initialization error: {e}")
-    return firebase_initialized
+# Browser cache lifetime for mirrored transaction pages. 0 (the default) sends
+# "private, no-cache": the browser revalidates every time and gets a 304 when
+# the ETag still matches, so a new purchase or another signed-in account is
+# never served from a stale copy.
+TRANSACTIONS_MAX_AGE = int(os.getenv("TRANSACTIONS_MAX_AGE", "0"))
 
-class handler(BaseHTTPRequestHandler):
-    def do_GET(self):
-        # Set CORS headers
-        self.send_response(200)
-        self.send_header('Content-Type', 'application/json')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
-        self.end_headers()
-        
-        # Get authorization token
-        auth_header = self.headers.get('Authorization')
-        token = None
-        
-        if auth_header and auth_header.startswith('Bearer '):
-            token = auth_header[7:]
-        
-        if not token:
-            self.wfile.write(json.dumps({
-                'error': 'Authorization token required'
-            }).encode())
-            return
-        
-        # Verify token
-        user_data = verify_token(token)
-        if not user_data:
-            self.wfile.write(json.dumps({
-                'error': 'Invalid or expired token'
-            }).encode())
-            return
+def period_start(period, now=None):
+    """Return the UTC start of a dashboard period filter, or None for all time"""
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    if period == 'month':
+        return datetime.datetime(now.year, now.month, 1, tzinfo=datetime.timezone.utc)
+    if period == '3month':
+        year, month = now.year, now.month - 3
+        if month < 1:
+            year, month = year - 1, month + 12
+        return datetime.datetime(year, month, 1, tzinfo=datetime.timezone.utc)
+    if period == 'year':
+        return datetime.datetime(now.year, 1, 1, tzinfo=datetime.timezone.utc)
+    return None
+
+def parse_limit(value):
+    """Clamp the requested page size to 1..MAX_PAGE_SIZE"""
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+def encode_cursor(after):
+    """Wrap a transaction id to resume after in an opaque cursor"""
+    if not after:
+        return None
+    return base64.urlsafe_b64encode(json.dumps({'after': after}).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Return the transaction id to resume after from an opaque cursor, or None if invalid"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        return json.loads(base64.urlsafe_b64decode(padded.encode())).get('after')
+    except (ValueError, AttributeError):
+        return None
+
+def iter_formatted_transactions(transactions, type_filter=None):
+    """Yield dashboard-formatted transactions, applying the type filter"""
+    for trans in transactions:
+        # Paddle cannot filter by our transaction type, so apply it to the page
+        if type_filter and transaction_type(trans) != type_filter:
+            continue
+        yield format_transaction(trans)
+
+class handler(JsonHandler):
+    route = '/api/transactions'
+    methods = ('GET', 'POST')
+    allow_headers = 'Content-Type, Authorization, If-None-Match'
+
+    def get(self):
+        user_data = self.user
         
         try:
+            # Parse filters and pagination
+            type_filter = self.query_param('type')
+            billed_since = period_start(self.query_param('period'))
+            limit = parse_limit(self.query_param('limit'))
+            after = decode_cursor(self.query_param('cursor'))
+            source = self.query_param('source')
+            
             # Initialize Firebase and get customer ID from Firestore
             if initialize_firebase():
                 user_id = user_data.get('user_id')
-                user_ref = db.collection('users').document(user_id)
-                user_doc = user_ref.get()
+                user_ref = get_db().collection('users').document(user_id)
+                with firestore_op('users', 'get'):
+                    user_doc = user_ref.get()
                 
                 if user_doc.exists:
                     user_firestore_data = user_doc.to_dict()
+                    
+                    # Serve from the Firestore mirror once it has been synced, unless bypassed
+                    if source != 'paddle' and user_firestore_data.get('transactionsSyncedAt'):
+                        transactions, next_after = list_mirrored_transactions(
+                            user_id, type_filter, billed_since, limit, after
+                        )
+                        body = json.dumps({
+                            'transactions': transactions,
+                            'next_cursor': encode_cursor(next_after)
+                        }).encode()
+                        self.send_cacheable(body, private_cache_control(TRANSACTIONS_MAX_AGE))
+                        return
+                    
                     paddle_customer_id = user_firestore_data.get('paddleCustomerId')
                     
                     if paddle_customer_id:
-                        print(f"Found Paddle customer ID in Firestore: {paddle_customer_id}")
+                        logger.debug("Found Paddle customer ID in Firestore: %s", paddle_customer_id)
                         
-                        # Get transactions directly using customer ID
-                        API_KEY = os.getenv("PADDLE_API_KEY")
-                        API_BASE_URL = os.getenv("PADDLE_API_BASE_URL", "https://api.paddle.com")
+                        # Get one page of transactions, with filters pushed down to Paddle
+                        transactions, next_after = get_transactions_page(
+                            paddle_customer_id, per_page=limit, after=after, billed_since=billed_since
+                        )
                         
-                        headers = {
-                            "Authorization": f"Bearer {API_KEY}",
-                            "Content-Type": "application/json"
-                        }
-                        
-                        # Get transactions using customer ID - ensure API_BASE_URL is properly formatted
-                        API_BASE_URL = API_BASE_URL.rstrip('/')
-                        url = f'{API_BASE_URL}/transactions'
-                        params = {
-                            'customer_id': paddle_customer_id,
-                            'status': ['completed', 'billed']  # Use list format for multiple statuses
-                        }
-
-                        print(f"Fetching transactions from URL: {url}")
-                        print(f"With params: {params}")
-                        print(f"API_BASE_URL from env: {API_BASE_URL}")
-                        
-                        response = requests.get(url, headers=headers, params=params)
-                        
-                        if response.status_code == 200:
-                            data = response.json()
-                            transactions = data.get('data', [])
-                            
-                            # Format transactions for frontend
-                            formatted_transactions = []
-                            for trans in transactions:
-                                print(f"Processing transaction: {json.dumps(trans, indent=2)}")
-                                # Get amount
-                                details = trans.get('details', {})
-                                totals = details.get('totals', {})
-                                amount = float(totals.get('grand_total', '0')) / 100
-                                
-                                # Get description from items
-                                description = 'Payment'
-                                items = trans.get('items', [])
-                                if items:
-                                    price = items[0].get('price', {})
-                                    description = price.get('description') or price.get('name', 'Payment')
-                                
-                                # Look for invoice in different places
-                                invoice_id = trans.get('invoice_id')
-                                invoice_number = trans.get('invoice_number')
-                                # Check if there's invoice info in details
-                                if not invoice_id and 'invoice' in trans:
-                                    invoice_id = trans['invoice'].get('id')
-                                # Check billing details
-                                if not invoice_id:
-                                    billing = trans.get('billing', {})
-                                    invoice_id = billing.get('invoice_id')
-
-                                print(f"Found invoice_id: {invoice_id}, invoice_number: {invoice_number}")
-
-                                formatted_transaction = {
-                                    'id': trans.get('id'),
-                                    'date': trans.get('billed_at') or trans.get('created_at', ''),
-                                    'description': description,
-                                    'amount': amount,
-                                    'status': trans.get('status', 'completed'),
-                                    'type': 'subscription',
-                                    'invoiceId': trans.get('invoice_id'),  # ADD THIS LINE
-                                    'invoiceNumber': trans.get('invoice_number'),  # ADD THIS LINE
-                                    'invoiceUrl': None,
-                                    'currency': trans.get('currency_code', 'USD')
-                                }
-                                formatted_transactions.append(formatted_transaction)
-                            
-                            self.wfile.write(json.dumps(formatted_transactions).encode())
+                        if transactions is not None:
+                            # Format and encode transactions one at a time as they are written
+                            self.send_json_stream(200, {
+                                'transactions': iter_formatted_transactions(transactions, type_filter),
+                                'next_cursor': encode_cursor(next_after)
+                            })
                             return
-                        else:
-                            print(f"Paddle API error: {response.status_code} - {response.text}")
             
             # If we get here, something went wrong
-            self.wfile.write(json.dumps([]).encode())
+            return {
+                'transactions': [],
+                'next_cursor': None
+            }
             
         except Exception as e:
-            print(f"Error: {str(e)}")
-            import traceback
-            print(traceback.format_exc())
-            self.wfile.write(json.dumps({
-                'error': str(e)
-            }).encode())
+            logger.exception("Error: %s", e)
+            raise HttpError(500, str(e))
 
-    def do_POST(self):
+    def post(self):
         """Handle POST request to send invoice email"""
-        # Set CORS headers for POST
-        self.send_response(200)
-        self.send_header('Content-Type', 'application/json') 
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
+        data = self.json_body()
         
-        try:
-            # Get authorization token
-            auth_header = self.headers.get('Authorization', '')
-            if not auth_header.startswith('Bearer '):
-                self.end_headers()
-                self.wfile.write(json.dumps({
-                    'error': 'No valid authorization token provided'
-                }).encode())
-                return
-                
-            token = auth_header.split(' ')[1]
-            
-            # Initialize Firebase if needed
-            if not firebase_initialized:
-                initialize_firebase()
-            
-            # Verify Firebase token
-            try:
-                decoded_token = auth.verify_id_token(token)
-                user_id = decoded_token['uid']
-            except Exception as e:
-                print(f"Token verification failed: {e}")
-                self.end_headers()
-                self.wfile.write(json.dumps({
-                    'error': 'Invalid authorization token'
-                }).encode())
-                return
-            
-            # Read request body
-            content_length = int(self.headers.get('Content-Length', 0))
-            body = self.rfile.read(content_length)
-            data = json.loads(body.decode('utf-8'))
-            
-            transaction_id = data.get('transactionId')
-            print(f"Received transaction ID: {transaction_id}")
-            
-            if not transaction_id:
-                self.end_headers()
-                self.wfile.write(json.dumps({
-                    'error': 'Transaction ID required'
-                }).encode())
-                return
-            
-            # Get Paddle API credentials
-            API_KEY = os.getenv("PADDLE_API_KEY")
-            API_BASE_URL = os.getenv("PADDLE_API_BASE_URL", "https://api.paddle.com").rstrip('/')
-            
-            # Get the transaction to find the invoice ID
-            headers = {
-                "Authorization": f"Bearer {API_KEY}",
-                "Accept": "application/json"
-            }
+        transaction_id = data.get('transactionId')
+        logger.debug("Received transaction ID: %s", transaction_id)
+        
+        if not transaction_id:
+            raise HttpError(400, 'Transaction ID required')
+        
+        # First, try to get the transaction to find the invoice ID
+        logger.debug("Fetching transaction: %s", transaction_id)
+        
+        response = paddle_client.get(f'/transactions/{transaction_id}')
+        logger.debug("Transaction response status: %s", response.status_code)
+        
+        if response.status_code != 200:
+            logger.error("Failed to get transaction: %s", response.status_code)
+            logger.debug("Response: %s", response.text)
             
-            # First, try to get the transaction
-            url = f"{API_BASE_URL}/transactions/{transaction_id}"
-            print(f"Fetching transaction from: {url}")
+            # If transaction not found, let's check if we can get the invoice directly
+            # Sometimes the transaction ID is actually an invoice ID
+            logger.debug("Trying to fetch as invoice: %s", transaction_id)
             
-            response = requests.get(url, headers=headers)
-            print(f"Transaction response status: {response.status_code}")
+            invoice_response = paddle_client.get(f'/invoices/{transaction_id}')
             
-            if response.status_code != 200:
-                print(f"Failed to get transaction: {response.status_code}")
-                print(f"Response: {response.text}")
-                
-                # If transaction not found, let's check if we can get the invoice directly
-                # Sometimes the transaction ID is actually an invoice ID
-                invoice_url = f"{API_BASE_URL}/invoices/{transaction_id}"
-                print(f"Trying to fetch as invoice from: {invoice_url}")
-                
-                invoice_response = requests.get(invoice_url, headers=headers)
-                
-                if invoice_response.status_code == 200:
-                    # It was an invoice ID, not a transaction ID
-                    invoice_id = transaction_id
-                else:
-                    self.end_headers()
-                    self.wfile.write(json.dumps({
-                        'error': 'Transaction not found'
-                    }).encode())
-                    return
+            if invoice_response.status_code == 200:
+                # It was an invoice ID, not a transaction ID
+                invoice_id = transaction_id
             else:
-                # Get invoice ID from transaction
-                transaction_data = response.json()
-                print(f"Transaction data: {json.dumps(transaction_data, indent=2)}")
+                raise HttpError(404, 'Transaction not found')
+        else:
+            # Get invoice ID from transaction
+            transaction_data = response.json()
 
-                # Look for invoice in various places within the Paddle response
-                invoice_id = None
+            # Look for invoice in various places within the Paddle response
+            invoice_id = None
 
-                # Try different paths in the response
-                data_obj = transaction_data.get('data', {})
-                invoice_id = data_obj.get('invoice_id')
+            # Try different paths in the response
+            data_obj = transaction_data.get('data', {})
+            invoice_id = data_obj.get('invoice_id')
 
-                if not invoice_id:
-                    # Check billing field
-                    billing = data_obj.get('billing', {})
-                    invoice_id = billing.get('invoice_id')
+            if not invoice_id:
+                # Check billing field
+                billing = data_obj.get('billing', {})
+                invoice_id = billing.get('invoice_id')
 
-                if not invoice_id:
-                    # Check details
-                    details = data_obj.get('details', {})
-                    invoice_id = details.get('invoice_id')
+            if not invoice_id:
+                # Check details
+                details = data_obj.get('details', {})
+                invoice_id = details.get('invoice_id')
 
-                if not invoice_id:
-                    print("No invoice ID found in transaction data")
-                    self.end_headers()
-                    self.wfile.write(json.dumps({
-                        'error': 'No invoice found for this transaction',
-                        'details': 'Transaction exists but no invoice associated'
-                    }).encode())
-                    return
-            
-            print(f"Invoice ID found: {invoice_id}")
-            
-            # Get the invoice details first to see if it exists
-            invoice_details_url = f"{API_BASE_URL}/invoices/{invoice_id}"
-            invoice_details_response = requests.get(invoice_details_url, headers=headers)
-            
-            if invoice_details_response.status_code != 200:
-                print(f"Invoice not found: {invoice_details_response.status_code}")
-                print(f"Response: {invoice_details_response.text}")
-                self.end_headers()
-                self.wfile.write(json.dumps({
-                    'error': 'Invoice not found'
-                }).encode())
-                return
-                
-            # Now get the PDF (which in Paddle also sends the email)
-            pdf_url = f"{API_BASE_URL}/invoices/{invoice_id}/pdf"
-            print(f"Getting invoice PDF from: {pdf_url}")
-            
-            pdf_response = requests.get(pdf_url, headers=headers)
-            
-            if pdf_response.status_code == 200:
-                self.end_headers()
-                self.wfile.write(json.dumps({
-                    "success": True,
-                    "message": "Invoice email sent successfully",
-                    "invoiceId": invoice_id
-                }).encode())
-            else:
-                print(f"Failed to get invoice PDF: {pdf_response.status_code}")
-                print(f"Response: {pdf_response.text}")
-                self.end_headers()
-                self.wfile.write(json.dumps({
-                    'error': 'Failed to send invoice email'
-                }).encode())
-            
-        except Exception as e:
-            print(f"Send invoice error: {e}")
-            import traceback
-            print(traceback.format_exc())
-            
-            if not self._headers_buffer:  # Only send headers if not already sent
-                self.end_headers()
+            if not invoice_id:
+                logger.info("No invoice ID found in transaction data")
+                raise HttpError(404, 'No invoice found for this transaction',
+                                details='Transaction exists but no invoice associated')
+        
+        logger.debug("Invoice ID found: %s", invoice_id)
+        
+        # Get the invoice details first to see if it exists
+        invoice_details_response = paddle_client.get(f'/invoices/{invoice_id}')
+        
+        if invoice_details_response.status_code != 200:
+            logger.info("Invoice not found: %s", invoice_details_response.status_code)
+            logger.debug("Response: %s", invoice_details_response.text)
+            raise HttpError(404, 'Invoice not found')
             
-            self.wfile.write(json.dumps({
-                'error': str(e)
-            }).encode())
-
-    def do_OPTIONS(self):
-        self.send_response(200)
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
-        self.end_headers()
\ No newline at end of file
+        # Now get the PDF (which in Paddle also sends the email)
+        logger.debug("Getting invoice PDF for: %s", invoice_id)
+        
+        pdf_response = paddle_client.get(f'/invoices/{invoice_id}/pdf')
+        
+        if pdf_response.status_code != 200:
+            logger.error("Failed to get invoice PDF: %s", pdf_response.status_code)
+            logger.debug("Response: %s", pdf_response.text)
+            raise HttpError(502, 'Failed to send invoice email')
+        
+        return {
+            "success": True,
+            "message": "Invoice email sent successfully",
+            "invoiceId": invoice_id
+        }
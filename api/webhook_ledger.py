@@ -0,0 +1,99 @@
+import os
+import time
+import datetime
+import threading
+from collections import OrderedDict
+from .firebase_client import get_db
+from .logging_config import get_logger
+from .telemetry import firestore_op
+
+logger = get_logger(__name__)
+
+# Durable record of processed Paddle events: paddle_webhook_events/{event_id}
+LEDGER_COLLECTION = 'paddle_webhook_events'
+
+# Paddle keeps events for 90 days and paddle_replay can replay any of them,
+# so entries must outlive that. Configure a Firestore TTL policy on
+# 'expires_at' to purge old entries.
+LEDGER_RETENTION_DAYS = int(os.getenv("WEBHOOK_LEDGER_RETENTION_DAYS", "95"))
+
+# In-memory front so a replayed event on a warm instance costs no Firestore read
+LEDGER_MEMORY_TTL = int(os.getenv("WEBHOOK_LEDGER_MEMORY_TTL", "3600"))
+LEDGER_MEMORY_MAX_ENTRIES = 10000
+
+_seen = OrderedDict()
+_seen_lock = threading.Lock()
+
+def remember_event(event_id):
+    """Remember on this instance that an event was applied"""
+    with _seen_lock:
+        _seen[event_id] = time.monotonic() + LEDGER_MEMORY_TTL
+        _seen.move_to_end(event_id)
+        while len(_seen) > LEDGER_MEMORY_MAX_ENTRIES:
+            _seen.popitem(last=False)
+
+def _seen_recently(event_id):
+    with _seen_lock:
+        expires_at = _seen.get(event_id)
+        if expires_at is None:
+            return False
+        if expires_at <= time.monotonic():
+            del _seen[event_id]
+            return False
+        return True
+
+def is_event_processed(event_id):
+    """Check whether a Paddle event has already been applied"""
+    if not event_id:
+        return False
+
+    if _seen_recently(event_id):
+        return True
+
+    db = get_db()
+    if not db:
+        return False
+
+    try:
+        with firestore_op(LEDGER_COLLECTION, 'get'):
+            doc = db.collection(LEDGER_COLLECTION).document(event_id).get()
+    except Exception as e:
+        logger.error("Webhook ledger read error for %s: %s", event_id, e)
+        return False
+
+    if doc.exists:
+        remember_event(event_id)
+        return True
+    return False
+
+def mark_event_processed(event_id, event_type, transaction_id=None, batch=None):
+    """Record a successfully applied Paddle event in the ledger.
+
+    With a batch the entry is staged with create(), so a concurrent delivery
+    of the same event makes the second commit fail with AlreadyExists; call
+    remember_event once the batch has been committed.
+    """
+    if not event_id:
+        return
+
+    db = get_db()
+    if not db:
+        return
+
+    from firebase_admin import firestore
+    ledger_ref = db.collection(LEDGER_COLLECTION).document(event_id)
+    entry = {
+        'event_type': event_type,
+        'transaction_id': transaction_id,
+        'processed_at': firestore.SERVER_TIMESTAMP,
+        'expires_at': datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=LEDGER_RETENTION_DAYS)
+    }
+    if batch is not None:
+        batch.create(ledger_ref, entry)
+        return
+
+    remember_event(event_id)
+    try:
+        ledger_ref.set(entry)
+    except Exception as e:
+        logger.error("Webhook ledger write error for %s: %s", event_id, e)
@@ -0,0 +1,187 @@
+import os
+import time
+import random
+import datetime
+import threading
+from .firebase_client import get_db
+
+# Raw webhook deliveries waiting to be processed: paddle_webhook_queue/{event_id}
+QUEUE_COLLECTION = 'paddle_webhook_queue'
+DEAD_LETTER_COLLECTION = 'paddle_webhook_dead_letter'
+
+# How long a claimed item stays invisible to other workers before it can be retried
+QUEUE_LEASE_SECONDS = int(os.getenv("WEBHOOK_QUEUE_LEASE_SECONDS", "120"))
+QUEUE_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_QUEUE_MAX_ATTEMPTS", "8"))
+QUEUE_RETRY_BASE_DELAY = 10  # Seconds, doubled on every attempt
+QUEUE_RETRY_MAX_DELAY = 3600
+
+def retry_delay(attempts):
+    """Exponential backoff with jitter for a failed queue item"""
+    delay = min(QUEUE_RETRY_MAX_DELAY, QUEUE_RETRY_BASE_DELAY * (2 ** max(attempts - 1, 0)))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+class FirestoreQueue:
+    """Durable webhook queue stored in Firestore.
+
+    Items are visible once available_at has passed. Claiming an item pushes
+    available_at forward by the lease, so an item whose worker dies becomes
+    claimable again. Completed items are deleted; items that keep failing
+    or can never succeed are moved to the dead-letter collection.
+    """
+
+    def __init__(self, db=None):
+        self.db = db or get_db()
+
+    def enqueue(self, event_id, payload, event_type=None):
+        """Persist a raw webhook body. Returns False if the event is already queued"""
+        from google.api_core.exceptions import AlreadyExists
+
+        queue_ref = self.db.collection(QUEUE_COLLECTION)
+        doc_ref = queue_ref.document(event_id) if event_id else queue_ref.document()
+        try:
+            doc_ref.create({
+                'payload': payload,
+                'event_type': event_type,
+                'attempts': 0,
+                'last_error': None,
+                'available_at': _now(),
+                'received_at': _now()
+            })
+        except AlreadyExists:
+            return False
+        return True
+
+    def claim_batch(self, limit):
+        """Lease up to limit available items and return them"""
+        query = (self.db.collection(QUEUE_COLLECTION)
+                 .where('available_at', '<=', _now())
+                 .order_by('available_at')
+                 .limit(limit))
+
+        claimed = []
+        for snapshot in query.stream():
+            transaction = self.db.transaction()
+            item = _claim_item(transaction, snapshot.reference)
+            if item:
+                claimed.append(item)
+        return claimed
+
+    def complete(self, item):
+        self.db.collection(QUEUE_COLLECTION).document(item['id']).delete()
+
+    def fail(self, item, error, retry=True):
+        """Schedule a retry, or dead-letter the item if retry is False or it runs out of attempts"""
+        doc_ref = self.db.collection(QUEUE_COLLECTION).document(item['id'])
+        if not retry or item['attempts'] >= QUEUE_MAX_ATTEMPTS:
+            batch = self.db.batch()
+            batch.set(self.db.collection(DEAD_LETTER_COLLECTION).document(item['id']), {
+                'payload': item['payload'],
+                'event_type': item.get('event_type'),
+                'attempts': item['attempts'],
+                'last_error': error,
+                'dead_lettered_at': _now()
+            })
+            batch.delete(doc_ref)
+            batch.commit()
+            return
+        doc_ref.update({
+            'last_error': error,
+            'available_at': _now() + datetime.timedelta(seconds=retry_delay(item['attempts']))
+        })
+
+def _claim_item(transaction, doc_ref):
+    from firebase_admin import firestore
+
+    @firestore.transactional
+    def claim(transaction):
+        snapshot = doc_ref.get(transaction=transaction)
+        if not snapshot.exists:
+            return None
+        data = snapshot.to_dict()
+        if data.get('available_at') and data['available_at'] > _now():
+            return None  # Claimed by another worker in the meantime
+        attempts = data.get('attempts', 0) + 1
+        transaction.update(doc_ref, {
+            'attempts': attempts,
+            'available_at': _now() + datetime.timedelta(seconds=QUEUE_LEASE_SECONDS)
+        })
+        return {
+            'id': doc_ref.id,
+            'payload': data.get('payload'),
+            'event_type': data.get('event_type'),
+            'attempts': attempts
+        }
+
+    return claim(transaction)
+
+class InMemoryQueue:
+    """Process-local stand-in for FirestoreQueue with the same interface"""
+
+    def __init__(self):
+        self.items = {}
+        self.dead_letters = {}
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def enqueue(self, event_id, payload, event_type=None):
+        with self._lock:
+            if not event_id:
+                self._counter += 1
+                event_id = f"local_{self._counter}"
+            if event_id in self.items:
+                return False
+            self.items[event_id] = {
+                'id': event_id,
+                'payload': payload,
+                'event_type': event_type,
+                'attempts': 0,
+                'last_error': None,
+                'available_at': time.time()
+            }
+            return True
+
+    def claim_batch(self, limit):
+        now = time.time()
+        with self._lock:
+            available = sorted(
+                (item for item in self.items.values() if item['available_at'] <= now),
+                key=lambda item: item['available_at']
+            )[:limit]
+            claimed = []
+            for item in available:
+                item['attempts'] += 1
+                item['available_at'] = now + QUEUE_LEASE_SECONDS
+                claimed.append(dict(item))
+            return claimed
+
+    def complete(self, item):
+        with self._lock:
+            self.items.pop(item['id'], None)
+
+    def fail(self, item, error, retry=True):
+        with self._lock:
+            stored = self.items.get(item['id'])
+            if stored is None:
+                return
+            stored['last_error'] = error
+            if not retry or stored['attempts'] >= QUEUE_MAX_ATTEMPTS:
+                self.dead_letters[item['id']] = self.items.pop(item['id'])
+            else:
+                stored['available_at'] = time.time() + retry_delay(stored['attempts'])
+
+_queue = None
+
+def get_queue():
+    """Return the webhook queue used by ingestion and the worker"""
+    global _queue
+    if _queue is None:
+        _queue = FirestoreQueue()
+    return _queue
+
+def set_queue(queue):
+    """Swap the webhook queue (e.g. an InMemoryQueue in tests)"""
+    global _queue
+    _queue = queue
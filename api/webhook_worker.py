@@ -0,0 +1,105 @@
+import os
+import json
+import hmac
+import time
+from .firebase_client import initialize_firebase
+from .base_handler import JsonHandler, HttpError
+from .logging_config import get_logger
+from .webhook_queue import get_queue
+from .paddle_webhook import process_event
+from .customer_name_sync import sync_pending_names
+from .transaction_mirror import reconcile_batch
+
+logger = get_logger(__name__)
+
+# Drain settings for one worker run
+WORKER_BATCH_SIZE = int(os.getenv("WEBHOOK_WORKER_BATCH_SIZE", "25"))
+WORKER_MAX_BATCHES = int(os.getenv("WEBHOOK_WORKER_MAX_BATCHES", "10"))
+
+# Seconds into a worker run after which no new customer name sync is started,
+# so the run finishes inside the function's time limit
+WORKER_NAME_SYNC_DEADLINE = int(os.getenv("WEBHOOK_WORKER_NAME_SYNC_DEADLINE", "30"))
+
+# Shared secret sent by the scheduler as "Authorization: Bearer <secret>"
+CRON_SECRET = os.getenv("CRON_SECRET")
+
+# The cron in vercel.json runs the worker once a day, the most often Vercel's
+# Hobby plan allows. With WEBHOOK_PROCESSING_MODE=queue, events wait for the
+# next run, so queue mode needs a plan with sub-daily crons (Pro) and a
+# tighter schedule such as "*/5 * * * *".
+
+def process_item(item):
+    """Process one queued webhook body. Returns (success, error, retry).
+
+    retry is False when the payload itself is unusable, since no later
+    attempt could succeed.
+    """
+    try:
+        webhook_data = json.loads(item['payload'])
+    except (TypeError, ValueError) as e:
+        return False, f"Invalid queued payload: {e}", False
+    if not isinstance(webhook_data, dict):
+        return False, "Invalid queued payload: not a JSON object", False
+
+    try:
+        result = process_event(webhook_data)
+    except Exception as e:
+        logger.exception("Error processing queued event %s: %s", item['id'], e)
+        return False, str(e), True
+
+    if result.get('success'):
+        return True, None, False
+    return False, f"Handler failed for {result.get('event_processed')}", True
+
+def drain_queue(queue=None, batch_size=WORKER_BATCH_SIZE, max_batches=WORKER_MAX_BATCHES):
+    """Claim and process queued events in batches, retrying or dead-lettering failures"""
+    queue = queue or get_queue()
+    stats = {'processed': 0, 'failed': 0}
+
+    for _ in range(max_batches):
+        items = queue.claim_batch(batch_size)
+        if not items:
+            break
+
+        for item in items:
+            success, error, retry = process_item(item)
+            if success:
+                queue.complete(item)
+                stats['processed'] += 1
+            else:
+                logger.error("Queued event %s failed on attempt %s: %s", item['id'], item['attempts'], error)
+                queue.fail(item, error, retry=retry)
+                stats['failed'] += 1
+
+    logger.info("Webhook worker run finished: %s", stats)
+    return stats
+
+class handler(JsonHandler):
+    route = '/api/webhook_worker'
+    require_auth = False
+
+    def get(self):
+        """Drain the webhook queue, sync changed customer names and reconcile a slice of transaction mirrors - triggered by the cron in vercel.json"""
+        if not CRON_SECRET:
+            logger.error("CRON_SECRET is not configured; rejecting worker run")
+            raise HttpError(503, 'Worker authentication is not configured')
+        auth_header = self.headers.get('Authorization', '')
+        if not hmac.compare_digest(auth_header, f"Bearer {CRON_SECRET}"):
+            raise HttpError(401, 'Unauthorized')
+
+        deadline = time.monotonic() + WORKER_NAME_SYNC_DEADLINE
+        if not initialize_firebase():
+            raise HttpError(500, 'Failed to initialize Firebase', success=False)
+
+        stats = drain_queue()
+        return {
+            'success': True,
+            **stats,
+            'name_sync': sync_pending_names(deadline=deadline),
+            'transaction_sync': reconcile_batch()
+        }
+
+if __name__ == '__main__':
+    # Run one drain from the command line: python -m api.webhook_worker
+    if initialize_firebase():
+        print(json.dumps({**drain_queue(), 'name_sync': sync_pending_names()}))
@@ -5,13 +5,16 @@ const ApiService = {
     // Base API URL
     baseUrl: '/api',
     
+    // Last ETag and response body per GET URL, for conditional requests
+    validators: {},
+    
     // Get authentication token
     getToken: function() {
         // Get Firebase auth token instead of local storage token
         return new Promise((resolve, reject) => {
             const user = firebase.auth().currentUser;
             if (user) {
-                user.getIdToken(true)
+                user.getIdToken()
                     .then(token => resolve(token))
                     .catch(error => reject(error));
             } else {
@@ -53,8 +56,18 @@ const ApiService = {
                 options.body = JSON.stringify(data);
             }
             
+            // Revalidate with the last ETag; a 304 reuses the stored body
+            const cached = method === 'GET' ? this.validators[url] : null;
+            if (cached) {
+                headers['If-None-Match'] = cached.etag;
+            }
+            
             const response = await fetch(url, options);
             
+            if (response.status === 304 && cached) {
+                return cached.data;
+            }
+            
             if (!response.ok) {
                 if (response.status === 401) {
                     // Token expired or invalid, redirect to login
@@ -66,7 +79,16 @@ const ApiService = {
                 throw new Error(errorData.error || 'API request failed');
             }
             
-            return await response.json();
+            const result = await response.json();
+            const etag = response.headers.get('ETag');
+            if (method === 'GET' && etag) {
+                this.validators[url] = { etag, data: result };
+            } else if (method !== 'GET') {
+                // Writes may change what the GET endpoints return
+                this.validators = {};
+            }
+            
+            return result;
         } catch (error) {
             console.error(`API error (${method} ${endpoint}):`, error);
             throw error;
@@ -117,5 +139,10 @@ const ApiService = {
             license_key: licenseKey, 
             device_id: deviceId 
         });
+    },
+    
+    // Validate many licenses in one request: [{ license_key, device_id }, ...]
+    validateLicenseBatch: function(licenses) {
+        return this.request('/license?action=validate_batch', 'POST', { licenses });
     }
 };
\ No newline at end of file
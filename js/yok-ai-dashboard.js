@@ -87,7 +87,7 @@ async function fetchClientToken() {
         }
         
         // Get Firebase ID token
-        const authToken = await user.getIdToken(true);
+        const authToken = await user.getIdToken();
         
         // Call server token endpoint
         const response = await fetch('/api/paddle_token', {
@@ -430,6 +430,7 @@ let subscriptionStatus = null;
 let creditUsage = { used: 0, total: 0 };
 let licenseKey = null;
 let transactionHistory = [];
+let transactionNextCursor = null;
 let currentSection = 'dashboard-section';
 let checkVerificationInterval = null;
 const verificationCheckDelay = 10000; // Check every 10 seconds if email is verified
@@ -1206,7 +1207,7 @@ const Dashboard = {
         console.log("Starting dashboard data load");
         
         // Get Firebase token
-        currentUser.getIdToken(true)
+        currentUser.getIdToken()
             .then(token => {
                 console.log("Firebase token obtained, calling dashboard API");
                 // Call the API with Firebase token
@@ -1801,26 +1802,9 @@ const Dashboard = {
     },
 
     /**
-     * Load transaction history with Firebase authentication
+     * Fetch one page of transactions for the current filters, optionally after a cursor
      */
-    loadTransactionHistory: function() {
-        if (!currentUser) {
-            console.error("No authenticated user to load transactions");
-            return;
-        }
-        
-        const transactionsBody = document.getElementById('transactions-body');
-        if (!transactionsBody) return;
-        
-        // Show loading indicator
-        transactionsBody.innerHTML = `
-            <tr>
-                <td colspan="5" class="text-center">
-                    <div class="loading-indicator"><i class="fas fa-spinner fa-spin"></i> Loading transactions...</div>
-                </td>
-            </tr>
-        `;
-        
+    fetchTransactionsPage: function(cursor) {
         // Get filter values if they exist
         const typeFilter = document.getElementById('transaction-type')?.value || 'all';
         const periodFilter = document.getElementById('transaction-period')?.value || 'all';
@@ -1829,9 +1813,10 @@ const Dashboard = {
         const queryParams = new URLSearchParams();
         if (typeFilter !== 'all') queryParams.append('type', typeFilter);
         if (periodFilter !== 'all') queryParams.append('period', periodFilter);
+        if (cursor) queryParams.append('cursor', cursor);
         
         // Get Firebase token
-        currentUser.getIdToken(true)
+        return currentUser.getIdToken()
             .then(token => {
                 // Call the API with Firebase token
                 return fetch(`/api/transactions?${queryParams.toString()}`, {
@@ -1848,11 +1833,43 @@ const Dashboard = {
                 return response.json();
             })
             .then(data => {
+                // Keep the cursor for the next page
+                transactionNextCursor = (data && data.next_cursor) || null;
+                return (data && data.transactions) || [];
+            });
+    },
+
+    /**
+     * Load transaction history with Firebase authentication
+     */
+    loadTransactionHistory: function() {
+        if (!currentUser) {
+            console.error("No authenticated user to load transactions");
+            return;
+        }
+        
+        const transactionsBody = document.getElementById('transactions-body');
+        if (!transactionsBody) return;
+        
+        // Show loading indicator
+        transactionsBody.innerHTML = `
+            <tr>
+                <td colspan="5" class="text-center">
+                    <div class="loading-indicator"><i class="fas fa-spinner fa-spin"></i> Loading transactions...</div>
+                </td>
+            </tr>
+        `;
+        transactionNextCursor = null;
+        Dashboard.updateLoadMoreButton();
+        
+        Dashboard.fetchTransactionsPage(null)
+            .then(transactions => {
                 // Store transaction data
-                transactionHistory = data || [];
+                transactionHistory = transactions;
                 
                 // Render transactions
                 Dashboard.renderTransactionHistory();
+                Dashboard.updateLoadMoreButton();
             })
             .catch(error => {
                 console.error('Error loading transactions:', error);
@@ -1872,6 +1889,40 @@ const Dashboard = {
             });
     },
 
+    /**
+     * Append the next page of transactions to the history
+     */
+    loadMoreTransactions: function() {
+        if (!currentUser || !transactionNextCursor) return;
+        
+        const loadMoreButton = document.getElementById('transactions-load-more');
+        if (loadMoreButton) loadMoreButton.disabled = true;
+        
+        Dashboard.fetchTransactionsPage(transactionNextCursor)
+            .then(transactions => {
+                transactionHistory = transactionHistory.concat(transactions);
+                Dashboard.renderTransactionHistory();
+            })
+            .catch(error => {
+                console.error('Error loading more transactions:', error);
+                Dashboard.showToast('Failed to load more transactions', 'error');
+            })
+            .finally(() => {
+                if (loadMoreButton) loadMoreButton.disabled = false;
+                Dashboard.updateLoadMoreButton();
+            });
+    },
+
+    /**
+     * Show the load more button only while another page exists
+     */
+    updateLoadMoreButton: function() {
+        const loadMoreButton = document.getElementById('transactions-load-more');
+        if (loadMoreButton) {
+            loadMoreButton.style.display = transactionNextCursor ? 'inline-block' : 'none';
+        }
+    },
+
     /**
      * Render transaction history
      */
@@ -2422,7 +2473,7 @@ const Dashboard = {
         Dashboard.showToast('Sending invoice to your email...', 'info');
         
         // Call the same transactions endpoint with POST method
-        currentUser.getIdToken(true)
+        currentUser.getIdToken()
             .then(token => {
                 return fetch('/api/transactions', {
                     method: 'POST',
@@ -2524,12 +2575,18 @@ const Dashboard = {
         const transactionTypeFilter = document.getElementById('transaction-type');
         const transactionPeriodFilter = document.getElementById('transaction-period');
 
+        // Filters are applied server-side, so reload when they change
         if (transactionTypeFilter) {
-            transactionTypeFilter.addEventListener('change', Dashboard.renderTransactionHistory);
+            transactionTypeFilter.addEventListener('change', Dashboard.loadTransactionHistory);
         }
 
         if (transactionPeriodFilter) {
-            transactionPeriodFilter.addEventListener('change', Dashboard.renderTransactionHistory);
+            transactionPeriodFilter.addEventListener('change', Dashboard.loadTransactionHistory);
+        }
+
+        const transactionsLoadMore = document.getElementById('transactions-load-more');
+        if (transactionsLoadMore) {
+            transactionsLoadMore.addEventListener('click', Dashboard.loadMoreTransactions);
         }
 
         // Set up billing cycle toggles if present
@@ -0,0 +1,264 @@
+import io
+import datetime
+import threading
+from collections import Counter
+import pytest
+from google.api_core.exceptions import AlreadyExists, NotFound
+from google.cloud.firestore_v1 import transforms
+from api import base_handler, firebase_client
+
+class FakeSnapshot:
+    def __init__(self, reference, data, update_time=None):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self.update_time = update_time if self.exists else None
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+class FakeDocument:
+    def __init__(self, db, path):
+        self._db = db
+        self.path = path
+        self.id = path.rsplit('/', 1)[-1]
+
+    def collection(self, name):
+        return FakeCollection(self._db, f'{self.path}/{name}')
+
+    def get(self, **kwargs):
+        self._db.rpcs['get'] += 1
+        return self._db._snapshot(self)
+
+    def set(self, data, merge=False):
+        self._db._commit([('set', self, data, merge)])
+
+    def update(self, data):
+        self._db._commit([('update', self, data, False)])
+
+    def create(self, data):
+        self._db._commit([('create', self, data, False)])
+
+    def delete(self):
+        self._db._commit([('delete', self, None, False)])
+
+class FakeCollection:
+    def __init__(self, db, path):
+        self._db = db
+        self.path = path
+
+    def document(self, document_id=None):
+        if document_id is None:
+            self._db.auto_ids += 1
+            document_id = f'auto{self._db.auto_ids}'
+        return FakeDocument(self._db, f'{self.path}/{document_id}')
+
+    def add(self, data):
+        doc_ref = self.document()
+        doc_ref.set(data)
+        return None, doc_ref
+
+    def where(self, field, op, value):
+        return FakeQuery(self).where(field, op, value)
+
+    def order_by(self, field, direction=None):
+        return FakeQuery(self).order_by(field, direction)
+
+    def limit(self, count):
+        return FakeQuery(self).limit(count)
+
+    def stream(self):
+        return FakeQuery(self).stream()
+
+    def documents(self):
+        """Stored documents directly under this collection, as {id: data}"""
+        prefix = f'{self.path}/'
+        return {path[len(prefix):]: data for path, data in self._db.docs.items()
+                if path.startswith(prefix) and '/' not in path[len(prefix):]}
+
+class FakeQuery:
+    """Filters, ordering and a limit over one collection's documents"""
+
+    OPERATORS = {
+        '==': lambda a, b: a == b,
+        '<': lambda a, b: a is not None and a < b,
+        '<=': lambda a, b: a is not None and a <= b,
+        '>': lambda a, b: a is not None and a > b,
+        '>=': lambda a, b: a is not None and a >= b,
+    }
+
+    def __init__(self, collection):
+        self._collection = collection
+        self._filters = []
+        self._order = None
+        self._limit = None
+
+    def where(self, field, op, value):
+        self._filters.append((field, self.OPERATORS[op], value))
+        return self
+
+    def order_by(self, field, direction=None):
+        self._order = (field, direction == 'DESCENDING')
+        return self
+
+    def limit(self, count):
+        self._limit = count
+        return self
+
+    def stream(self):
+        db = self._collection._db
+        db.rpcs['query'] += 1
+        matches = [(doc_id, data) for doc_id, data in self._collection.documents().items()
+                   if all(test(data.get(field), value) for field, test, value in self._filters)]
+        if self._order:
+            field, descending = self._order
+            matches.sort(key=lambda match: match[1].get(field), reverse=descending)
+        return [db._snapshot(self._collection.document(doc_id)) for doc_id, _ in matches[:self._limit]]
+
+class FakeBatch:
+    def __init__(self, db):
+        self._db = db
+        self._ops = []
+
+    def set(self, doc_ref, data, merge=False):
+        self._ops.append(('set', doc_ref, data, merge))
+
+    def update(self, doc_ref, data):
+        self._ops.append(('update', doc_ref, data, False))
+
+    def create(self, doc_ref, data):
+        self._ops.append(('create', doc_ref, data, False))
+
+    def delete(self, doc_ref):
+        self._ops.append(('delete', doc_ref, None, False))
+
+    def commit(self):
+        self._db._commit(self._ops)
+
+class FakeFirestore:
+    """In-memory Firestore with atomic batches and a count of RPCs by kind.
+
+    Supports the document, batch, get_all and simple query calls the api
+    modules make, including create() preconditions and the Increment,
+    ArrayUnion, ArrayRemove, SERVER_TIMESTAMP and DELETE_FIELD transforms.
+    """
+
+    def __init__(self):
+        self.docs = {}
+        self.update_times = {}
+        self.rpcs = Counter()
+        self.auto_ids = 0
+        self._lock = threading.Lock()
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def get_all(self, refs):
+        self.rpcs['get_all'] += 1
+        return [self._snapshot(ref) for ref in refs]
+
+    def _snapshot(self, doc_ref):
+        return FakeSnapshot(doc_ref, self.docs.get(doc_ref.path), self.update_times.get(doc_ref.path))
+
+    def _commit(self, ops):
+        with self._lock:
+            self.rpcs['commit'] += 1
+            docs = dict(self.docs)
+            for kind, doc_ref, data, merge in ops:
+                current = docs.get(doc_ref.path)
+                if kind == 'create' and current is not None:
+                    raise AlreadyExists(f'Document already exists: {doc_ref.path}')
+                if kind == 'update' and current is None:
+                    raise NotFound(f'No document to update: {doc_ref.path}')
+                if kind == 'delete':
+                    docs.pop(doc_ref.path, None)
+                    continue
+                base = current if kind == 'update' or merge else {}
+                docs[doc_ref.path] = _apply_fields(base or {}, data, dotted=kind == 'update')
+            self.docs = docs
+            # Every write in a commit shares its commit time, as in Firestore
+            commit_time = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(microseconds=self.rpcs['commit'])
+            for _, doc_ref, _, _ in ops:
+                self.update_times[doc_ref.path] = commit_time
+
+def _apply_fields(document, data, dotted):
+    document = _copy(document)
+    for key, value in data.items():
+        parts = key.split('.') if dotted else [key]
+        target = document
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        field = parts[-1]
+        if isinstance(value, dict) and not dotted and isinstance(target.get(field), dict):
+            target[field] = _apply_fields(target[field], value, dotted=False)
+        else:
+            _apply_value(target, field, value)
+    return document
+
+def _apply_value(target, field, value):
+    if value is transforms.DELETE_FIELD:
+        target.pop(field, None)
+    elif value is transforms.SERVER_TIMESTAMP:
+        target[field] = datetime.datetime.now(datetime.timezone.utc)
+    elif isinstance(value, transforms.Increment):
+        target[field] = (target.get(field) or 0) + value.value
+    elif isinstance(value, transforms.ArrayUnion):
+        existing = list(target.get(field) or [])
+        target[field] = existing + [item for item in value.values if item not in existing]
+    elif isinstance(value, transforms.ArrayRemove):
+        target[field] = [item for item in target.get(field) or [] if item not in value.values]
+    elif isinstance(value, dict):
+        target[field] = _apply_fields({}, value, dotted=False)
+    else:
+        target[field] = value
+
+def _copy(value):
+    if isinstance(value, dict):
+        return {key: _copy(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return list(value)
+    return value
+
+@pytest.fixture
+def db(monkeypatch):
+    """A FakeFirestore served by firebase_client.get_db for the test's duration"""
+    fake = FakeFirestore()
+    monkeypatch.setattr(firebase_client, '_db', fake)
+    return fake
+
+class FakeConnection:
+    """Socket stand-in that feeds a raw request to a handler and collects the response"""
+
+    def __init__(self, request):
+        self.request = request
+        self.response = b''
+
+    def makefile(self, mode, *args, **kwargs):
+        return io.BytesIO(self.request)
+
+    def sendall(self, data):
+        self.response += data
+
+def _call_handler(handler_class, method, path, headers=None, body=b''):
+    lines = [f'{method} {path} HTTP/1.1', 'Host: localhost', f'Content-Length: {len(body)}']
+    lines += [f'{name}: {value}' for name, value in (headers or {}).items()]
+    connection = FakeConnection(('\r\n'.join(lines) + '\r\n\r\n').encode() + body)
+    handler_class(connection, ('127.0.0.1', 0), None)
+
+    head, _, response_body = connection.response.partition(b'\r\n\r\n')
+    status_line, *header_lines = head.decode().split('\r\n')
+    response_headers = dict(line.split(': ', 1) for line in header_lines)
+    return int(status_line.split()[1]), response_headers, response_body
+
+@pytest.fixture
+def call_handler(monkeypatch):
+    """Run one request through a JsonHandler subclass and return (status, headers, body).
+
+    Bearer tokens are accepted as-is: "Bearer u1" authenticates user u1.
+    """
+    monkeypatch.setattr(base_handler, 'verify_token', lambda token: {'user_id': token, 'email': f'{token}@example.com'})
+    return _call_handler
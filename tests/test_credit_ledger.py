@@ -0,0 +1,70 @@
+import threading
+from api.credit_ledger import CREDIT_EVENTS_COLLECTION, add_credits, reset_credits
+
+def seed_user(db, used=40, total=150):
+    db.collection('users').document('u1').set({'creditUsage': {'used': used, 'total': total}})
+
+def credit_usage(db):
+    return db.docs['users/u1']['creditUsage']
+
+def credit_events(db):
+    return db.collection('users').document('u1').collection(CREDIT_EVENTS_COLLECTION).documents()
+
+def run_concurrently(func, count):
+    results = [None] * count
+    start = threading.Barrier(count)
+
+    def worker(index):
+        start.wait()
+        results[index] = func()
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def test_concurrent_deliveries_of_one_purchase_apply_once(db):
+    seed_user(db)
+    results = run_concurrently(lambda: add_credits('u1', 350, 'Credit purchase', source_id='txn_01'), 8)
+
+    assert results.count(True) == 1
+    assert credit_usage(db) == {'used': 40, 'total': 500}
+    assert list(credit_events(db)) == ['txn_01']
+    assert credit_events(db)['txn_01']['amount'] == 350
+
+def test_concurrent_distinct_purchases_all_apply(db):
+    seed_user(db)
+    counter = iter(range(8))
+    lock = threading.Lock()
+
+    def purchase():
+        with lock:
+            source_id = f'txn_{next(counter)}'
+        return add_credits('u1', 150, 'Credit purchase', source_id=source_id)
+
+    assert run_concurrently(purchase, 8) == [True] * 8
+    assert credit_usage(db)['total'] == 150 + 8 * 150
+    assert len(credit_events(db)) == 8
+
+def test_reset_is_applied_once_per_source(db):
+    seed_user(db)
+    assert reset_credits('u1', 500, 'Credit reset on renewal', source_id='reset_evt_1',
+                         extra_updates={'subscription.status': 'active'})
+    db.collection('users').document('u1').update({'creditUsage.used': 12})
+
+    # A redelivery of the renewal must not wipe the usage recorded since
+    assert not reset_credits('u1', 500, 'Credit reset on renewal', source_id='reset_evt_1')
+    assert credit_usage(db) == {'used': 12, 'total': 500}
+    assert db.docs['users/u1']['subscription'] == {'status': 'active'}
+
+def test_staged_change_is_left_to_the_callers_batch(db):
+    seed_user(db)
+    batch = db.batch()
+    assert add_credits('u1', 150, 'Credit purchase', source_id='txn_02', batch=batch)
+    assert credit_usage(db)['total'] == 150
+
+    batch.commit()
+    assert credit_usage(db)['total'] == 300
+    assert db.rpcs['commit'] == 2  # the seed write and the caller's batch
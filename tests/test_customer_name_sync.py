@@ -0,0 +1,61 @@
+import time
+import pytest
+from api import customer_name_sync
+from api.customer_name_sync import NAME_SYNC_COMMIT_EVERY, PENDING_COLLECTION, SYNCED_NAME_FIELD, sync_pending_names
+
+CUSTOMERS = 25
+
+class Timeout(Exception):
+    """Stands in for the function being killed mid-run"""
+
+@pytest.fixture
+def pending(db):
+    for index in range(CUSTOMERS):
+        db.collection('users').document(f'u{index}').set({'name': f'User {index}', 'paddleCustomerId': f'ctm_{index}'})
+        db.collection(PENDING_COLLECTION).document(f'ctm_{index}').set({'uid': f'u{index}', 'requested_at': time.time() + index})
+    db.rpcs.clear()
+    return db
+
+@pytest.fixture
+def patched(monkeypatch):
+    """Record Paddle PATCHes; raise Timeout on the call numbered in fail_at"""
+    calls = []
+    fail_at = []
+
+    def update_customer_name(customer_id, name):
+        if len(calls) + 1 in fail_at:
+            raise Timeout()
+        calls.append(customer_id)
+        return True
+
+    monkeypatch.setattr(customer_name_sync, 'update_customer_name', update_customer_name)
+    return calls, fail_at
+
+def test_results_are_committed_in_chunks(pending, patched):
+    calls, _ = patched
+    stats = sync_pending_names(limit=CUSTOMERS)
+
+    assert stats == {'synced': CUSTOMERS, 'skipped': 0, 'failed': 0}
+    assert pending.rpcs['commit'] == -(-CUSTOMERS // NAME_SYNC_COMMIT_EVERY)
+    assert pending.collection(PENDING_COLLECTION).documents() == {}
+    assert pending.docs['users/u0'][SYNCED_NAME_FIELD] == 'User 0'
+
+def test_interrupted_run_only_resends_its_last_chunk(pending, patched):
+    calls, fail_at = patched
+    fail_at.append(NAME_SYNC_COMMIT_EVERY + 5)
+    with pytest.raises(Timeout):
+        sync_pending_names(limit=CUSTOMERS)
+    assert len(pending.collection(PENDING_COLLECTION).documents()) == CUSTOMERS - NAME_SYNC_COMMIT_EVERY
+
+    calls.clear()
+    fail_at.clear()
+    sync_pending_names(limit=CUSTOMERS)
+    assert len(calls) == CUSTOMERS - NAME_SYNC_COMMIT_EVERY
+
+def test_no_customer_is_started_after_the_deadline(pending, patched):
+    calls, _ = patched
+    stats = sync_pending_names(limit=CUSTOMERS, deadline=time.monotonic() - 1)
+
+    assert stats == {'synced': 0, 'skipped': 0, 'failed': 0}
+    assert calls == []
+    assert pending.rpcs['commit'] == 0
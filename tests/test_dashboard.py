@@ -0,0 +1,74 @@
+import json
+import pytest
+from api import dashboard
+
+AUTH = {'Authorization': 'Bearer u1'}
+
+@pytest.fixture
+def paddle_calls(monkeypatch):
+    """Count Paddle fallback lookups; the customer has no subscriptions in Paddle"""
+    calls = []
+
+    def get_customer_by_email(email):
+        calls.append(email)
+        return {'id': 'ctm_01', 'email': email}
+
+    monkeypatch.setattr(dashboard, 'get_customer_by_email', get_customer_by_email)
+    monkeypatch.setattr(dashboard, 'get_subscriptions', lambda customer_id: [])
+    # One revalidation window for the whole test
+    monkeypatch.setattr(dashboard, 'DASHBOARD_PADDLE_REVALIDATE', 10 ** 9)
+    return calls
+
+def seed_user(db, active=True):
+    db.collection('users').document('u1').set({
+        'subscription': {'id': 'sub_01', 'active': active, 'status': 'active' if active else 'canceled'},
+        'licenseKey': 'LIC-1',
+        'paddleCustomerId': 'ctm_01',
+        'creditUsage': {'used': 10, 'total': 150}
+    })
+
+def test_revalidation_is_answered_from_the_user_document(db, call_handler, paddle_calls):
+    seed_user(db)
+    status, headers, body = call_handler(dashboard.handler, 'GET', '/api/dashboard', AUTH)
+    assert status == 200
+    assert json.loads(body)['creditUsage'] == {'used': 10, 'total': 150}
+    assert headers['Cache-Control'] == 'private, no-cache'
+
+    db.rpcs.clear()
+    status, revalidated, body = call_handler(dashboard.handler, 'GET', '/api/dashboard',
+                                             {**AUTH, 'If-None-Match': headers['ETag']})
+    assert (status, body) == (304, b'')
+    assert revalidated['ETag'] == headers['ETag']
+    assert db.rpcs == {'get': 1}
+
+def test_user_document_change_invalidates_the_etag(db, call_handler, paddle_calls):
+    seed_user(db)
+    _, headers, _ = call_handler(dashboard.handler, 'GET', '/api/dashboard', AUTH)
+
+    db.collection('users').document('u1').update({'creditUsage.total': 500})
+    status, updated, body = call_handler(dashboard.handler, 'GET', '/api/dashboard',
+                                         {**AUTH, 'If-None-Match': headers['ETag']})
+    assert status == 200
+    assert json.loads(body)['creditUsage']['total'] == 500
+    assert updated['ETag'] != headers['ETag']
+
+def test_revalidation_skips_the_paddle_fallback(db, call_handler, paddle_calls):
+    seed_user(db, active=False)
+    status, headers, _ = call_handler(dashboard.handler, 'GET', '/api/dashboard', AUTH)
+    assert status == 200
+    assert paddle_calls == ['u1@example.com']
+
+    status, _, _ = call_handler(dashboard.handler, 'GET', '/api/dashboard',
+                                {**AUTH, 'If-None-Match': headers['ETag']})
+    assert status == 304
+    assert paddle_calls == ['u1@example.com']
+
+def test_paddle_backed_etag_expires(db):
+    seed_user(db, active=False)
+    user_doc = db.collection('users').document('u1').get()
+    window = dashboard.DASHBOARD_PADDLE_REVALIDATE
+
+    assert dashboard.dashboard_etag('u1', user_doc, now=window * 10) == \
+        dashboard.dashboard_etag('u1', user_doc, now=window * 10 + window - 1)
+    assert dashboard.dashboard_etag('u1', user_doc, now=window * 10) != \
+        dashboard.dashboard_etag('u1', user_doc, now=window * 11)
@@ -0,0 +1,65 @@
+import sys
+import pytest
+from api import dashboard_cache
+from api.dashboard_cache import RedisBackend, MemoryBackend
+
+class FakeRedis:
+    """Stands in for redis.Redis: bytes values and per-key expiry"""
+
+    def __init__(self):
+        self.values = {}
+        self.expiry = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value.encode() if isinstance(value, str) else value
+        self.expiry[key] = ex
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+@pytest.fixture(autouse=True)
+def fresh_backend(monkeypatch):
+    monkeypatch.setattr(dashboard_cache, '_backend', None)
+    monkeypatch.setattr(dashboard_cache, 'DASHBOARD_CACHE_TTL', None)
+    monkeypatch.setattr(dashboard_cache, 'REDIS_URL', None)
+
+def test_redis_backend_caches_and_webhook_invalidation_clears():
+    client = FakeRedis()
+    dashboard_cache.set_backend(RedisBackend(client))
+
+    dashboard_cache.cache_dashboard('u1', '{"creditUsage": {"total": 150}}', '"v1"')
+    assert client.expiry['dashboard:u1'] == dashboard_cache.REDIS_CACHE_TTL
+    assert dashboard_cache.get_cached_dashboard('u1') == ('"v1"', '{"creditUsage": {"total": 150}}')
+
+    # The webhook function shares the Redis backend, so its invalidation is seen here
+    dashboard_cache.invalidate_dashboard('u1')
+    assert dashboard_cache.get_cached_dashboard('u1') is None
+
+def test_memory_backend_is_off_by_default():
+    dashboard_cache.set_backend(MemoryBackend())
+    assert dashboard_cache.cache_ttl() == 0
+    dashboard_cache.cache_dashboard('u1', '{}', '"v1"')
+    assert dashboard_cache.get_cached_dashboard('u1') is None
+
+def test_missing_redis_package_falls_back_to_uncached_memory(monkeypatch):
+    monkeypatch.setattr(dashboard_cache, 'REDIS_URL', 'redis://localhost:6379/0')
+    monkeypatch.setitem(sys.modules, 'redis', None)  # import redis raises ImportError
+
+    assert isinstance(dashboard_cache.get_backend(), MemoryBackend)
+    dashboard_cache.cache_dashboard('u1', '{}', '"v1"')
+    assert dashboard_cache.get_cached_dashboard('u1') is None
+
+def test_explicit_ttl_opts_in_to_memory_cache(monkeypatch):
+    monkeypatch.setattr(dashboard_cache, 'DASHBOARD_CACHE_TTL', 30)
+    dashboard_cache.set_backend(MemoryBackend())
+    dashboard_cache.cache_dashboard('u1', '{}', '"v1"')
+    assert dashboard_cache.get_cached_dashboard('u1') == ('"v1"', '{}')
+
+def test_entry_without_an_etag_is_a_miss():
+    client = FakeRedis()
+    dashboard_cache.set_backend(RedisBackend(client))
+    client.set('dashboard:u1', '{"creditUsage": {"total": 150}}')
+    assert dashboard_cache.get_cached_dashboard('u1') is None
@@ -0,0 +1,63 @@
+import datetime
+import pytest
+from api import license_store
+from api.device_registry import DEVICE_HEARTBEAT_INTERVAL, DEVICE_SEEN_FIELD, record_heartbeats, stale_devices
+
+KEY_A = '3F2504E0-4F89-11D3-9A0C-0305E82C3301'
+KEY_B = '9C5B94B1-35AD-49BB-B118-8E8FC24ABF80'
+NOW = 1_750_000_000
+
+def seen(seconds_ago):
+    return datetime.datetime.fromtimestamp(NOW - seconds_ago, datetime.timezone.utc)
+
+@pytest.fixture(autouse=True)
+def empty_license_cache(monkeypatch):
+    monkeypatch.setattr(license_store, '_entries', type(license_store._entries)())
+
+def seed_license(db, key, devices):
+    db.collection('licenses').document(key).set({'uid': 'u1', 'status': 'active', 'tier': 'Pro', 'devices': devices})
+
+def test_stale_devices_uses_the_license_documents_last_seen():
+    licenses = {KEY_A: {DEVICE_SEEN_FIELD: {'recent': seen(60), 'old': seen(DEVICE_HEARTBEAT_INTERVAL)}}}
+    pairs = [(KEY_A, 'recent'), (KEY_A, 'old'), (KEY_A, 'never'), (KEY_A, 'old'), (KEY_B, 'unknown')]
+
+    assert stale_devices(pairs, licenses, now=NOW) == [(KEY_A, 'old'), (KEY_A, 'never'), (KEY_B, 'unknown')]
+
+def test_due_heartbeats_share_one_commit(db):
+    pairs = [(KEY_A, 'mac-1'), (KEY_A, 'mac-2'), (KEY_B, 'mac-3')]
+
+    written = record_heartbeats(pairs, {}, now=NOW)
+
+    assert db.rpcs['commit'] == 1
+    assert set(written) == {KEY_A, KEY_B}
+    assert set(db.docs[f'licenses/{KEY_A}'][DEVICE_SEEN_FIELD]) == {'mac-1', 'mac-2'}
+    assert 'last_seen' in db.docs[f'licenses/{KEY_A}/devices/mac-1']
+
+def test_recent_heartbeats_are_not_rewritten(db):
+    licenses = {KEY_A: {DEVICE_SEEN_FIELD: {'mac-1': seen(60)}}}
+
+    assert record_heartbeats([(KEY_A, 'mac-1')] * 50, licenses, now=NOW) == {}
+    assert db.rpcs['commit'] == 0
+
+def test_validations_across_instances_write_one_heartbeat_per_interval(db, monkeypatch):
+    seed_license(db, KEY_A, ['mac-1', 'mac-2'])
+    db.rpcs.clear()
+
+    for _ in range(20):
+        # Every validation lands on a cold instance, which reads the license afresh
+        monkeypatch.setattr(license_store, '_entries', type(license_store._entries)())
+        results = license_store.validate_batch([(KEY_A, 'mac-1'), (KEY_A, 'mac-2')])
+        assert [result['valid'] for result in results] == [True, True]
+
+    assert db.rpcs['get_all'] == 20
+    assert db.rpcs['commit'] == 1
+
+def test_warm_instance_keeps_heartbeats_in_its_cache(db):
+    seed_license(db, KEY_A, ['mac-1'])
+    db.rpcs.clear()
+
+    for _ in range(20):
+        assert license_store.validate_license(KEY_A, 'mac-1')['valid']
+
+    assert db.rpcs == {'get': 1, 'commit': 1}
+    assert 'mac-1' in license_store.get_license(KEY_A)[DEVICE_SEEN_FIELD]
@@ -0,0 +1,49 @@
+import json
+import pytest
+from api import license
+
+KEY = '3F2504E0-4F89-11D3-9A0C-0305E82C3301'
+
+@pytest.fixture
+def validated(monkeypatch):
+    """Stub the store: every well-formed pair is valid; record what reaches it"""
+    calls = []
+
+    def validate_batch(pairs):
+        calls.append(list(pairs))
+        return [{'valid': True, 'message': 'License validated successfully'} for _ in pairs]
+
+    monkeypatch.setattr(license, 'validate_batch', validate_batch)
+    return calls
+
+def post_batch(call_handler, items):
+    body = json.dumps({'licenses': items}).encode()
+    status, _, response = call_handler(license.handler, 'POST', '/api/license?action=validate_batch',
+                                       {'Content-Type': 'application/json'}, body)
+    return status, json.loads(response)
+
+def test_malformed_items_fail_alone(call_handler, validated):
+    status, body = post_batch(call_handler, [
+        {'license_key': KEY, 'device_id': 'mac-1'},
+        {'license_key': 'not-a-key', 'device_id': 'mac-2'},
+        'garbage',
+        {'license_key': KEY, 'device_id': ['mac-3']},
+        {'license_key': KEY, 'device_id': 'mac-4'},
+    ])
+
+    assert status == 200
+    assert validated == [[(KEY, 'mac-1'), (KEY, 'mac-4')]]
+    assert [result['valid'] for result in body['results']] == [True, False, False, False, True]
+    assert body['results'][1] == {'license_key': 'not-a-key', 'device_id': 'mac-2', 'valid': False,
+                                  'message': 'Invalid license key or device ID'}
+    assert body['results'][4]['device_id'] == 'mac-4'
+
+def test_batch_of_only_malformed_items_skips_the_store(call_handler, validated):
+    status, body = post_batch(call_handler, [{'license_key': KEY}])
+    assert status == 200
+    assert validated == []
+    assert body['results'][0]['valid'] is False
+
+def test_empty_batch_is_rejected(call_handler, validated):
+    status, _ = post_batch(call_handler, [])
+    assert status == 400
@@ -0,0 +1,94 @@
+import json
+import datetime
+import threading
+from api.paddle_replay import Checkpoint, ndjson_event_pages, replay
+from api.webhook_ledger import LEDGER_RETENTION_DAYS
+
+def occurred(days_ago):
+    moment = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=days_ago)
+    return moment.isoformat().replace('+00:00', 'Z')
+
+def event(event_id, customer_id='ctm_01', event_type='transaction.completed', days_ago=1):
+    return {'event_id': event_id, 'event_type': event_type, 'occurred_at': occurred(days_ago),
+            'data': {'customer_id': customer_id}}
+
+class Recorder:
+    """Injected apply: records events; ids in `failing` fail, ids in `done` are duplicates"""
+
+    def __init__(self, failing=(), done=()):
+        self.applied = []
+        self.failing = set(failing)
+        self.done = set(done)
+        self._lock = threading.Lock()
+
+    def __call__(self, webhook_data):
+        with self._lock:
+            self.applied.append(webhook_data['event_id'])
+        event_id = webhook_data['event_id']
+        if event_id in self.failing:
+            raise RuntimeError('handler failed')
+        return {'success': True, 'duplicate': event_id in self.done}
+
+def write_ndjson(path, events):
+    path.write_text(''.join(json.dumps(item) + '\n' for item in events))
+
+def test_replay_counts_outcomes_and_keeps_customer_order(tmp_path):
+    events = [event('evt_1'), event('evt_2', 'ctm_02'), event('evt_3'), event('evt_4', 'ctm_02'), event('evt_5')]
+    apply = Recorder(failing={'evt_4'}, done={'evt_2'})
+    checkpoint = Checkpoint(None, 'test')
+
+    stats = replay([(events, 5)], checkpoint, concurrency=4, apply=apply, failed_path=tmp_path / 'failed.ndjson')
+
+    assert stats == {'replayed': 3, 'duplicates': 1, 'failed': 1, 'filtered': 0, 'too_old': 0}
+    assert [event_id for event_id in apply.applied if event_id in ('evt_1', 'evt_3', 'evt_5')] == ['evt_1', 'evt_3', 'evt_5']
+    assert [json.loads(line)['event_id'] for line in (tmp_path / 'failed.ndjson').read_text().splitlines()] == ['evt_4']
+    assert checkpoint.cursor == 5
+
+def test_events_older_than_the_ledger_retention_are_skipped():
+    events = [event('evt_old', days_ago=LEDGER_RETENTION_DAYS), event('evt_new'), {'event_id': 'evt_undated', 'data': {}}]
+    apply = Recorder()
+
+    stats = replay([(events, 3)], Checkpoint(None, 'test'), apply=apply)
+
+    assert apply.applied == ['evt_new']
+    assert stats['too_old'] == 2
+
+def test_event_type_filter():
+    events = [event('evt_1'), event('evt_2', event_type='subscription.updated')]
+    apply = Recorder()
+
+    stats = replay([(events, 2)], Checkpoint(None, 'test'), event_types=['subscription.updated'], apply=apply)
+
+    assert apply.applied == ['evt_2']
+    assert stats['filtered'] == 1
+
+def test_ndjson_replay_resumes_from_its_checkpoint(tmp_path):
+    source = tmp_path / 'events.ndjson'
+    write_ndjson(source, [event(f'evt_{index}', f'ctm_{index}') for index in range(1, 6)])
+    checkpoint_path = str(tmp_path / 'checkpoint.json')
+
+    # The first run stops after two pages, as if interrupted
+    pages = ndjson_event_pages(str(source), page_size=2)
+    first = Recorder()
+    replay([next(pages), next(pages)], Checkpoint(checkpoint_path, str(source)), apply=first)
+    assert sorted(first.applied) == ['evt_1', 'evt_2', 'evt_3', 'evt_4']
+
+    checkpoint = Checkpoint(checkpoint_path, str(source))
+    assert checkpoint.cursor == 4
+    assert checkpoint.stats['replayed'] == 4
+
+    second = Recorder()
+    stats = replay(ndjson_event_pages(str(source), start=checkpoint.cursor, page_size=2), checkpoint, apply=second)
+    assert second.applied == ['evt_5']
+    assert stats['replayed'] == 5
+    assert checkpoint.cursor == 5
+
+def test_dry_run_applies_nothing(capsys):
+    apply = Recorder()
+    checkpoint = Checkpoint(None, 'test')
+
+    replay([([event('evt_1')], 1)], checkpoint, apply=apply, dry_run=True)
+
+    assert apply.applied == []
+    assert json.loads(capsys.readouterr().out) == {'event_id': 'evt_1', 'event_type': 'transaction.completed'}
+    assert checkpoint.cursor == 1
@@ -0,0 +1,53 @@
+import pathlib
+import pytest
+from api.paddle_signature import verify_paddle_signature
+
+# Raw webhook body and Paddle-Signature values recorded for it, signed at
+# SIGNED_AT with the two notification secrets below. The body must be read
+# as bytes: any change to it, even whitespace, invalidates the signatures.
+BODY = (pathlib.Path(__file__).parent / 'fixtures' / 'subscription_created.json').read_bytes()
+SIGNED_AT = 1712917130
+CURRENT_SECRET = 'pdl_ntfset_01hv8x_current'
+PREVIOUS_SECRET = 'pdl_ntfset_01hv8x_previous'
+CURRENT_H1 = '2f5f1c7a41a9032a8ac7887b2409e6ecf21381321ed3c9947c7a8dbaf8d226db'
+PREVIOUS_H1 = '757e6cb460420f2662aef41dd3cfb00c605363603f47e392c4eceb75624bd9df'
+
+def header(*signatures, ts=SIGNED_AT):
+    return ';'.join([f'ts={ts}'] + [f'h1={signature}' for signature in signatures])
+
+def test_valid_signature():
+    assert verify_paddle_signature(header(CURRENT_H1), BODY, [CURRENT_SECRET], now=SIGNED_AT + 5)
+
+def test_rotated_secret_still_accepted_while_configured():
+    # During rotation both secrets are configured; Paddle may still sign with the old one
+    secrets = [CURRENT_SECRET, PREVIOUS_SECRET]
+    assert verify_paddle_signature(header(PREVIOUS_H1), BODY, secrets, now=SIGNED_AT)
+    assert not verify_paddle_signature(header(PREVIOUS_H1), BODY, [CURRENT_SECRET], now=SIGNED_AT)
+
+def test_tampered_body_rejected():
+    tampered = BODY.replace(b'"quantity":1', b'"quantity":9')
+    assert tampered != BODY
+    assert not verify_paddle_signature(header(CURRENT_H1), tampered, [CURRENT_SECRET], now=SIGNED_AT)
+
+@pytest.mark.parametrize('age', [301, -301, 86400])
+def test_stale_timestamp_rejected(age):
+    assert not verify_paddle_signature(header(CURRENT_H1), BODY, [CURRENT_SECRET], now=SIGNED_AT + age)
+
+def test_multiple_h1_values_any_match():
+    assert verify_paddle_signature(header('0' * 64, CURRENT_H1), BODY, [CURRENT_SECRET], now=SIGNED_AT)
+    assert verify_paddle_signature(header(PREVIOUS_H1, CURRENT_H1), BODY, [CURRENT_SECRET], now=SIGNED_AT)
+    assert not verify_paddle_signature(header('0' * 64, 'f' * 64), BODY, [CURRENT_SECRET], now=SIGNED_AT)
+
+@pytest.mark.parametrize('signature_header', [None, '', 'h1=abc', f'ts=abc;h1={CURRENT_H1}', f'ts={SIGNED_AT}'])
+def test_malformed_header_rejected(signature_header):
+    assert not verify_paddle_signature(signature_header, BODY, [CURRENT_SECRET], now=SIGNED_AT)
+
+def test_no_secrets_configured_rejects():
+    assert not verify_paddle_signature(header(CURRENT_H1), BODY, [], now=SIGNED_AT)
+
+@pytest.mark.parametrize('signature', ['é' * 64, CURRENT_H1.upper(), CURRENT_H1[:-1] + 'ü', CURRENT_H1[:32], 'zz' * 32])
+def test_malformed_h1_is_rejected_without_error(signature):
+    assert not verify_paddle_signature(header(signature), BODY, [CURRENT_SECRET], now=SIGNED_AT)
+
+def test_malformed_h1_does_not_hide_a_valid_one():
+    assert verify_paddle_signature(header('é' * 64, CURRENT_H1), BODY, [CURRENT_SECRET], now=SIGNED_AT)
@@ -0,0 +1,135 @@
+from collections import OrderedDict
+import pytest
+from api import paddle_webhook, webhook_ledger
+from api.paddle_webhook import process_event
+from api.webhook_ledger import LEDGER_COLLECTION
+
+def transaction_event(event_id, event_type, status, customer_id='ctm_01', price_id='pri_01subscription'):
+    return {
+        'event_id': event_id,
+        'event_type': event_type,
+        'occurred_at': '2026-10-01T10:00:00Z',
+        'data': {
+            'id': 'txn_01',
+            'status': status,
+            'customer_id': customer_id,
+            'subscription_id': 'sub_01',
+            'currency_code': 'USD',
+            'billed_at': '2026-10-01T10:00:00Z',
+            'items': [{'price': {'id': price_id, 'unit_price': {'amount': '1000'}}, 'quantity': 1}],
+            'details': {'totals': {'grand_total': '1000'}}
+        }
+    }
+
+@pytest.fixture(autouse=True)
+def fresh_ledger_memory(monkeypatch):
+    monkeypatch.setattr(webhook_ledger, '_seen', OrderedDict())
+
+@pytest.fixture
+def users(db, monkeypatch):
+    """Customers known to find_user; starts with ctm_01 -> u1"""
+    known = {'ctm_01': 'u1'}
+    db.collection('users').document('u1').set({'email': 'u1@example.com', 'creditUsage': {'used': 0, 'total': 0}})
+
+    def find_user(customer_id):
+        user_id = known.get(customer_id)
+        return (user_id, db.collection('users').document(user_id).get()) if user_id else (None, None)
+
+    monkeypatch.setattr(paddle_webhook, 'find_user', find_user)
+    return known
+
+def ledger(db):
+    return db.collection(LEDGER_COLLECTION).documents()
+
+def test_status_change_is_mirrored(db, users):
+    result = process_event(transaction_event('evt_1', 'transaction.past_due', 'past_due'))
+
+    assert result['success']
+    assert 'evt_1' in ledger(db)
+
+def test_status_change_for_unknown_customer_stays_retryable(db, users):
+    result = process_event(transaction_event('evt_1', 'transaction.payment_failed', 'billed', customer_id='ctm_unknown'))
+
+    assert not result['success']
+    assert 'evt_1' not in ledger(db)
+    assert len(db.collection('paddle_webhook_debug').documents()) == 1
+
+    # Once the customer is mapped, the retried delivery applies
+    users['ctm_unknown'] = 'u1'
+    assert process_event(transaction_event('evt_1', 'transaction.payment_failed', 'billed', customer_id='ctm_unknown'))['success']
+    assert 'evt_1' in ledger(db)
+
+def test_status_change_without_a_customer_is_skipped(db, users):
+    result = process_event(transaction_event('evt_1', 'transaction.created', 'draft', customer_id=None))
+
+    assert result['success']
+    assert 'evt_1' in ledger(db)
+
+CREDITS_150 = 'pri_01jvqffjrvv1hq7tj5vf2ajh72'
+
+def mirrored(db):
+    return db.collection('users').document('u1').collection('paddle_transactions').documents()
+
+def credit_total(db):
+    return db.docs['users/u1']['creditUsage']['total']
+
+def apply(db, webhook_data):
+    """Process one delivery and return the Firestore RPCs it cost"""
+    db.rpcs.clear()
+    assert process_event(webhook_data)['success']
+    return dict(db.rpcs)
+
+def test_credit_purchase_lifecycle_commits_once_per_event(db, users):
+    # 1 ledger read and 1 user read (find_user) per event, then a single commit
+    assert apply(db, transaction_event('evt_1', 'transaction.created', 'draft', price_id=CREDITS_150)) == \
+        {'get': 2, 'commit': 1}
+    assert mirrored(db) == {}
+
+    assert apply(db, transaction_event('evt_2', 'transaction.updated', 'billed', price_id=CREDITS_150)) == \
+        {'get': 2, 'commit': 1}
+    assert mirrored(db)['txn_01']['status'] == 'billed'
+    assert credit_total(db) == 0
+
+    assert apply(db, transaction_event('evt_3', 'transaction.completed', 'completed', price_id=CREDITS_150)) == \
+        {'get': 2, 'commit': 1}
+    assert mirrored(db)['txn_01']['status'] == 'completed'
+    assert credit_total(db) == 150
+    assert set(ledger(db)) == {'evt_1', 'evt_2', 'evt_3'}
+
+def test_update_after_completion_keeps_mirror_writes(db, users):
+    apply(db, transaction_event('evt_1', 'transaction.completed', 'completed', price_id=CREDITS_150))
+
+    # The credit source txn_01 already exists: the first commit is rejected and
+    # the event is committed again without its credit writes
+    later = transaction_event('evt_2', 'transaction.updated', 'completed', price_id=CREDITS_150)
+    later['data']['invoice_number'] = 'INV-0042'
+    assert apply(db, later) == {'get': 2, 'commit': 2}
+
+    assert credit_total(db) == 150
+    assert mirrored(db)['txn_01']['invoiceNumber'] == 'INV-0042'
+    assert set(ledger(db)) == {'evt_1', 'evt_2'}
+    assert list(db.collection('users').document('u1').collection('credit_events').documents()) == ['txn_01']
+
+def test_redelivery_is_skipped(db, users):
+    event = transaction_event('evt_1', 'transaction.completed', 'completed', price_id=CREDITS_150)
+    apply(db, event)
+
+    # Warm instance: answered from memory with no Firestore RPCs
+    assert apply(db, event) == {}
+
+    # Cold instance: one ledger read
+    webhook_ledger._seen.clear()
+    assert apply(db, event) == {'get': 1}
+    assert credit_total(db) == 150
+
+def test_concurrent_delivery_applies_nothing_twice(db, users, monkeypatch):
+    event = transaction_event('evt_1', 'transaction.completed', 'completed', price_id=CREDITS_150)
+    apply(db, event)
+
+    # Both deliveries passed the ledger check before either committed
+    webhook_ledger._seen.clear()
+    monkeypatch.setattr(paddle_webhook, 'is_event_processed', lambda event_id: False)
+    assert process_event(event)['success']
+
+    assert credit_total(db) == 150
+    assert set(ledger(db)) == {'evt_1'}
@@ -0,0 +1,65 @@
+import json
+import pytest
+from api import webhook_worker
+from api.webhook_queue import InMemoryQueue, QUEUE_MAX_ATTEMPTS
+
+def event(event_id, event_type='transaction.completed'):
+    return json.dumps({'event_id': event_id, 'event_type': event_type, 'data': {}})
+
+@pytest.fixture
+def queue():
+    return InMemoryQueue()
+
+@pytest.fixture
+def applied(monkeypatch):
+    """Record events handed to process_event; events of type 'fail' report failure"""
+    seen = []
+
+    def process_event(webhook_data):
+        seen.append(webhook_data['event_id'])
+        return {'success': webhook_data['event_type'] != 'fail', 'event_processed': webhook_data['event_type']}
+
+    monkeypatch.setattr(webhook_worker, 'process_event', process_event)
+    return seen
+
+def test_drain_processes_and_completes_items(queue, applied):
+    for event_id in ('evt_1', 'evt_2', 'evt_3'):
+        queue.enqueue(event_id, event(event_id))
+
+    stats = webhook_worker.drain_queue(queue, batch_size=2, max_batches=5)
+
+    assert stats == {'processed': 3, 'failed': 0}
+    assert applied == ['evt_1', 'evt_2', 'evt_3']
+    assert queue.items == {}
+
+def test_handler_failure_is_retried_later(queue, applied):
+    queue.enqueue('evt_1', event('evt_1', 'fail'))
+
+    stats = webhook_worker.drain_queue(queue, batch_size=5, max_batches=5)
+
+    # Backed off, so the same run does not claim it again
+    assert stats == {'processed': 0, 'failed': 1}
+    assert queue.items['evt_1']['attempts'] == 1
+    assert queue.items['evt_1']['last_error'] == 'Handler failed for fail'
+    assert queue.dead_letters == {}
+
+def test_handler_failure_dead_letters_after_max_attempts(queue, applied):
+    queue.enqueue('evt_1', event('evt_1', 'fail'))
+    queue.items['evt_1']['attempts'] = QUEUE_MAX_ATTEMPTS - 1
+
+    webhook_worker.drain_queue(queue, batch_size=5, max_batches=1)
+
+    assert 'evt_1' not in queue.items
+    assert queue.dead_letters['evt_1']['attempts'] == QUEUE_MAX_ATTEMPTS
+
+@pytest.mark.parametrize('payload', ['{"event_id": "evt_1"', '["evt_1"]', None])
+def test_unusable_payload_is_dead_lettered_on_first_attempt(queue, applied, payload):
+    queue.enqueue('evt_1', payload)
+    queue.enqueue('evt_2', event('evt_2'))
+
+    stats = webhook_worker.drain_queue(queue, batch_size=5, max_batches=1)
+
+    assert stats == {'processed': 1, 'failed': 1}
+    assert applied == ['evt_2']
+    assert queue.dead_letters['evt_1']['attempts'] == 1
+    assert queue.dead_letters['evt_1']['last_error'].startswith('Invalid queued payload')